@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+服务层基准测试：导入、单日查询、换班和换班日志。
+
+对每一种数据规模 (排班天数)，生成一份合成的排班Excel，在独立的数据库中依次测量：
+- import_schedule / import_schedule_streaming: 全量导入 (pandas 解析 / openpyxl 流式解析)
+- get_duty_employee_cold: 缓存清空后的单日查询 (需要访问数据库)
+- get_duty_employee_warm: 命中进程内缓存的单日查询
+- swap_duty_schedule: 按员工姓名换班 (每次换班后立即换回，保持数据不变)
+- get_swap_logs_text / get_swap_logs_structured: 读取换班日志的第一页
+
+默认使用临时目录中的SQLite文件数据库。指定 --mysql-url (或环境变量 BENCH_MYSQL_URL) 时，
+还会在该MySQL数据库上重复一遍 (库中已有的排班数据和换班日志会被清空，请使用专门的测试库)；
+连接失败时跳过MySQL并给出提示。
+
+结果以JSON输出 (--output)，指定 --baseline 时与之前的结果比较，
+p50 耗时变慢超过 --tolerance 时以非零状态码退出，便于在部署前发现性能退化。
+
+使用方法：
+python benchmarks/bench_services.py
+python benchmarks/bench_services.py --sizes 1,1000,100000 --output bench.json
+python benchmarks/bench_services.py --output new.json --baseline bench.json --tolerance 0.2
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import sqlalchemy
+from openpyxl import Workbook
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src import schemas, services
+from src.database import Base
+
+DEFAULT_SIZES = "1,100,1000,10000,100000"
+# 合成排班使用的员工人数，取质数使相邻几天的人员组合不断变化
+EMPLOYEE_POOL_SIZE = 41
+FIRST_DAY = date(2020, 1, 1)
+DATE_HEADER = '日期            平常：9:00-17:30\n周末：9:00-17:30'
+ROLE_HEADERS = ['全专业值班', 'CS专业投诉值班', 'CS专业故障值班', 'PS专业值班']
+# 与基准比较时忽略小于该值(毫秒)的差异，避免微秒级操作的抖动被判定为退化
+NOISE_FLOOR_MS = 0.05
+
+
+def employees_on(index: int) -> list:
+    """第 index 天的四位值班人员，同一天内互不相同。"""
+    return [f"员工{(4 * index + k) % EMPLOYEE_POOL_SIZE:02d}" for k in range(4)]
+
+
+def write_roster(path: str, days: int) -> None:
+    """生成一份包含 days 天的排班Excel。"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append([DATE_HEADER] + ROLE_HEADERS)
+    for index in range(days):
+        sheet.append([FIRST_DAY + timedelta(days=index)] + employees_on(index))
+    workbook.save(path)
+
+
+def swap_pairs(days: int, count: int, rng: random.Random) -> list:
+    """
+    挑选 count 组可以换班的 (日期1, 员工1, 日期2, 员工2)：两天的全专业值班人员互换，
+    且两天的人员没有重叠，保证换班后每人在当天仍只有一个角色。
+    """
+    if days < 2:
+        return []
+    pairs = []
+    while len(pairs) < count:
+        first, second = rng.sample(range(days), 2)
+        if set(employees_on(first)) & set(employees_on(second)):
+            continue
+        pairs.append((
+            (FIRST_DAY + timedelta(days=first)).isoformat(), employees_on(first)[0],
+            (FIRST_DAY + timedelta(days=second)).isoformat(), employees_on(second)[0],
+        ))
+    return pairs
+
+
+def swap_request(date1: str, employee1: str, date2: str, employee2: str):
+    return schemas.SwapDutyScheduleByEmployeeRequest(
+        swap_info_1=schemas.SwapByEmployeeInfo(duty_date=date1, employee_name=employee1),
+        swap_info_2=schemas.SwapByEmployeeInfo(duty_date=date2, employee_name=employee2),
+    )
+
+
+def summarize(backend: str, days: int, name: str, samples: list) -> dict:
+    """把一组耗时样本(秒)汇总为一条结果，单位毫秒。"""
+    millis = sorted(sample * 1000 for sample in samples)
+    return {
+        "backend": backend,
+        "days": days,
+        "benchmark": name,
+        "runs": len(millis),
+        "mean_ms": round(statistics.fmean(millis), 4),
+        "p50_ms": round(millis[len(millis) // 2], 4),
+        "p95_ms": round(millis[min(len(millis) - 1, int(len(millis) * 0.95))], 4),
+        "min_ms": round(millis[0], 4),
+        "max_ms": round(millis[-1], 4),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    """执行一次 fn，返回 (耗时秒数, 返回值)。"""
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def expect(response, status: str = "success"):
+    """基准中的每次调用都应该成功，否则结果没有意义。"""
+    if response.status != status:
+        raise RuntimeError(f"服务调用失败: {response.message}")
+    return response
+
+
+def run_size(backend: str, engine, excel_path: str, days: int, args, rng: random.Random) -> list:
+    """在一个数据库上测量一种数据规模，返回结果列表。"""
+    Session = sessionmaker(bind=engine)
+    results = []
+
+    for name, streaming in (("import_schedule", False), ("import_schedule_streaming", True)):
+        samples = []
+        for _ in range(args.import_repeat):
+            with Session() as db:
+                elapsed, response = timed(services.import_schedule, db, file_path=excel_path,
+                                          streaming=streaming, force=True)
+                expect(response)
+                samples.append(elapsed)
+        results.append(summarize(backend, days, name, samples))
+
+    query_dates = [(FIRST_DAY + timedelta(days=rng.randrange(days))).isoformat() for _ in range(args.repeat)]
+    with Session() as db:
+        cache = services.get_cache(db)
+        cold = []
+        for duty_date in query_dates:
+            cache.invalidate()
+            elapsed, response = timed(services.get_duty_employee, db, duty_date)
+            expect(response)
+            cold.append(elapsed)
+        for duty_date in query_dates:
+            services.get_duty_employee(db, duty_date)
+        warm = []
+        for duty_date in query_dates:
+            elapsed, response = timed(services.get_duty_employee, db, duty_date)
+            expect(response)
+            warm.append(elapsed)
+    results.append(summarize(backend, days, "get_duty_employee_cold", cold))
+    results.append(summarize(backend, days, "get_duty_employee_warm", warm))
+
+    swaps = []
+    with Session() as db:
+        for date1, employee1, date2, employee2 in swap_pairs(days, args.swap_repeat, rng):
+            # 先换班再换回，两次都计入样本
+            for request in (swap_request(date1, employee1, date2, employee2),
+                            swap_request(date1, employee2, date2, employee1)):
+                elapsed, response = timed(services.swap_duty_schedule, db, request)
+                expect(response)
+                swaps.append(elapsed)
+    if swaps:
+        results.append(summarize(backend, days, "swap_duty_schedule", swaps))
+
+        for log_format in services.SWAP_LOG_FORMATS:
+            samples = []
+            with Session() as db:
+                for _ in range(args.repeat):
+                    elapsed, response = timed(services.get_swap_logs, db, format=log_format)
+                    expect(response)
+                    samples.append(elapsed)
+            results.append(summarize(backend, days, f"get_swap_logs_{log_format}", samples))
+    return results
+
+
+def run_backend(backend: str, make_engine, excel_paths: dict, args) -> list:
+    results = []
+    for days, excel_path in excel_paths.items():
+        engine = make_engine()
+        try:
+            Base.metadata.drop_all(bind=engine)
+            Base.metadata.create_all(bind=engine)
+            results.extend(run_size(backend, engine, excel_path, days, args, random.Random(args.seed)))
+        finally:
+            engine.dispose()
+        print(f"[{backend}] {days} 天完成", file=sys.stderr)
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> list:
+    """与基准结果比较 p50，返回退化的描述列表。"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {
+            (item["backend"], item["days"], item["benchmark"]): item
+            for item in json.load(f)["results"]
+        }
+    regressions = []
+    for item in results:
+        old = baseline.get((item["backend"], item["days"], item["benchmark"]))
+        if old is None:
+            continue
+        if item["p50_ms"] > old["p50_ms"] * (1 + tolerance) and item["p50_ms"] - old["p50_ms"] > NOISE_FLOOR_MS:
+            regressions.append(
+                f"{item['backend']} {item['days']}天 {item['benchmark']}: "
+                f"p50 {old['p50_ms']:.3f} ms -> {item['p50_ms']:.3f} ms"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="服务层基准测试")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"排班天数，逗号分隔 (默认 {DEFAULT_SIZES})")
+    parser.add_argument("--repeat", type=int, default=200, help="查询类基准的重复次数 (默认200)")
+    parser.add_argument("--swap-repeat", type=int, default=50, help="换班的组数，每组换班后再换回 (默认50)")
+    parser.add_argument("--import-repeat", type=int, default=3, help="导入的重复次数 (默认3)")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--mysql-url", default=os.getenv("BENCH_MYSQL_URL"),
+                        help="MySQL测试库的连接URL，库中已有数据会被清空")
+    parser.add_argument("--output", help="结果JSON的输出路径，省略时输出到标准输出")
+    parser.add_argument("--baseline", help="用于比较的基准结果JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的 p50 变慢比例 (默认0.2)")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    work_dir = tempfile.mkdtemp(prefix="bench_services_")
+    try:
+        excel_paths = {}
+        for days in sizes:
+            excel_paths[days] = os.path.join(work_dir, f"roster_{days}.xlsx")
+            write_roster(excel_paths[days], days)
+
+        # 预热：pandas 和 openpyxl 在第一次导入时才加载，不计入导入耗时
+        services._parse_excel(excel_paths[sizes[0]])
+
+        sqlite_path = os.path.join(work_dir, "bench.db")
+        results = run_backend("sqlite", lambda: create_engine(f"sqlite:///{sqlite_path}"), excel_paths, args)
+
+        if args.mysql_url:
+            try:
+                create_engine(args.mysql_url).connect().close()
+            except Exception as e:
+                print(f"无法连接MySQL，跳过: {e}", file=sys.stderr)
+            else:
+                results.extend(run_backend("mysql", lambda: create_engine(args.mysql_url), excel_paths, args))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "sizes": sizes,
+        },
+        "results": results,
+    }
+    payload = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    else:
+        print(payload)
+
+    for item in results:
+        print(f"{item['backend']:>6} {item['days']:>7}天 {item['benchmark']:<28} "
+              f"p50 {item['p50_ms']:10.3f} ms  p95 {item['p95_ms']:10.3f} ms", file=sys.stderr)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"性能退化: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
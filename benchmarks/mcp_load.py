@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+MCP服务器的端到端压力测试。
+
+启动 N 个并发的 ClientSession，每个会话循环地按权重随机调用工具 (闭环：上一个调用返回后才发起下一个)，
+统计每个工具的吞吐量和 p50/p95/p99 延迟。支持两种传输方式：
+- stdio: 每个会话各自启动一个 `start_mcp_server.py` 子进程，与桌面客户端的使用方式相同
+- streamable-http: 所有会话连接同一个HTTP服务 (--url)；
+  指定 --start-server 时由本脚本启动服务器 (可用 --server-workers 指定工作进程数)，结束后关闭
+
+测试前会生成一份合成排班 (与 bench_services.py 相同) 并导入。每个会话换班时只使用分配给自己的两天，
+换班后下一次再换回，各会话之间互不干扰；全量导入会把排班恢复原状，因此换班返回"未找到员工"时会改换方向重试一次。
+
+注意：多个工作进程或stdio模式下的多个服务器进程之间只通过数据库共享数据，
+MySQL不可用时每个进程使用各自的SQLite内存后备库，此时stdio模式下每个会话会先单独导入一次排班。
+
+使用方法：
+python benchmarks/mcp_load.py --transport stdio --clients 4 --duration 20
+python benchmarks/mcp_load.py --transport streamable-http --start-server --server-workers 1 --clients 32
+python benchmarks/mcp_load.py --transport streamable-http --url http://10.0.0.5:8000/mcp \\
+    --mix get_duty_employee=80,swap_duty_schedule=19,import_schedule_path=1 --output load.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+
+from bench_services import FIRST_DAY, PROJECT_ROOT, employees_on, write_roster
+
+SERVER_SCRIPT = os.path.join(PROJECT_ROOT, "start_mcp_server.py")
+DEFAULT_MIX = "get_duty_employee=90,swap_duty_schedule=9,import_schedule_path=1"
+SUPPORTED_TOOLS = ("get_duty_employee", "swap_duty_schedule", "import_schedule_path")
+# 等待 --start-server 启动的服务器开始监听的最长秒数
+SERVER_START_TIMEOUT = 30
+
+
+def parse_mix(text: str) -> dict:
+    """解析 'tool=权重,...' 形式的调用比例。"""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in SUPPORTED_TOOLS:
+            raise argparse.ArgumentTypeError(f"不支持的工具: {name}，可选: {', '.join(SUPPORTED_TOOLS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def client_swap_pairs(days: int, clients: int) -> list:
+    """为每个会话分配两天用于换班，所有会话使用的日期互不相同，且同一组的两天人员没有重叠。"""
+    pairs, used = [], set()
+    for first in range(days):
+        if len(pairs) == clients:
+            break
+        if first in used:
+            continue
+        for second in range(first + 1, days):
+            if second not in used and not set(employees_on(first)) & set(employees_on(second)):
+                used.update((first, second))
+                pairs.append((first, second))
+                break
+    if len(pairs) < clients:
+        raise SystemExit(f"排班天数 {days} 不足以给 {clients} 个会话各分配一组换班日期，请增大 --days")
+    return pairs
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """最近秩法计算百分位数。"""
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """收集每次调用的 (工具, 耗时, 是否成功)。"""
+
+    def __init__(self, show_errors: bool = False):
+        self.show_errors = show_errors
+        self.samples = {}
+        self.errors = {}
+        self.retries = 0
+
+    def add(self, tool: str, elapsed: float, ok: bool) -> None:
+        self.samples.setdefault(tool, []).append(elapsed)
+        if not ok:
+            self.errors[tool] = self.errors.get(tool, 0) + 1
+
+    def summary(self, duration: float) -> list:
+        rows = []
+        for tool, samples in sorted(self.samples.items()):
+            millis = sorted(sample * 1000 for sample in samples)
+            rows.append({
+                "tool": tool,
+                "calls": len(millis),
+                "errors": self.errors.get(tool, 0),
+                "throughput_per_s": round(len(millis) / duration, 2),
+                "mean_ms": round(sum(millis) / len(millis), 3),
+                "p50_ms": round(percentile(millis, 0.50), 3),
+                "p95_ms": round(percentile(millis, 0.95), 3),
+                "p99_ms": round(percentile(millis, 0.99), 3),
+                "max_ms": round(millis[-1], 3),
+            })
+        return rows
+
+
+def succeeded(result) -> bool:
+    """工具调用是否成功：协议层没有报错，且业务响应的 status 为 success。"""
+    if result.isError:
+        return False
+    structured = result.structuredContent or {}
+    return structured.get("status", "success") == "success"
+
+
+def direction_mismatch(result) -> bool:
+    """换班方向与当前排班不符 (排班已被全量导入恢复原状)。"""
+    return "未找到员工" in (result.structuredContent or {}).get("message", "")
+
+
+async def call(session: ClientSession, recorder: Recorder, tool: str, arguments: dict, tolerate=None):
+    """
+    调用一次工具并记录耗时。
+    tolerate(result) 为真的失败是预期之内的 (例如换班方向需要调整)，不计为错误。
+    """
+    started = time.perf_counter()
+    try:
+        result = await session.call_tool(tool, arguments)
+        ok = succeeded(result)
+    except Exception as e:
+        result, ok = e, False
+    tolerated = not ok and tolerate is not None and not isinstance(result, Exception) and tolerate(result)
+    recorder.add(tool, time.perf_counter() - started, ok or tolerated)
+    if not ok and not tolerated and recorder.show_errors:
+        print(f"调用失败: {tool} {arguments} -> {result}", file=sys.stderr)
+    return result, ok
+
+
+class LoadClient:
+    """一个并发会话：按权重随机调用工具，直到截止时间。"""
+
+    def __init__(self, index: int, args, excel_path: str, swap_dates: tuple, recorder: Recorder):
+        self.args = args
+        self.excel_path = excel_path
+        self.recorder = recorder
+        self.rng = random.Random(args.seed + index)
+        first, second = swap_dates
+        self.swap_days = [(FIRST_DAY + timedelta(days=day)).isoformat() for day in (first, second)]
+        self.swap_names = [employees_on(first)[0], employees_on(second)[0]]
+        self.swapped = False
+
+    async def swap(self, session: ClientSession) -> None:
+        for attempt in range(2):
+            name1, name2 = reversed(self.swap_names) if self.swapped else self.swap_names
+            _, ok = await call(session, self.recorder, "swap_duty_schedule", {
+                "employee1_date": self.swap_days[0], "employee1_name": name1,
+                "employee2_date": self.swap_days[1], "employee2_name": name2,
+            }, tolerate=direction_mismatch if attempt == 0 else None)
+            self.swapped = not self.swapped
+            if ok:
+                return
+            # 其他会话的全量导入恢复了原始排班，方向反了，换个方向再试一次
+            self.recorder.retries += 1
+
+    async def run(self, session: ClientSession, deadline: float) -> None:
+        tools, weights = zip(*self.args.mix.items())
+        while time.perf_counter() < deadline:
+            tool = self.rng.choices(tools, weights)[0]
+            if tool == "get_duty_employee":
+                day = FIRST_DAY + timedelta(days=self.rng.randrange(self.args.days))
+                await call(session, self.recorder, tool, {"duty_date": day.isoformat()})
+            elif tool == "swap_duty_schedule":
+                await self.swap(session)
+            else:
+                await call(session, self.recorder, tool, {"file_path": self.excel_path, "force": True})
+                self.swapped = False
+
+
+async def import_roster(session: ClientSession, excel_path: str) -> None:
+    result = await session.call_tool("import_schedule_path", {"file_path": excel_path, "force": True})
+    if not succeeded(result):
+        raise RuntimeError(f"导入测试排班失败: {result.content[0].text if result.content else result}")
+
+
+def open_transport(args):
+    """按传输方式打开一个连接，返回异步上下文管理器，产出 (read, write, ...)。"""
+    if args.transport == "stdio":
+        params = StdioServerParameters(command=sys.executable, args=[SERVER_SCRIPT], cwd=PROJECT_ROOT,
+                                       env=dict(os.environ))
+        return stdio_client(params, errlog=open(os.devnull, "w"))
+    return streamablehttp_client(args.url)
+
+
+async def run_session(index: int, args, excel_path: str, swap_dates: tuple, recorder: Recorder,
+                      ready: asyncio.Barrier, start: asyncio.Event, deadline_box: list) -> None:
+    async with open_transport(args) as streams:
+        async with ClientSession(streams[0], streams[1]) as session:
+            await session.initialize()
+            if args.transport == "stdio":
+                # 每个stdio会话对应一个独立的服务器进程，各自导入一次
+                await import_roster(session, excel_path)
+            await ready.wait()
+            await start.wait()
+            await LoadClient(index, args, excel_path, swap_dates, recorder).run(session, deadline_box[0])
+
+
+async def run_load(args, excel_path: str) -> tuple:
+    recorder = Recorder(args.show_errors)
+    if args.transport == "streamable-http":
+        async with streamablehttp_client(args.url) as streams:
+            async with ClientSession(streams[0], streams[1]) as session:
+                await session.initialize()
+                await import_roster(session, excel_path)
+
+    pairs = client_swap_pairs(args.days, args.clients)
+    ready = asyncio.Barrier(args.clients + 1)
+    start = asyncio.Event()
+    deadline_box = [0.0]
+    tasks = [
+        asyncio.create_task(run_session(index, args, excel_path, pairs[index], recorder, ready, start, deadline_box))
+        for index in range(args.clients)
+    ]
+    # 所有会话完成初始化后同时开始计时
+    await ready.wait()
+    started = time.perf_counter()
+    deadline_box[0] = started + args.duration
+    start.set()
+    await asyncio.gather(*tasks)
+    return recorder, time.perf_counter() - started
+
+
+def wait_for_port(host: str, port: int, process: subprocess.Popen) -> None:
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"服务器启动失败，退出码 {process.returncode}")
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"等待服务器监听 {host}:{port} 超时")
+
+
+def start_server(args) -> subprocess.Popen:
+    endpoint = urlparse(args.url)
+    process = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT, "--transport", "streamable-http",
+         "--host", endpoint.hostname, "--port", str(endpoint.port or 80), "--workers", str(args.server_workers)],
+        cwd=PROJECT_ROOT, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    wait_for_port(endpoint.hostname, endpoint.port or 80, process)
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCP服务器的端到端压力测试")
+    parser.add_argument("--transport", choices=("stdio", "streamable-http"), default="stdio")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/mcp", help="streamable-http 模式的MCP端点")
+    parser.add_argument("--start-server", action="store_true", help="由本脚本启动HTTP服务器")
+    parser.add_argument("--server-workers", type=int, default=1, help="--start-server 时服务器的工作进程数")
+    parser.add_argument("--clients", type=int, default=8, help="并发会话数 (默认8)")
+    parser.add_argument("--duration", type=float, default=10.0, help="压测持续秒数 (默认10)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"工具调用的权重 (默认 {DEFAULT_MIX})")
+    parser.add_argument("--days", type=int, default=365, help="合成排班的天数 (默认365)")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--output", help="结果JSON的输出路径")
+    parser.add_argument("--show-errors", action="store_true", help="把失败的调用及其响应输出到标准错误")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="mcp_load_")
+    excel_path = os.path.join(work_dir, "roster.xlsx")
+    write_roster(excel_path, args.days)
+
+    server = start_server(args) if args.transport == "streamable-http" and args.start_server else None
+    try:
+        recorder, elapsed = asyncio.run(run_load(args, excel_path))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        os.remove(excel_path)
+        os.rmdir(work_dir)
+
+    rows = recorder.summary(elapsed)
+    total_calls = sum(row["calls"] for row in rows)
+    print(f"传输方式: {args.transport}  并发会话: {args.clients}  持续: {elapsed:.1f} s  "
+          f"总调用: {total_calls}  吞吐量: {total_calls / elapsed:.1f} 次/秒  换班方向重试: {recorder.retries}")
+    print(f"{'工具':<24}{'调用':>8}{'错误':>6}{'次/秒':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for row in rows:
+        print(f"{row['tool']:<24}{row['calls']:>8}{row['errors']:>6}{row['throughput_per_s']:>10.1f}"
+              f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}")
+
+    if args.output:
+        report = {
+            "meta": {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "transport": args.transport,
+                "url": args.url if args.transport == "streamable-http" else None,
+                "server_workers": args.server_workers if args.start_server else None,
+                "clients": args.clients,
+                "duration_s": round(elapsed, 3),
+                "mix": args.mix,
+                "days": args.days,
+            },
+            "total_calls": total_calls,
+            "throughput_per_s": round(total_calls / elapsed, 2),
+            "swap_direction_retries": recorder.retries,
+            "tools": rows,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if any(row["errors"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+MCP服务器冷启动的导入耗时基准。
+
+用 `python -X importtime start_mcp_server.py` 启动服务器 (stdin 接 /dev/null，服务器读到EOF后立即退出)，
+解析 stderr 中的 importtime 输出，统计模块导入的总耗时和最慢的顶层模块，并检查：
+- 导入总耗时不超过预算 (--budget-ms，取多次运行的中位数)
+- 启动时没有加载只在导入Excel时才需要的重量级模块 (pandas / numpy / openpyxl)
+
+任一检查不通过时以非零状态码退出，可以直接放在CI或部署前的检查中。
+
+使用方法：
+python benchmarks/startup_importtime.py
+python benchmarks/startup_importtime.py --runs 5 --budget-ms 1500 --top 15
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_SCRIPT = os.path.join(PROJECT_ROOT, "start_mcp_server.py")
+
+# 只在导入Excel时才应该加载的模块
+DEFERRED_MODULES = ("pandas", "numpy", "openpyxl")
+DEFAULT_BUDGET_MS = 1500.0
+
+
+def run_once():
+    """
+    启动一次服务器并解析 importtime 输出。
+    返回 (进程总耗时ms, 导入总耗时ms, {顶层模块: 累计耗时ms}, 已加载的模块集合)。
+    """
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", ENTRY_SCRIPT],
+        cwd=PROJECT_ROOT,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+
+    total_us = 0
+    top_level = {}
+    modules = set()
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # 表头行
+        self_us, cumulative_us, name = int(parts[0]), int(parts[1]), parts[2]
+        total_us += self_us
+        module = name.strip()
+        modules.add(module)
+        # 缩进表示嵌套导入，不带缩进 (只有一个前导空格) 的是顶层导入
+        if len(name) - len(name.lstrip()) == 1:
+            top_level[module] = top_level.get(module, 0) + cumulative_us / 1000
+    return wall_ms, total_us / 1000, top_level, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量MCP服务器冷启动的导入耗时")
+    parser.add_argument("--runs", type=int, default=3, help="运行次数，取中位数 (默认3)")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help=f"导入总耗时的预算，单位毫秒 (默认{DEFAULT_BUDGET_MS:.0f})")
+    parser.add_argument("--top", type=int, default=10, help="列出最慢的顶层模块个数 (默认10)")
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    wall_ms = statistics.median(r[0] for r in results)
+    import_ms = statistics.median(r[1] for r in results)
+    top_level, modules = results[-1][2], results[-1][3]
+
+    print(f"运行次数: {args.runs}")
+    print(f"进程总耗时(中位数): {wall_ms:.0f} ms")
+    print(f"导入总耗时(中位数): {import_ms:.0f} ms  (预算 {args.budget_ms:.0f} ms)")
+    print(f"最慢的 {args.top} 个顶层模块:")
+    for module, elapsed in sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {elapsed:8.1f} ms  {module}")
+
+    failures = []
+    if import_ms > args.budget_ms:
+        failures.append(f"导入总耗时 {import_ms:.0f} ms 超出预算 {args.budget_ms:.0f} ms")
+    loaded = [module for module in DEFERRED_MODULES if module in modules]
+    if loaded:
+        failures.append(f"启动时加载了应延迟导入的模块: {', '.join(loaded)}")
+
+    for failure in failures:
+        print(f"失败: {failure}")
+    if not failures:
+        print("通过")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
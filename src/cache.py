@@ -0,0 +1,185 @@
+"""
+值班表的进程内读穿缓存 (read-through cache)。
+
+值班数据只会在 `import_schedule` 或 `swap_duty_schedule` 提交后发生变化，
+因此查询结果可以安全地缓存在内存中：
+- 按日期缓存 DutySchedule 行 (包括"该日期不存在"的负缓存)，最多 CACHE_MAX_ROWS 行，按LRU淘汰
+- 缓存排班表的最大日期，以及"数据库是否为空"的标记
+
+- 缓存预先计算好的"今天/明天"查询响应 (DaySnapshot)，由后台任务维护
+
+缓存带有版本号。每次失效或原地更新都会使版本号递增，
+在旧版本下读取到的数据不会被写回缓存，从而避免并发读写时写入过期数据。
+缓存按数据库引擎(bind)隔离，不同的引擎(例如测试中的内存数据库)互不影响。
+
+其他进程 (另一个MCP服务器、FastAPI应用或工作进程) 对同一个数据库的写入不会通知到本进程的缓存，
+因此通过 CACHE_TTL (默认5秒) 让缓存定期整体过期，过期后的第一次读取重新访问数据库。
+"""
+
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from datetime import date
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .config import CACHE_MAX_ROWS, CACHE_TTL
+
+# 哨兵对象，用于区分"未缓存"和"已缓存为 None (该日期无记录)"
+MISSING = object()
+
+
+class DaySnapshot:
+    """预先计算好的 'today' 查询响应：{日期: 响应}，以及排班表的最大日期。"""
+
+    def __init__(self, responses: dict, horizon: Optional[date]):
+        self.responses = responses
+        self.horizon = horizon
+
+    def get(self, duty_date: date):
+        """返回该日期预先计算的响应，没有时返回 None。"""
+        return self.responses.get(duty_date)
+
+
+class DutyScheduleCache:
+    """单个数据库引擎对应的值班数据缓存。"""
+
+    def __init__(self, ttl: float = CACHE_TTL, max_rows: int = CACHE_MAX_ROWS):
+        self._lock = threading.Lock()
+        self.version = 0
+        # 缓存的有效秒数，0 表示不过期；_cleared_at 为上一次清空的时间
+        self.ttl = ttl
+        self._cleared_at = time.monotonic()
+        # 按访问顺序排列，最久未访问的在最前面
+        self.max_rows = max_rows
+        self._rows: "OrderedDict[date, Optional[dict]]" = OrderedDict()
+        self._summary: Optional[Tuple[bool, Optional[date]]] = None
+        self._snapshot: Optional[DaySnapshot] = None
+        self._listeners: List[Callable[[], None]] = []
+
+    # --- 读取 ---
+
+    def get_row(self, duty_date: date):
+        """返回缓存的行数据(dict)，无记录时为 None，未缓存时返回 MISSING。"""
+        self._expire()
+        with self._lock:
+            row = self._rows.get(duty_date, MISSING)
+            if row is not MISSING:
+                self._rows.move_to_end(duty_date)
+            return row
+
+    def get_summary(self) -> Optional[Tuple[bool, Optional[date]]]:
+        """返回缓存的 (是否为空, 最大日期)，未缓存时返回 None。"""
+        self._expire()
+        with self._lock:
+            return self._summary
+
+    def get_snapshot(self) -> Optional[DaySnapshot]:
+        """返回当前版本下有效的 'today' 快照，没有时返回 None。"""
+        self._expire()
+        with self._lock:
+            return self._snapshot
+
+    # --- 写回 (仅当版本号未变化时生效) ---
+
+    def store_row(self, duty_date: date, row: Optional[dict], version: int) -> None:
+        with self._lock:
+            if version == self.version:
+                self._rows[duty_date] = dict(row) if row is not None else None
+                self._rows.move_to_end(duty_date)
+                while len(self._rows) > self.max_rows:
+                    self._rows.popitem(last=False)
+
+    def store_summary(self, is_empty: bool, max_date: Optional[date], version: int) -> None:
+        with self._lock:
+            if version == self.version:
+                self._summary = (is_empty, max_date)
+
+    def store_snapshot(self, snapshot: DaySnapshot, version: int) -> None:
+        with self._lock:
+            if version == self.version:
+                self._snapshot = snapshot
+
+    # --- 变更通知 ---
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        """注册一个回调，在每次失效或原地更新之后调用 (调用方需保证回调足够轻量且线程安全)。"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[], None]) -> None:
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _notify(self) -> None:
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    # --- 失效与更新 ---
+
+    def _clear(self) -> None:
+        """在持有锁时调用：清空全部数据并递增版本号。"""
+        self.version += 1
+        self._rows.clear()
+        self._summary = None
+        self._snapshot = None
+        self._cleared_at = time.monotonic()
+
+    def _expire(self) -> None:
+        """超过 ttl 时清空缓存，并像写入一样通知监听者 (快照任务据此重新计算快照)。"""
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if time.monotonic() - self._cleared_at < self.ttl:
+                return
+            self._clear()
+        self._notify()
+
+    def invalidate(self) -> None:
+        """清空全部缓存 (用于导入等整表变更)。"""
+        with self._lock:
+            self._clear()
+        self._notify()
+
+    def update_rows(self, changes: Dict[date, dict]) -> None:
+        """
+        原地更新已缓存的行 (用于换班等局部变更)。
+        changes 的格式为 {日期: {字段名: 新值}}，未缓存的日期直接忽略。
+        """
+        with self._lock:
+            self.version += 1
+            self._snapshot = None
+            for duty_date, fields in changes.items():
+                row = self._rows.get(duty_date)
+                if row is None:
+                    # 未缓存或负缓存：丢弃，下次查询时重新读取
+                    self._rows.pop(duty_date, None)
+                    continue
+                row.update(fields)
+        self._notify()
+
+
+_caches: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_aliases: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+def link_engines(alias, target) -> None:
+    """声明 alias 与 target 两个引擎指向同一个数据库(例如异步引擎和同步引擎)，共用同一份缓存。"""
+    with _caches_lock:
+        _aliases[alias] = target
+
+
+def get_cache(db) -> DutyScheduleCache:
+    """获取会话所绑定的数据库引擎对应的缓存实例。"""
+    bind = db.get_bind()
+    with _caches_lock:
+        bind = _aliases.get(bind, bind)
+        cache = _caches.get(bind)
+        if cache is None:
+            cache = DutyScheduleCache()
+            _caches[bind] = cache
+        return cache
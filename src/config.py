@@ -15,3 +15,88 @@ DB_NAME = os.getenv("DB_NAME", "duty_schedule_db")
 # 构建数据库连接URL
 # 注意：需要确保你的mysql-connector-python版本和SQLAlchemy兼容
 DATABASE_URL = f"mysql+mysqlconnector://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# 异步访问使用的连接URL (aiomysql驱动)，供异步的MCP工具和FastAPI端点使用
+ASYNC_DATABASE_URL = f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# MySQL不可用时的SQLite后备数据库。
+# 使用共享缓存的命名内存数据库，使同步引擎(pysqlite)和异步引擎(aiosqlite)看到同一份数据。
+SQLITE_FALLBACK_URI = f"file:{DB_NAME}?mode=memory&cache=shared&uri=true"
+
+
+def _env_bool(name: str, default: str) -> bool:
+    """读取布尔型环境变量，支持 1/true/yes/on。"""
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+# --- 连接池配置 ---
+# 常驻连接数与允许临时溢出的连接数
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# 连接池耗尽时等待可用连接的最长秒数
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+# 连接的最长存活秒数，应小于MySQL的 wait_timeout，避免使用已被服务端断开的连接
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+# 每次取出连接前先做一次轻量探测，自动替换失效连接
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", "true")
+# 建立数据库连接的超时秒数，MySQL不可用时尽快失败并使用后备数据库，而不是等待TCP超时
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+
+# --- 导入配置 ---
+# 写入数据库时每一批的行数 (流式导入时也是每次从Excel读取的行数)
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+# --- 换班并发控制 ---
+# 换班时检测到并发修改(版本号冲突)后的最大重试次数
+SWAP_MAX_RETRIES = int(os.getenv("SWAP_MAX_RETRIES", "3"))
+# 重试退避的基准秒数，第 n 次重试前等待约 基准 * 2^n 秒 (带随机抖动)
+SWAP_RETRY_BACKOFF = float(os.getenv("SWAP_RETRY_BACKOFF", "0.05"))
+
+# --- 换班日志分页 ---
+# 每页默认返回的日志条数，以及单页允许的最大条数
+SWAP_LOG_PAGE_SIZE = int(os.getenv("SWAP_LOG_PAGE_SIZE", "50"))
+SWAP_LOG_MAX_PAGE_SIZE = int(os.getenv("SWAP_LOG_MAX_PAGE_SIZE", "500"))
+
+# --- 排班时区 ---
+# 计算"今天"等相对日期时使用的时区 (IANA 名称)，与服务器本身的时区无关
+SCHEDULE_TIMEZONE = os.getenv("SCHEDULE_TIMEZONE", "Asia/Shanghai")
+
+# --- 存储后端 ---
+# database: 使用MySQL (不可用时后备为SQLite)，支持全部功能
+# memory: 纯内存存储，只支持查询和全量导入，适合以查询为主的小型部署
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "database").strip().lower()
+STORAGE_BACKENDS = ("database", "memory")
+# memory 后端的快照文件路径，启动时从这里加载，每次导入后写回
+MEMORY_SNAPSHOT_PATH = os.getenv("MEMORY_SNAPSHOT_PATH", "data/duty_schedule_snapshot.json")
+
+# --- MCP传输方式 ---
+# stdio: 由客户端以子进程方式启动 (默认)；streamable-http: 作为HTTP服务运行，可同时服务多个客户端
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio").strip().lower()
+# HTTP模式监听的地址和端口，MCP端点为 http://<host>:<port>/mcp
+MCP_HTTP_HOST = os.getenv("MCP_HTTP_HOST", "127.0.0.1")
+MCP_HTTP_PORT = int(os.getenv("MCP_HTTP_PORT", "8000"))
+# HTTP模式的uvicorn工作进程数，多个工作进程需要共享同一个MySQL数据库
+MCP_HTTP_WORKERS = int(os.getenv("MCP_HTTP_WORKERS", "1"))
+# HTTP模式下是否在同一个进程中同时提供 src/main.py 的FastAPI接口
+MCP_HTTP_WITH_API = _env_bool("MCP_HTTP_WITH_API", "false")
+# 无状态模式下每个请求独立处理，不依赖会话所在的进程，多个工作进程时必须开启
+MCP_STATELESS_HTTP = _env_bool("MCP_STATELESS_HTTP", "true")
+# HTTP模式允许的 Host 头 (防止DNS重绑定攻击)，逗号分隔，端口可写为 * (例如 duty.example.com:*)。
+# 未设置时监听本机地址只接受本机主机名，监听其他地址时不检查 (由防火墙、反向代理负责访问控制)
+MCP_HTTP_ALLOWED_HOSTS = [host.strip() for host in os.getenv("MCP_HTTP_ALLOWED_HOSTS", "").split(",") if host.strip()]
+
+# --- 缓存 ---
+# 进程内缓存的有效秒数。其他进程 (另一个MCP服务器、FastAPI应用、其他工作进程) 对同一数据库的写入
+# 不会通知到本进程，只能靠过期感知，因此默认5秒；0 表示只在本进程写入时失效，只适合单进程独占数据库。
+# 多个工作进程时不允许为 0，设置为 0 时改用 MULTI_WORKER_CACHE_TTL
+CACHE_TTL = float(os.getenv("CACHE_TTL", "5"))
+MULTI_WORKER_CACHE_TTL = 5.0
+# 进程内缓存最多保存的日期行数，超出时淘汰最久未访问的行 (LRU)
+CACHE_MAX_ROWS = int(os.getenv("CACHE_MAX_ROWS", "10000"))
+
+# --- 慢查询日志 ---
+# 耗时达到该毫秒数的SQL语句输出到标准错误并保存到慢查询缓冲区 (get_slow_queries 工具)，0 表示关闭
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+# 是否为 duty_schedules / swap_logs 表上的慢 SELECT 记录执行计划 (EXPLAIN)
+SLOW_QUERY_EXPLAIN = _env_bool("SLOW_QUERY_EXPLAIN", "false")
+# 慢查询缓冲区保留的最近记录条数
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "100"))
@@ -1,68 +1,351 @@
-import mysql.connector
-from mysql.connector import errorcode
-from sqlalchemy import create_engine
+import asyncio
+import sys
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from typing import AsyncIterator, Iterator
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import SingletonThreadPool, StaticPool
+
+from . import metrics
+from .cache import link_engines
+from .dates import schedule_now
+from .slow_query import slow_queries
+from .config import (
+    DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME, DATABASE_URL, ASYNC_DATABASE_URL,
+    SQLITE_FALLBACK_URI, DB_CONNECT_TIMEOUT,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+)
 
-from .config import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME, DATABASE_URL
+def _log(message) -> None:
+    # 初始化可能在 stdio 模式的MCP服务器运行期间(后台线程中)进行，
+    # 输出到 stderr，避免混入 stdout 上的协议消息
+    print(message, file=sys.stderr)
 
 def ensure_database_exists():
     """在创建SQLAlchemy引擎前，确保数据库本身存在"""
+    # 只在真正初始化数据库时才导入驱动，避免拖慢模块导入
+    import mysql.connector
+    from mysql.connector import errorcode
+
     try:
         # 1. 先不带数据库名连接，以检查和创建数据库
         cnx = mysql.connector.connect(
             user=DB_USER,
             password=DB_PASSWORD,
             host=DB_HOST,
-            port=DB_PORT
+            port=DB_PORT,
+            connection_timeout=DB_CONNECT_TIMEOUT
         )
         cursor = cnx.cursor()
         
         # 2. 使用参数化查询来安全地创建数据库
         try:
             cursor.execute(f"CREATE DATABASE {DB_NAME} DEFAULT CHARACTER SET 'utf8mb4'")
-            print(f"数据库 '{DB_NAME}' 已成功创建。")
+            _log(f"数据库 '{DB_NAME}' 已成功创建。")
         except mysql.connector.Error as err:
             if err.errno == errorcode.ER_DB_CREATE_EXISTS:
                 # 数据库已存在，这是正常情况
                 pass
             else:
-                print(err)
+                _log(err)
         
         cursor.close()
         cnx.close()
     except mysql.connector.Error as err:
-        print(f"数据库连接或创建失败: {err}")
-        print("警告: 数据库不可用，某些功能可能无法正常工作")
+        _log(f"数据库连接或创建失败: {err}")
+        _log("警告: 数据库不可用，某些功能可能无法正常工作")
         # 不终止程序，让MCP服务器可以启动用于测试
         return False
     return True
 
-# 在模块加载时执行数据库存在性检查
-db_available = ensure_database_exists()
+# --- 延迟初始化 ---
+# 引擎、数据库本身和表结构都在第一次使用时才创建，而不是在模块导入时：
+# 导入本模块不会发起任何网络连接，MySQL不可用时也不会阻塞启动。
 
-if db_available:
-    # 创建数据库引擎
-    # 现在我们可以安全地使用包含数据库名的URL
-    engine = create_engine(
-        DATABASE_URL,
-        # echo=True  # 如果需要查看SQLAlchemy生成的SQL语句，可以取消此行注释
-    )
-else:
-    # 使用SQLite内存数据库作为后备
-    print("使用SQLite内存数据库作为后备...")
-    engine = create_engine("sqlite:///:memory:", echo=False)
+# 会话工厂在引擎创建后才绑定
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+# 异步会话工厂。提交后不使对象过期，避免在异步上下文中触发隐式的延迟加载
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
 
-# 创建一个数据库会话工厂
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+_engines = None
+_schema_ready = False
+_init_lock = threading.RLock()
+
+def _create_engines():
+    """检查数据库并创建同步和异步引擎 (MySQL不可用时使用SQLite后备)。"""
+    if ensure_database_exists():
+        # 创建数据库引擎
+        # 现在我们可以安全地使用包含数据库名的URL
+        engine = create_engine(
+            DATABASE_URL,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            connect_args={"connection_timeout": DB_CONNECT_TIMEOUT},
+        )
+        # 异步引擎连接同一个数据库，供异步工具和端点使用
+        async_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            connect_args={"connect_timeout": DB_CONNECT_TIMEOUT},
+        )
+        available = True
+    else:
+        # 使用SQLite内存数据库作为后备
+        _log("使用SQLite内存数据库作为后备...")
+        engine = create_engine(f"sqlite:///{SQLITE_FALLBACK_URI}", poolclass=SingletonThreadPool, echo=False)
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{SQLITE_FALLBACK_URI}", poolclass=StaticPool, echo=False)
+        available = False
+
+    # 同步和异步引擎指向同一个数据库，让它们共用同一份查询缓存
+    link_engines(async_engine.sync_engine, engine)
+    for target in (engine, async_engine.sync_engine):
+        event.listen(target, "connect", lambda *args: pool_stats.incr("connects"))
+        event.listen(target, "checkout", lambda *args: pool_stats.incr("checkouts"))
+        event.listen(target, "checkin", lambda *args: pool_stats.incr("checkins"))
+        metrics.instrument_engine(target)
+        # 慢查询日志 (SLOW_QUERY_THRESHOLD_MS)，代替输出全部SQL的 echo=True
+        slow_queries.instrument_engine(target)
+    SessionLocal.configure(bind=engine)
+    AsyncSessionLocal.configure(bind=async_engine)
+    return engine, async_engine, available
+
+def _get_engines():
+    global _engines
+    if _engines is None:
+        with _init_lock:
+            if _engines is None:
+                _engines = _create_engines()
+    return _engines
+
+def get_engine():
+    """返回同步引擎，第一次调用时创建。"""
+    return _get_engines()[0]
+
+def get_async_engine():
+    """返回异步引擎，第一次调用时创建。"""
+    return _get_engines()[1]
+
+def init_db() -> None:
+    """
+    初始化数据库：创建引擎、建表、补充新增的列和索引、回填值班分配索引。
+    可重复调用，只有第一次真正执行；会话管理器在第一次取会话时自动调用。
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _init_lock:
+        if _schema_ready:
+            return
+        # 在函数内导入，避免与 models / services 循环导入
+        from . import models, services
+        engine = get_engine()
+        models.Base.metadata.create_all(bind=engine)
+        upgrade_schema(engine)
+        db = SessionLocal()
+        try:
+            services.ensure_assignment_index(db)
+        finally:
+            db.close()
+        _schema_ready = True
+
+def __getattr__(name):
+    # 兼容旧代码中的 `from src.database import engine, db_available`，访问时才初始化
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    if name == "db_available":
+        return _get_engines()[2]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # 创建一个所有ORM模型将要继承的基类
 Base = declarative_base()
 
-# 数据库依赖项
-def get_db():
+# --- 表结构升级 ---
+
+# create_all 只会创建缺失的表，不会为已有的表补充新增的列。
+# 这里登记后续版本新增的列：(表名, 列名, 列定义)
+_COLUMN_UPGRADES = [
+    ("duty_schedules", "version", "INTEGER NOT NULL DEFAULT 1"),
+]
+# 需要修改类型的MySQL列：(表名, 列名, 新的完整列定义, 判断现有列是否已是新类型, 修改后转换旧数据的SQL或 None)
+# MODIFY COLUMN 会整体替换列定义，因此新定义必须包含注释等全部属性
+_MYSQL_COLUMN_TYPE_UPGRADES = [
+    # 旧表的 log_time 是不带小数秒的 DATETIME，默认值取数据库时钟 (数据库会话时区的当前时间)；
+    # 现在由应用写入排班时区 (SCHEDULE_TIMEZONE) 的带微秒时间。旧日志一并换算到排班时区，
+    # 否则新旧日志混用两个时钟，按 (log_time, id) 的分页顺序会错乱。
+    # 换算使用排班时区当前的UTC偏移；数据库无法识别会话时区时 CONVERT_TZ 返回 NULL，保留原值
+    ("swap_logs", "log_time", "DATETIME(6) NULL COMMENT '日志记录时间'",
+     lambda column: getattr(column["type"], "fsp", None) == 6,
+     "UPDATE swap_logs SET log_time = COALESCE(CONVERT_TZ(log_time, @@session.time_zone, :schedule_offset), log_time)"),
+]
+
+
+def _schedule_utc_offset() -> str:
+    """排班时区当前的UTC偏移，格式为 +08:00 (MySQL CONVERT_TZ 接受的格式)。"""
+    minutes = int(schedule_now().utcoffset().total_seconds() // 60)
+    sign = "-" if minutes < 0 else "+"
+    return f"{sign}{abs(minutes) // 60:02d}:{abs(minutes) % 60:02d}"
+
+
+def upgrade_schema(bind) -> None:
+    """为已存在的旧表补充新增的列和索引。可重复执行，已存在时不做任何操作。"""
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table, column, ddl in _COLUMN_UPGRADES:
+            if not inspector.has_table(table):
+                continue
+            if column in {c["name"] for c in inspector.get_columns(table)}:
+                continue
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+            _log(f"已为表 '{table}' 添加列 '{column}'。")
+
+        if bind.dialect.name == "mysql":
+            for table, column, ddl, is_current, convert in _MYSQL_COLUMN_TYPE_UPGRADES:
+                if not inspector.has_table(table):
+                    continue
+                existing = {c["name"]: c for c in inspector.get_columns(table)}
+                if column not in existing or is_current(existing[column]):
+                    continue
+                conn.execute(text(f"ALTER TABLE {table} MODIFY COLUMN {column} {ddl}"))
+                if convert:
+                    conn.execute(text(convert), {"schedule_offset": _schedule_utc_offset()})
+                _log(f"已将表 '{table}' 的列 '{column}' 修改为 {ddl}。")
+
+        # 模型中声明、但旧表上还没有的索引
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(conn)
+                    _log(f"已为表 '{table.name}' 创建索引 '{index.name}'。")
+
+# --- 连接池统计 ---
+
+class PoolStats:
+    """记录连接池的取出/归还次数和获取连接的等待时间。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.wait_count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.wait_count += 1
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "avg_wait_ms": round(self.total_wait / self.wait_count * 1000, 3) if self.wait_count else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+            }
+
+pool_stats = PoolStats()
+
+def get_pool_stats() -> dict:
+    """返回连接池的当前状态及累计统计信息。数据库尚未初始化时只返回累计统计。"""
+    if _engines is None:
+        return dict(pool_stats.snapshot(), initialized=False)
+    pool = _engines[0].pool
+    stats = {"pool_class": type(pool).__name__, "initialized": True}
+    # 只有 QueuePool 提供容量相关的信息，SQLite后备使用的连接池没有这些方法
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            stats[name] = method()
+    stats.update(pool_stats.snapshot())
+    return stats
+
+# --- 会话管理 ---
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """
+    提供一个数据库会话的上下文管理器，供MCP工具和API端点共用。
+    进入时立即从连接池取出连接并记录等待时间；发生异常时回滚；退出时将连接归还连接池。
+    事务的提交由业务层(services)自行负责。
+    """
+    init_db()
+    start = time.perf_counter()
     db = SessionLocal()
     try:
+        db.connection()
+        pool_stats.record_wait(time.perf_counter() - start)
         yield db
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
+
+# SQLite后备库的异步引擎只有一个共享连接 (StaticPool)，并发的会话会在同一个连接上交错执行事务
+# (一个会话的提交会带上另一个会话未完成的修改)，因此后备模式下同一个事件循环中的异步会话逐个执行
+_fallback_locks: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+def _fallback_session_lock():
+    """后备模式下返回当前事件循环的会话锁，使用MySQL时返回 None。"""
+    if _get_engines()[2]:
+        return None
+    loop = asyncio.get_running_loop()
+    lock = _fallback_locks.get(loop)
+    if lock is None:
+        lock = _fallback_locks[loop] = asyncio.Lock()
+    return lock
+
+@asynccontextmanager
+async def async_session_scope() -> AsyncIterator[AsyncSession]:
+    """session_scope 的异步版本，基于SQLAlchemy的asyncio扩展。"""
+    if not _schema_ready:
+        # 初始化会建立同步连接，放到工作线程中执行，不阻塞事件循环
+        await asyncio.to_thread(init_db)
+    start = time.perf_counter()
+    async with _fallback_session_lock() or nullcontext():
+        db = AsyncSessionLocal()
+        try:
+            await db.connection()
+            pool_stats.record_wait(time.perf_counter() - start)
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
+        finally:
+            await db.close()
+
+# 数据库依赖项
+def get_db():
+    with session_scope() as db:
+        yield db
+
+# 异步数据库依赖项
+async def get_async_db():
+    async with async_session_scope() as db:
+        yield db
@@ -0,0 +1,85 @@
+"""
+按排班时区解析查询日期。
+
+服务器(例如容器)通常运行在UTC，而排班表使用的是 SCHEDULE_TIMEZONE (默认 Asia/Shanghai)。
+所有服务统一通过这里获取"今天"并解析日期参数，避免"今天"在当地时间早上8点才切换。
+
+除 'YYYY-MM-DD' 外还支持以下相对日期关键字 (不区分大小写)：
+- today / tomorrow / yesterday，以及 今天 / 明天 / 昨天
+- 星期名称，如 monday、周一、星期一，表示从今天起(含今天)最近的那一天
+
+关键字表每天只构建一次，显式日期的解析结果也会被缓存，每次调用只需一次字典查找。
+"""
+
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Dict, Optional
+from zoneinfo import ZoneInfo
+
+from .config import SCHEDULE_TIMEZONE
+
+SCHEDULE_TZ = ZoneInfo(SCHEDULE_TIMEZONE)
+
+_WEEKDAY_NAMES = (
+    ("monday", "mon", "周一", "星期一"),
+    ("tuesday", "tue", "周二", "星期二"),
+    ("wednesday", "wed", "周三", "星期三"),
+    ("thursday", "thu", "周四", "星期四"),
+    ("friday", "fri", "周五", "星期五"),
+    ("saturday", "sat", "周六", "星期六"),
+    ("sunday", "sun", "周日", "星期日", "周天", "星期天"),
+)
+
+
+def schedule_now() -> datetime:
+    """排班时区的当前时间。"""
+    return datetime.now(SCHEDULE_TZ)
+
+
+def schedule_today() -> date:
+    """排班时区的今天。"""
+    return schedule_now().date()
+
+
+def seconds_until_midnight() -> float:
+    """距离排班时区下一个午夜的秒数。"""
+    current = schedule_now()
+    midnight = datetime.combine(current.date() + timedelta(days=1), time(), tzinfo=SCHEDULE_TZ)
+    return (midnight - current).total_seconds()
+
+
+@lru_cache(maxsize=2)
+def _keywords_for(base: date) -> Dict[str, date]:
+    """构建某一天的相对日期关键字表。"""
+    keywords = {
+        "today": base, "今天": base,
+        "tomorrow": base + timedelta(days=1), "明天": base + timedelta(days=1),
+        "yesterday": base - timedelta(days=1), "昨天": base - timedelta(days=1),
+    }
+    for weekday, names in enumerate(_WEEKDAY_NAMES):
+        day = base + timedelta(days=(weekday - base.weekday()) % 7)
+        for name in names:
+            keywords[name] = day
+    return keywords
+
+
+@lru_cache(maxsize=1024)
+def _parse_iso_date(text: str) -> date:
+    return datetime.strptime(text, "%Y-%m-%d").date()
+
+
+def is_relative_date(text: str) -> bool:
+    """是否为相对日期关键字。"""
+    return text.strip().lower() in _keywords_for(schedule_today())
+
+
+def resolve_date(text: str) -> date:
+    """
+    把 'YYYY-MM-DD' 或相对日期关键字解析为日期。
+    格式无效时抛出 ValueError。
+    """
+    key = text.strip().lower()
+    resolved: Optional[date] = _keywords_for(schedule_today()).get(key)
+    if resolved is not None:
+        return resolved
+    return _parse_iso_date(key)
@@ -0,0 +1,55 @@
+"""
+MCP服务器的 streamable-http 部署方式。
+
+create_app() 返回一个ASGI应用，由 `python start_mcp_server.py --transport streamable-http` 通过uvicorn启动：
+- /mcp 为FastMCP的 streamable-http 端点
+- 开启 with_api (MCP_HTTP_WITH_API) 时，同一个进程还挂载 src/main.py 的FastAPI接口 (/docs 等)
+
+多个工作进程时，uvicorn在每个进程中调用 create_app 各自创建应用，进程之间只共享数据库。
+因此需要无状态模式 (MCP_STATELESS_HTTP)，让任意进程都能处理任意请求。
+"""
+
+from contextlib import asynccontextmanager
+
+from mcp.server.transport_security import TransportSecuritySettings
+from starlette.applications import Starlette
+from starlette.routing import Mount
+
+from .config import MCP_HTTP_ALLOWED_HOSTS, MCP_HTTP_HOST, MCP_HTTP_WITH_API, MCP_STATELESS_HTTP
+from .mcp_server import mcp
+from .snapshot import day_snapshot_refresher
+
+# FastMCP 默认只接受这些主机名的 Host 头 (防止DNS重绑定攻击)
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+
+def create_app(with_api: bool = MCP_HTTP_WITH_API, host: str = MCP_HTTP_HOST,
+               stateless: bool = MCP_STATELESS_HTTP) -> Starlette:
+    """创建 streamable-http 模式的ASGI应用。每个进程只能调用一次。"""
+    mcp.settings.stateless_http = stateless
+    if MCP_HTTP_ALLOWED_HOSTS:
+        # 只接受配置的主机名，浏览器请求的 Origin 也必须是这些主机
+        mcp.settings.transport_security = TransportSecuritySettings(
+            enable_dns_rebinding_protection=True,
+            allowed_hosts=MCP_HTTP_ALLOWED_HOSTS,
+            allowed_origins=[f"{scheme}://{allowed}" for allowed in MCP_HTTP_ALLOWED_HOSTS for scheme in ("http", "https")],
+        )
+    elif host not in LOOPBACK_HOSTS:
+        # 监听其他地址时客户端会使用服务器的IP或域名访问，未配置 MCP_HTTP_ALLOWED_HOSTS 时
+        # 由部署环境(防火墙、反向代理)负责访问控制
+        mcp.settings.transport_security = None
+
+    routes = list(mcp.streamable_http_app().routes)
+    if with_api:
+        from .main import app as api_app
+        # 放在最后，/mcp 之外的请求都交给FastAPI处理
+        routes.append(Mount("/", app=api_app))
+
+    @asynccontextmanager
+    async def lifespan(app: Starlette):
+        # 无状态模式下每个请求都会进入一次MCP的 lifespan，
+        # 这里在整个进程生命周期内持有快照任务，避免任务随请求反复启停
+        async with day_snapshot_refresher(), mcp.session_manager.run():
+            yield
+
+    return Starlette(routes=routes, lifespan=lifespan)
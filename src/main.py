@@ -1,18 +1,24 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 import typing
 import uvicorn
-import base64
 
-from . import services, schemas, models
-from .database import get_db, engine
+from . import metrics, services, schemas, models
+from .repository import get_storage
+from .snapshot import day_snapshot_refresher
 
-# --- 数据库与应用初始化 ---
-# 修复BUG：在应用启动时，确保所有定义的表都被创建
-# 这行代码应该在定义了所有模型之后，但在应用开始接收请求之前执行。
-print("正在检查并创建数据库表...")
-models.Base.metadata.create_all(bind=engine)
-print("数据库表检查完成。")
+
+# --- 应用生命周期 ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    应用启动后在后台维护"今天值班"快照，'today' 查询直接从内存返回。
+    数据库在第一次使用时才初始化 (快照任务启动后会立即触发)，不阻塞应用启动。
+    """
+    async with day_snapshot_refresher():
+        yield
 
 
 # --- FastAPI应用实例 ---
@@ -20,7 +26,15 @@ app = FastAPI(
     title="值班表管理MCP",
     description="一个用于管理和查询Excel值班表的智能MCP服务，带Web API接口。",
     version="2.0.0",
+    lifespan=lifespan,
 )
+# 记录每个接口的耗时、SQL语句数和响应大小，通过 /metrics 导出
+app.add_middleware(metrics.MetricsMiddleware)
+
+def _recorded(response: schemas.GeneralResponse) -> schemas.GeneralResponse:
+    """按响应的 status 记录调用是否出错 (与MCP工具的分类相同)，原样返回响应。"""
+    metrics.record_status(response.status)
+    return response
 
 @app.get("/", response_model=schemas.WelcomeMessage, tags=["概览"])
 def read_root():
@@ -35,60 +49,127 @@ def read_root():
 
 # --- MCP 工具定义 (同时也是API端点) ---
 
-@app.post("/import_schedule/upload", response_model=schemas.GeneralResponse, tags=["数据管理"])
+@app.post("/import_schedule/upload", response_model=schemas.ImportScheduleResponse, tags=["数据管理"])
 async def import_schedule_from_upload(
     file: UploadFile = File(..., description="上传的Excel文件"),
-    db: Session = Depends(get_db)
-) -> schemas.GeneralResponse:
+    streaming: bool = Form(False, description="是否使用流式导入"),
+    mode: str = Form("replace", description="导入模式: replace 或 merge"),
+    force: bool = Form(False, description="文件与上次导入的内容相同时也强制重新导入"),
+    db: AsyncSession = Depends(get_storage)
+) -> schemas.ImportScheduleResponse:
     """
-    通过**上传文件**智能导入值班表。此操作会覆盖所有旧数据。
+    通过**上传文件**智能导入值班表。默认(replace模式)会覆盖所有旧数据；merge模式只写入变化的日期并保留换班日志。
     """
-    content = await file.read()
-    b64_content = base64.b64encode(content).decode('utf-8')
-    return services.import_schedule(db, file_content_b64=b64_content)
+    # 直接把上传的临时文件交给解析器，不再经过 Base64 编码和解码
+    return _recorded(await services.import_schedule_async(db, file_obj=file.file, streaming=streaming, mode=mode, force=force))
 
-@app.post("/import_schedule/path", response_model=schemas.GeneralResponse, tags=["数据管理"])
-def import_schedule_from_path(
+@app.post("/import_schedule/path", response_model=schemas.ImportScheduleResponse, tags=["数据管理"])
+async def import_schedule_from_path(
     request: schemas.ImportFromPathRequest,
-    db: Session = Depends(get_db)
-) -> schemas.GeneralResponse:
+    db: AsyncSession = Depends(get_storage)
+) -> schemas.ImportScheduleResponse:
     """
-    通过**服务器本地路径**智能导入值班表。此操作会覆盖所有旧数据。路径格式为：
+    通过**服务器本地路径**智能导入值班表。默认(replace模式)会覆盖所有旧数据；merge模式只写入变化的日期并保留换班日志。路径格式为：
     D:/code/mcp开发/mcp_mysql_exec/排班表.xlsx
     """
-    return services.import_schedule(db, file_path=request.file_path)
+    return _recorded(await services.import_schedule_async(db, file_path=request.file_path, streaming=request.streaming, mode=request.mode, force=request.force))
 
 @app.get("/get_duty_employee/", response_model=schemas.GetDutyEmployeeResponse, tags=["查询"])
-def get_duty_employee(
+async def get_duty_employee(
     duty_date: str = "today",
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_storage)
 ) -> schemas.GetDutyEmployeeResponse:
     """
     查询指定日期的值班安排。
     
-    - **duty_date**: 查询日期，格式为 "YYYY-MM-DD"，或直接使用 "today" 查询当天。
+    - **duty_date**: 查询日期，格式为 "YYYY-MM-DD"，或使用 "today"、"tomorrow"、"yesterday"、"周一" 等相对日期 (按排班时区计算)。
+    """
+    return _recorded(await services.get_duty_employee_async(db, duty_date_str=duty_date))
+
+@app.get("/get_duty_range/", response_model=schemas.GetDutyRangeResponse, tags=["查询"])
+async def get_duty_range(
+    start_date: str,
+    end_date: str,
+    db: AsyncSession = Depends(get_storage)
+) -> schemas.GetDutyRangeResponse:
+    """
+    一次性查询一个日期范围内(含首尾)的值班安排，返回列式结构。
+    
+    - **start_date**: 开始日期，格式为 "YYYY-MM-DD"。
+    - **end_date**: 结束日期，格式为 "YYYY-MM-DD"。
+    """
+    return _recorded(await services.get_duty_range_async(db, start_date_str=start_date, end_date_str=end_date))
+
+@app.get("/get_employee_duties/", response_model=schemas.GetEmployeeDutiesResponse, tags=["查询"])
+async def get_employee_duties(
+    employee_name: str,
+    start_date: typing.Optional[str] = None,
+    end_date: typing.Optional[str] = None,
+    db: AsyncSession = Depends(get_storage)
+) -> schemas.GetEmployeeDutiesResponse:
+    """
+    查询某位员工的全部值班日期和专业。
+    
+    - **employee_name**: 员工姓名。
+    - **start_date** / **end_date**: 可选的日期范围，格式为 "YYYY-MM-DD"。
     """
-    return services.get_duty_employee(db, duty_date_str=duty_date)
+    return _recorded(await services.get_employee_duties_async(db, employee_name=employee_name, start_date_str=start_date, end_date_str=end_date))
 
 @app.post("/swap_duty_schedule/", response_model=schemas.SwapDutyScheduleResponse, tags=["数据管理"])
-def swap_duty_schedule(
+async def swap_duty_schedule(
     request: schemas.SwapDutyScheduleByEmployeeRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_storage)
 ) -> schemas.SwapDutyScheduleResponse:
     """
     通过**员工姓名**精准对调两个日期的值班人员。
 
     在请求体中提供两个要对调的人员信息，每个信息包含日期和姓名。
     """
-    return services.swap_duty_schedule(db, request=request)
+    return _recorded(await services.swap_duty_schedule_async(db, request=request))
+
+@app.post("/swap_duty_schedule/batch", response_model=schemas.SwapDutyScheduleBatchResponse, tags=["数据管理"])
+async def swap_duty_schedule_batch(
+    request: schemas.SwapDutyScheduleBatchRequest,
+    db: AsyncSession = Depends(get_storage)
+) -> schemas.SwapDutyScheduleBatchResponse:
+    """
+    在**一个事务**中按顺序执行多组换班，只提交一次。任意一组失败时整批都不会生效。
+    """
+    return _recorded(await services.swap_duty_schedule_batch_async(db, request=request))
 
 @app.get("/get_swap_logs/", response_model=schemas.GetSwapLogsResponse, tags=["审计"])
-def get_swap_logs(db: Session = Depends(get_db)) -> schemas.GetSwapLogsResponse:
+async def get_swap_logs(
+    limit: int = 50,
+    cursor: typing.Optional[str] = None,
+    start_date: typing.Optional[str] = None,
+    end_date: typing.Optional[str] = None,
+    employee_name: typing.Optional[str] = None,
+    format: str = "text",
+    db: AsyncSession = Depends(get_storage)
+) -> schemas.GetSwapLogsResponse:
     """
-    查询当前数据版本下，所有的换班操作审计日志。
+    分页查询当前数据版本下的换班操作审计日志。
     日志会按时间倒序排列，最新的记录在最前面。
+
+    - **limit**: 每页条数，默认 50，最多 500。
+    - **cursor**: 上一页响应中的 `next_cursor`，省略时从第一页开始。
+    - **start_date** / **end_date**: 可选的对调日期范围，格式为 "YYYY-MM-DD"。
+    - **employee_name**: 可选，只返回与该员工有关的日志。
+    - **format**: `text`(默认，可读的句子) 或 `structured`(结构化字段)。
+    """
+    return _recorded(await services.get_swap_logs_async(
+        db, limit=limit, cursor=cursor, start_date_str=start_date, end_date_str=end_date,
+        employee_name=employee_name, format=format
+    ))
+
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["概览"])
+def prometheus_metrics():
+    """
+    以 Prometheus 文本格式导出当前进程的调用指标：每个接口和MCP工具的调用次数、错误数、耗时分布、
+    SQL语句数与耗时、影响行数和响应大小。
     """
-    return services.get_swap_logs(db)
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
 
 
 # --- 服务器启动逻辑 ---
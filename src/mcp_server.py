@@ -6,13 +6,15 @@
 python src/mcp_server.py
 """
 
+import argparse
 import base64
 import asyncio
 from contextlib import asynccontextmanager
-from typing import AsyncIterator
+from typing import Any, AsyncIterator, List
 
 from mcp.server.fastmcp import FastMCP, Context
-from sqlalchemy.orm import Session
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
 
 import sys
 import os
@@ -24,8 +26,15 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 # 现在可以正确导入模块
-from src import services, schemas, models
-from src.database import get_db, engine
+from src import metrics, services, schemas, models
+from src.database import get_pool_stats
+from src.repository import storage_scope
+from src.slow_query import slow_queries
+from src.config import (
+    CACHE_TTL, MCP_HTTP_HOST, MCP_HTTP_PORT, MCP_HTTP_WITH_API, MCP_HTTP_WORKERS, MCP_STATELESS_HTTP,
+    MCP_TRANSPORT, MULTI_WORKER_CACHE_TTL, STORAGE_BACKEND, STORAGE_BACKENDS,
+)
+from src.snapshot import day_snapshot_refresher
 
 # 应用状态管理
 class AppState:
@@ -36,78 +45,109 @@ app_state = AppState()
 
 @asynccontextmanager
 async def lifespan(server: FastMCP) -> AsyncIterator[AppState]:
-    """管理应用生命周期"""
-    print("正在初始化数据库...")
-    models.Base.metadata.create_all(bind=engine)
-    print("数据库初始化完成")
-    
-    try:
+    """
+    管理应用生命周期。
+    数据库在第一次使用时才初始化 (database.init_db)，快照任务启动后会立即在后台触发，
+    因此服务器可以马上响应 initialize 和 tools/list，不必等待数据库连接。
+    memory 存储后端下快照任务直接读取内存仓库，不会连接数据库。
+    """
+    # 后台维护"今天值班"快照，'today' 查询直接从内存返回
+    async with day_snapshot_refresher():
         yield app_state
-    finally:
-        print("MCP服务器正在关闭...")
+
+MCP_TRANSPORTS = ("stdio", "streamable-http")
+
+
+def _transport_info(transport: str, host: str, port: int) -> dict:
+    """get_server_info 中展示的传输方式和端点。"""
+    endpoint = f"http://{host}:{port}/mcp" if transport == "streamable-http" else None
+    return {"transport": transport, "endpoint": endpoint}
+
+
+# 当前进程的传输方式，main() 按命令行参数更新；uvicorn的工作进程从环境变量中读取
+transport_info = _transport_info(MCP_TRANSPORT, MCP_HTTP_HOST, MCP_HTTP_PORT)
+
+class InstrumentedFastMCP(FastMCP):
+    """在每次工具调用外记录指标：耗时、SQL语句数与耗时、影响行数、响应大小 (见 src/metrics.py)。"""
+
+    async def call_tool(self, name: str, arguments: dict[str, Any]):
+        with metrics.track_call("mcp", name) as stats:
+            result = await super().call_tool(name, arguments)
+            # 声明了返回类型的工具返回 (内容块, 结构化结果)，否则只有内容块
+            content, structured = result if isinstance(result, tuple) else (result, None)
+            stats.payload_bytes = sum(
+                len(block.text.encode("utf-8")) for block in content if hasattr(block, "text")
+            )
+            if isinstance(structured, dict):
+                metrics.record_status(structured.get("status"))
+            return result
 
 # 创建MCP服务器实例
-mcp = FastMCP(
+mcp = InstrumentedFastMCP(
     name="值班表管理MCP服务器",
     lifespan=lifespan
 )
 
-def get_db_session() -> Session:
-    """获取数据库会话"""
-    return next(get_db())
-
 @mcp.tool()
-def import_schedule_upload(
+async def import_schedule_upload(
     file_content_b64: str,
-    ctx: Context
-) -> schemas.GeneralResponse:
+    ctx: Context,
+    streaming: bool = False,
+    mode: str = "replace",
+    force: bool = False
+) -> schemas.ImportScheduleResponse:
     """
-    通过Base64编码的文件内容智能导入值班表。此操作会覆盖所有旧数据。
+    通过Base64编码的文件内容智能导入值班表。默认会覆盖所有旧数据。
     
     Args:
         file_content_b64: Base64编码的Excel文件内容
+        streaming: 是否使用流式导入，适合包含多年数据的大文件
+        mode: 导入模式。"replace" 清空后全量导入；"merge" 按日期增量合并，只写入变化的记录并保留换班日志
+        force: 文件与上次成功导入的内容相同时默认跳过，设为 True 可强制重新导入
     
     Returns:
         包含操作结果的响应对象
     """
     try:
-        db = get_db_session()
-        result = services.import_schedule(db, file_content_b64=file_content_b64)
-        db.close()
-        return result
+        async with storage_scope() as db:
+            return await services.import_schedule_async(db, file_content_b64=file_content_b64, streaming=streaming, mode=mode, force=force)
     except Exception as e:
-        return schemas.GeneralResponse(
+        return schemas.ImportScheduleResponse(
             status="error",
             message=f"导入失败: {str(e)}"
         )
 
 @mcp.tool()
-def import_schedule_path(
+async def import_schedule_path(
     file_path: str,
-    ctx: Context
-) -> schemas.GeneralResponse:
+    ctx: Context,
+    streaming: bool = False,
+    mode: str = "replace",
+    force: bool = False
+) -> schemas.ImportScheduleResponse:
     """
-    通过服务器本地路径智能导入值班表。此操作会覆盖所有旧数据。
+    通过服务器本地路径智能导入值班表。默认会覆盖所有旧数据。
     
     Args:
         file_path: 服务器上Excel文件的绝对路径
+        streaming: 是否使用流式导入，适合包含多年数据的大文件
+        mode: 导入模式。"replace" 清空后全量导入；"merge" 按日期增量合并，只写入变化的记录并保留换班日志
+        force: 文件与上次成功导入的内容相同时默认跳过，设为 True 可强制重新导入
     
     Returns:
         包含操作结果的响应对象
     """
     try:
-        db = get_db_session()
-        result = services.import_schedule(db, file_path=file_path)
-        db.close()
-        return result
+        async with storage_scope() as db:
+            return await services.import_schedule_async(db, file_path=file_path, streaming=streaming, mode=mode, force=force)
     except Exception as e:
-        return schemas.GeneralResponse(
+        return schemas.ImportScheduleResponse(
             status="error",
             message=f"导入失败: {str(e)}"
         )
 
 @mcp.tool()
-def get_duty_employee(
+async def get_duty_employee(
     ctx: Context,
     duty_date: str = "today"
 ) -> schemas.GetDutyEmployeeResponse:
@@ -115,26 +155,79 @@ def get_duty_employee(
     查询指定日期的值班安排。
     
     Args:
-        duty_date: 查询日期，格式为 "YYYY-MM-DD"，或直接使用 "today" 查询当天
+        duty_date: 查询日期，格式为 "YYYY-MM-DD"，或使用相对日期：
+                   "today"/"tomorrow"/"yesterday"、"今天"/"明天"/"昨天"，
+                   以及星期名称如 "monday"、"周一" (按排班时区计算)
     
     Returns:
         包含值班安排详情的响应对象
     """
     try:
-        db = get_db_session()
-        result = services.get_duty_employee(db, duty_date_str=duty_date)
-        db.close()
-        return result
+        async with storage_scope() as db:
+            return await services.get_duty_employee_async(db, duty_date_str=duty_date)
     except Exception as e:
-        db = get_db_session()
-        db.close()
         return schemas.GetDutyEmployeeResponse(
             status="error",
             message=f"查询失败: {str(e)}"
         )
 
 @mcp.tool()
-def swap_duty_schedule(
+async def get_duty_range(
+    start_date: str,
+    end_date: str,
+    ctx: Context
+) -> schemas.GetDutyRangeResponse:
+    """
+    一次性查询一个日期范围内(含首尾)的值班安排，适合展示一周或一个月的排班表。
+    结果为列式结构：dates 与各专业列表按下标一一对应。
+    
+    Args:
+        start_date: 开始日期，格式为 "YYYY-MM-DD"
+        end_date: 结束日期，格式为 "YYYY-MM-DD"
+    
+    Returns:
+        包含范围内值班安排的响应对象
+    """
+    try:
+        async with storage_scope() as db:
+            return await services.get_duty_range_async(db, start_date_str=start_date, end_date_str=end_date)
+    except Exception as e:
+        return schemas.GetDutyRangeResponse(
+            status="error",
+            message=f"查询失败: {str(e)}"
+        )
+
+@mcp.tool()
+async def get_employee_duties(
+    employee_name: str,
+    ctx: Context,
+    start_date: str = "",
+    end_date: str = ""
+) -> schemas.GetEmployeeDutiesResponse:
+    """
+    查询某位员工的全部值班日期和专业 ("我哪天值班")。
+    
+    Args:
+        employee_name: 员工姓名
+        start_date: 可选，开始日期 (YYYY-MM-DD)，留空表示不限
+        end_date: 可选，结束日期 (YYYY-MM-DD)，留空表示不限
+    
+    Returns:
+        包含该员工值班列表的响应对象
+    """
+    try:
+        async with storage_scope() as db:
+            return await services.get_employee_duties_async(
+                db, employee_name=employee_name, start_date_str=start_date or None, end_date_str=end_date or None
+            )
+    except Exception as e:
+        return schemas.GetEmployeeDutiesResponse(
+            status="error",
+            message=f"查询失败: {str(e)}"
+        )
+
+@mcp.tool()
+async def swap_duty_schedule(
     employee1_date: str,
     employee1_name: str,
     employee2_date: str,
@@ -154,8 +247,6 @@ def swap_duty_schedule(
         包含换班操作详情的响应对象
     """
     try:
-        db = get_db_session()
-        
         # 构造请求对象
         request = schemas.SwapDutyScheduleByEmployeeRequest(
             swap_info_1=schemas.SwapByEmployeeInfo(
@@ -168,39 +259,114 @@ def swap_duty_schedule(
             )
         )
         
-        result = services.swap_duty_schedule(db, request=request)
-        db.close()
-        return result
+        async with storage_scope() as db:
+            return await services.swap_duty_schedule_async(db, request=request)
     except Exception as e:
-        db = get_db_session()
-        db.close()
         return schemas.SwapDutyScheduleResponse(
             status="error",
             message=f"换班失败: {str(e)}"
         )
 
 @mcp.tool()
-def get_swap_logs(ctx: Context) -> schemas.GetSwapLogsResponse:
+async def swap_duty_schedule_batch(
+    swaps: List[schemas.SwapDutyScheduleByEmployeeRequest],
+    ctx: Context
+) -> schemas.SwapDutyScheduleBatchResponse:
+    """
+    在一个事务中批量执行多组换班，适合一次性调整整月的排班。
+    各组换班按顺序执行；任意一组失败时整批都不会生效。
+    
+    Args:
+        swaps: 换班列表，每一项包含 swap_info_1 和 swap_info_2，
+               各自包含 duty_date (YYYY-MM-DD) 和 employee_name
+    
+    Returns:
+        包含每组换班详情的响应对象
+    """
+    try:
+        async with storage_scope() as db:
+            return await services.swap_duty_schedule_batch_async(
+                db, request=schemas.SwapDutyScheduleBatchRequest(swaps=swaps)
+            )
+    except Exception as e:
+        return schemas.SwapDutyScheduleBatchResponse(
+            status="error",
+            message=f"批量换班失败: {str(e)}"
+        )
+
+@mcp.tool()
+async def get_swap_logs(
+    ctx: Context,
+    limit: int = 50,
+    cursor: str = "",
+    start_date: str = "",
+    end_date: str = "",
+    employee_name: str = "",
+    format: str = "text"
+) -> schemas.GetSwapLogsResponse:
     """
-    查询当前数据版本下，所有的换班操作审计日志。
+    分页查询当前数据版本下的换班操作审计日志。
     日志会按时间倒序排列，最新的记录在最前面。
     
+    Args:
+        limit: 每页返回的日志条数 (默认 50，最多 500)
+        cursor: 上一页响应中的 next_cursor，留空表示从第一页开始
+        start_date: 可选，只返回对调日期不早于该日期的日志 (YYYY-MM-DD)
+        end_date: 可选，只返回对调日期不晚于该日期的日志 (YYYY-MM-DD)
+        employee_name: 可选，只返回与该员工有关的日志
+        format: "text"(默认，返回可读的句子) 或 "structured"(返回结构化字段，
+                只需要统计或原始字段时使用)
+    
     Returns:
-        包含换班日志列表的响应对象
+        包含本页换班日志和下一页游标的响应对象
     """
     try:
-        db = get_db_session()
-        result = services.get_swap_logs(db)
-        db.close()
-        return result
+        async with storage_scope() as db:
+            return await services.get_swap_logs_async(
+                db, limit=limit, cursor=cursor or None,
+                start_date_str=start_date or None, end_date_str=end_date or None,
+                employee_name=employee_name or None, format=format
+            )
     except Exception as e:
-        db = get_db_session()
-        db.close()
         return schemas.GetSwapLogsResponse(
             status="error",
             message=f"查询日志失败: {str(e)}"
         )
 
+@mcp.tool()
+async def get_server_metrics(ctx: Context) -> dict:
+    """
+    获取当前进程的调用指标：每个工具和接口的调用次数、错误数、平均/最大耗时、SQL语句数与耗时、影响行数和响应大小。
+    
+    Returns:
+        进程运行时长和按调用分组的指标
+    """
+    return metrics.snapshot()
+
+@mcp.tool()
+async def get_slow_queries(ctx: Context, limit: int = 20, clear: bool = False) -> dict:
+    """
+    管理工具：查看最近的慢查询 (耗时达到 SLOW_QUERY_THRESHOLD_MS 的SQL语句)。
+    每条记录包含语句、参数、耗时、发起查询的函数和所属的工具调用；
+    开启 SLOW_QUERY_EXPLAIN 时，duty_schedules / swap_logs 表上的慢 SELECT 还带有执行计划 (plan)。
+    
+    Args:
+        limit: 最多返回的条数，最新的在前，默认20
+        clear: 读取后是否清空缓冲区
+    
+    Returns:
+        慢查询阈值、累计条数和最近的慢查询记录
+    """
+    result = slow_queries.snapshot(limit)
+    if clear:
+        slow_queries.clear()
+    return result
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def prometheus_metrics(request: Request) -> PlainTextResponse:
+    """streamable-http 模式下以 Prometheus 文本格式导出指标。"""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @mcp.tool()
 async def get_server_info(ctx: Context) -> dict:
     """
@@ -226,36 +392,124 @@ async def get_server_info(ctx: Context) -> dict:
                 "name": "get_duty_employee",
                 "description": "查询指定日期的值班人员"
             },
+            {
+                "name": "get_duty_range",
+                "description": "查询一个日期范围内的值班安排"
+            },
+            {
+                "name": "get_employee_duties",
+                "description": "查询某位员工的全部值班日期"
+            },
             {
                 "name": "swap_duty_schedule",
                 "description": "交换两个员工的值班安排"
             },
+            {
+                "name": "swap_duty_schedule_batch",
+                "description": "在一个事务中批量换班"
+            },
             {
                 "name": "get_swap_logs",
-                "description": "查询换班操作日志"
+                "description": "分页查询换班操作日志"
+            },
+            {
+                "name": "get_server_metrics",
+                "description": "查询各工具的耗时、SQL语句数和响应大小等指标"
+            },
+            {
+                "name": "get_slow_queries",
+                "description": "管理工具：查看最近的慢查询及其执行计划"
             }
         ],
-        "transport": "streamable-http",
-        "endpoint": "http://localhost:8000/mcp"
+        **transport_info,
+        "storage_backend": STORAGE_BACKEND,
+        "database_pool": get_pool_stats()
     }
 
-def main():
-    """启动MCP服务器"""
-    print("="*60)
-    print("正在启动值班表管理MCP服务器...")
-    print("传输方式: stdio (标准输入输出)")
-    print("="*60)
-    print("服务器启动后可通过MCP客户端连接使用")
-    print("支持的工具:")
-    print("  - import_schedule_upload: 导入排班表(Base64)")
-    print("  - import_schedule_path: 导入排班表(文件路径)")
-    print("  - get_duty_employee: 查询值班人员")
-    print("  - swap_duty_schedule: 交换值班安排")
-    print("  - get_swap_logs: 查询换班日志")
-    print("="*60)
-    
-    # 使用默认的stdio传输方式，这是最兼容的方式
-    mcp.run()
+def main(argv=None):
+    """
+    启动MCP服务器。
+    默认使用stdio传输方式，由MCP客户端以子进程方式启动；
+    --transport streamable-http 时作为HTTP服务运行，可通过 --workers 启动多个工作进程。
+    命令行参数的默认值来自环境变量 (MCP_TRANSPORT、MCP_HTTP_HOST 等)。
+    """
+    parser = argparse.ArgumentParser(description="值班表管理MCP服务器")
+    parser.add_argument("--transport", choices=MCP_TRANSPORTS, default=MCP_TRANSPORT, help="传输方式")
+    parser.add_argument("--host", default=MCP_HTTP_HOST, help="HTTP模式的监听地址")
+    parser.add_argument("--port", type=int, default=MCP_HTTP_PORT, help="HTTP模式的监听端口")
+    parser.add_argument("--workers", type=int, default=MCP_HTTP_WORKERS, help="HTTP模式的工作进程数")
+    parser.add_argument("--with-api", action="store_true", default=MCP_HTTP_WITH_API,
+                        help="HTTP模式下同时提供FastAPI接口")
+    args = parser.parse_args(argv)
+
+    if STORAGE_BACKEND not in STORAGE_BACKENDS:
+        parser.error(f"不支持的存储后端 STORAGE_BACKEND={STORAGE_BACKEND!r}，可选值为: {', '.join(STORAGE_BACKENDS)}")
+    if args.transport == "streamable-http" and args.workers > 1:
+        if STORAGE_BACKEND == "memory":
+            parser.error("memory 存储后端的数据保存在各自的进程中，不能与多个工作进程一起使用")
+        if not MCP_STATELESS_HTTP:
+            parser.error("多个工作进程需要开启无状态模式 (MCP_STATELESS_HTTP=true)")
+        if STORAGE_BACKEND == "database":
+            # MySQL不可用时每个工作进程会各自使用一个SQLite内存后备库，
+            # 一个进程导入的数据在其他进程中查不到，因此启动前先确认数据库可以连接
+            from src import database
+            database.init_db()
+            if not database.db_available:
+                parser.error("无法连接MySQL数据库：SQLite内存后备库不能在多个工作进程之间共享，请检查数据库配置或使用单个工作进程")
+        if CACHE_TTL <= 0:
+            # 其他工作进程的写入只能靠缓存过期感知
+            os.environ["CACHE_TTL"] = str(MULTI_WORKER_CACHE_TTL)
+
+    transport_info.update(_transport_info(args.transport, args.host, args.port))
+
+    # 标准输出是stdio传输方式的协议通道，提示信息统一输出到标准错误
+    def log(message: str = "") -> None:
+        print(message, file=sys.stderr)
+
+    log("="*60)
+    log("正在启动值班表管理MCP服务器...")
+    if args.transport == "stdio":
+        log("传输方式: stdio (标准输入输出)")
+    else:
+        log(f"传输方式: streamable-http，端点 {transport_info['endpoint']}，工作进程数 {args.workers}")
+        log(f"Prometheus指标: http://{args.host}:{args.port}/metrics")
+        if args.with_api:
+            log(f"FastAPI接口文档: http://{args.host}:{args.port}/docs")
+    log("="*60)
+    log("服务器启动后可通过MCP客户端连接使用")
+    log("支持的工具:")
+    log("  - import_schedule_upload: 导入排班表(Base64)")
+    log("  - import_schedule_path: 导入排班表(文件路径)")
+    log("  - get_duty_employee: 查询值班人员")
+    log("  - get_duty_range: 查询日期范围内的值班安排")
+    log("  - get_employee_duties: 查询员工的值班日期")
+    log("  - swap_duty_schedule: 交换值班安排")
+    log("  - swap_duty_schedule_batch: 批量交换值班安排")
+    log("  - get_swap_logs: 查询换班日志")
+    log("  - get_server_metrics: 查询调用指标")
+    log("  - get_slow_queries: 查看慢查询日志")
+    log("="*60)
+
+    if args.transport == "stdio":
+        mcp.run()
+    else:
+        import uvicorn
+
+        if args.workers > 1:
+            # 工作进程重新导入模块并调用工厂函数，命令行参数通过环境变量传递
+            os.environ.update({
+                "MCP_TRANSPORT": args.transport,
+                "MCP_HTTP_HOST": args.host,
+                "MCP_HTTP_PORT": str(args.port),
+                "MCP_HTTP_WITH_API": "true" if args.with_api else "false",
+            })
+            uvicorn.run("src.http_app:create_app", factory=True, host=args.host, port=args.port, workers=args.workers)
+        else:
+            from src.http_app import create_app
+            uvicorn.run(create_app(with_api=args.with_api, host=args.host), host=args.host, port=args.port)
+    log("MCP服务器已关闭")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    # 通过 src.mcp_server 调用，使HTTP模式下 src.http_app 使用的是同一个模块实例
+    from src.mcp_server import main as _main
+    _main()
@@ -0,0 +1,254 @@
+"""
+进程内的调用指标：每个MCP工具和FastAPI路由的耗时、SQL语句数与耗时、影响行数、响应大小。
+
+- MCP工具由 mcp_server 中的 InstrumentedFastMCP 统一记录，FastAPI路由由 MetricsMiddleware 记录
+- SQL统计来自数据库引擎的 before/after_cursor_execute 事件 (database 创建引擎时调用 instrument_engine)，
+  通过 contextvars 归属到当前正在处理的调用；不属于任何调用的语句 (例如快照后台任务) 记为 background
+- 影响行数取自DB-API的 cursor.rowcount，只对 INSERT/UPDATE/DELETE 有意义，SELECT 通常不计入
+- 错误数：抛出异常、HTTP状态码 >= 400，或响应的 status 为 error (record_status)。
+  not_found 表示没有匹配的数据，是正常的查询结果，MCP工具和HTTP接口都不计为错误
+
+指标以 Prometheus 文本格式 (render_prometheus，对应 /metrics) 和字典 (snapshot，对应 get_server_metrics 工具) 导出。
+每个进程各自统计，多个工作进程时由 Prometheus 分别抓取后汇总。
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from sqlalchemy import event
+
+# 请求耗时直方图的分桶上限 (秒)
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 不属于任何调用的SQL语句记在这个调用名下
+BACKGROUND = ("background", "")
+# 响应中的 status 为这些值时调用计为错误
+ERROR_STATUSES = frozenset({"error"})
+
+
+class CallStats:
+    """一次调用过程中累计的SQL统计，以及调用结束时填写的名称、状态和响应大小。"""
+
+    __slots__ = ("name", "sql_statements", "sql_seconds", "rows", "payload_bytes", "status")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.payload_bytes = 0
+        self.status = "ok"
+
+
+class _Series:
+    """同一个 (类型, 名称) 下所有调用的累计值。"""
+
+    __slots__ = ("calls", "errors", "seconds", "max_seconds", "buckets",
+                 "sql_statements", "sql_seconds", "rows", "payload_bytes")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.payload_bytes = 0
+
+
+_current: contextvars.ContextVar[Optional[CallStats]] = contextvars.ContextVar("metrics_call", default=None)
+_lock = threading.Lock()
+_series: Dict[Tuple[str, str], _Series] = {}
+_started_at = time.time()
+
+
+def _get_series(key: Tuple[str, str]) -> _Series:
+    """在持有锁时调用。"""
+    series = _series.get(key)
+    if series is None:
+        series = _series[key] = _Series()
+    return series
+
+
+@contextmanager
+def track_call(kind: str, name: str) -> Iterator[CallStats]:
+    """
+    记录一次调用 (kind 为 mcp 或 http，name 为工具名或路由)。
+    调用方可以在退出前修改 stats.name、stats.status 和 stats.payload_bytes；抛出异常时状态记为 exception。
+    """
+    stats = CallStats(name)
+    token = _current.set(stats)
+    start = time.perf_counter()
+    try:
+        yield stats
+    except BaseException:
+        stats.status = "exception"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _current.reset(token)
+        with _lock:
+            series = _get_series((kind, stats.name))
+            series.calls += 1
+            if stats.status != "ok":
+                series.errors += 1
+            series.seconds += elapsed
+            series.max_seconds = max(series.max_seconds, elapsed)
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if elapsed <= bound:
+                    series.buckets[index] += 1
+                    break
+            series.sql_statements += stats.sql_statements
+            series.sql_seconds += stats.sql_seconds
+            series.rows += stats.rows
+            series.payload_bytes += stats.payload_bytes
+
+
+def record_status(status: Optional[str]) -> None:
+    """按响应的 status 字段标记当前调用是否出错，MCP工具和HTTP接口使用同一套分类。"""
+    stats = _current.get()
+    if stats is not None and status in ERROR_STATUSES:
+        stats.status = status
+
+
+def current_call() -> Optional[str]:
+    """当前正在记录的调用名称 (工具名或路由)，不在任何调用中时返回 None。"""
+    stats = _current.get()
+    return stats.name if stats is not None else None
+
+
+# --- SQLAlchemy 引擎事件 ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_query_start"].pop()
+    rows = max(getattr(cursor, "rowcount", -1) or 0, 0)
+    stats = _current.get()
+    if stats is not None:
+        stats.sql_statements += 1
+        stats.sql_seconds += elapsed
+        stats.rows += rows
+        return
+    with _lock:
+        series = _get_series(BACKGROUND)
+        series.sql_statements += 1
+        series.sql_seconds += elapsed
+        series.rows += rows
+
+
+def instrument_engine(engine) -> None:
+    """为同步引擎 (或异步引擎的 sync_engine) 注册SQL统计事件。"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# --- FastAPI / Starlette 中间件 ---
+
+class MetricsMiddleware:
+    """记录每个HTTP请求的指标，按匹配到的路由模板 (例如 /get_duty_employee/{duty_date}) 归类。"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_call("http", scope["path"]) as stats:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start" and message["status"] >= 400:
+                    stats.status = str(message["status"])
+                elif message["type"] == "http.response.body":
+                    stats.payload_bytes += len(message.get("body", b""))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # 路由匹配后 scope 中会带上 route，用路由模板代替实际路径，避免路径参数产生大量序列
+                route = scope.get("route")
+                path = getattr(route, "path", None) or "unmatched"
+                stats.name = f"{scope['method']} {path}"
+
+
+# --- 导出 ---
+
+def snapshot() -> dict:
+    """当前进程的指标，供 get_server_metrics 工具返回。"""
+    with _lock:
+        items = sorted(_series.items())
+        calls = [
+            {
+                "kind": kind,
+                "name": name,
+                "calls": series.calls,
+                "errors": series.errors,
+                "avg_ms": round(series.seconds / series.calls * 1000, 3) if series.calls else 0.0,
+                "max_ms": round(series.max_seconds * 1000, 3),
+                "sql_statements": series.sql_statements,
+                "avg_sql_statements": round(series.sql_statements / series.calls, 2) if series.calls else 0.0,
+                "sql_ms": round(series.sql_seconds * 1000, 3),
+                "rows": series.rows,
+                "payload_bytes": series.payload_bytes,
+            }
+            for (kind, name), series in items
+        ]
+    return {"uptime_seconds": round(time.time() - _started_at, 1), "calls": calls}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus() -> str:
+    """以 Prometheus 文本格式 (0.0.4) 导出当前进程的指标。"""
+    lines = [
+        "# HELP duty_process_start_time_seconds 进程启动时间 (Unix时间戳)",
+        "# TYPE duty_process_start_time_seconds gauge",
+        f"duty_process_start_time_seconds {_started_at}",
+    ]
+    with _lock:
+        items = sorted(_series.items())
+        counters = (
+            ("duty_calls_total", "调用次数", lambda s: s.calls),
+            ("duty_call_errors_total", "返回错误或抛出异常的调用次数", lambda s: s.errors),
+            ("duty_sql_statements_total", "执行的SQL语句数", lambda s: s.sql_statements),
+            ("duty_sql_seconds_total", "SQL执行耗时 (秒)", lambda s: s.sql_seconds),
+            ("duty_sql_rows_total", "SQL影响的行数", lambda s: s.rows),
+            ("duty_response_bytes_total", "响应大小 (字节)", lambda s: s.payload_bytes),
+        )
+        for metric, help_text, value in counters:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for (kind, name), series in items:
+                lines.append(f'{metric}{{kind="{kind}",name="{_escape(name)}"}} {value(series)}')
+
+        metric = "duty_call_duration_seconds"
+        lines.append(f"# HELP {metric} 调用耗时 (秒)")
+        lines.append(f"# TYPE {metric} histogram")
+        for (kind, name), series in items:
+            if series.calls == 0:
+                continue
+            labels = f'kind="{kind}",name="{_escape(name)}"'
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS, series.buckets):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {series.calls}')
+            lines.append(f"{metric}_sum{{{labels}}} {series.seconds}")
+            lines.append(f"{metric}_count{{{labels}}} {series.calls}")
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    """清空全部指标 (用于测试)。"""
+    with _lock:
+        _series.clear()
@@ -1,5 +1,7 @@
-from sqlalchemy import Column, Integer, String, Date, DateTime, func
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, Index, UniqueConstraint, func
+from sqlalchemy.dialects import mysql
 from .database import Base
+from .dates import schedule_now
 import datetime
 
 class DutySchedule(Base):
@@ -18,18 +20,55 @@ class DutySchedule(Base):
     employee_cs_fault = Column(String(255), nullable=True, doc="CS专业故障值班")
     employee_ps_professional = Column(String(255), nullable=True, doc="PS专业值班")
 
+    # 行版本号：ORM 每次更新时自动加一，并以 "WHERE version = 旧版本" 的方式做比较并交换，
+    # 用于检测并发换班造成的覆盖。批量/Core 语句更新本表时需要自行递增该列。
+    version = Column(Integer, nullable=False, default=1, server_default="1", doc="行版本号，用于乐观并发控制")
+
+    __mapper_args__ = {"version_id_col": version}
+
     def __repr__(self):
         return (f"<DutySchedule(date='{self.duty_date}', "
                 f"full='{self.employee_full_professional}', "
                 f"cs_complaint='{self.employee_cs_complaint}')>")
 
 
+class DutyAssignment(Base):
+    """
+    值班分配索引表：把 DutySchedule 的四个角色列展开为 (员工, 日期, 角色) 行。
+    由导入和换班操作同步维护，用于按员工快速查询其全部值班日期，
+    避免对 duty_schedules 的四个未建索引的角色列做全表扫描。
+    """
+    __tablename__ = "duty_assignments"
+    __table_args__ = (
+        Index("ix_duty_assignments_employee_date", "employee", "duty_date"),
+        UniqueConstraint("duty_date", "role_field", name="uq_duty_assignments_date_role"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    employee = Column(String(255), nullable=False, comment="值班人员姓名")
+    duty_date = Column(Date, nullable=False, comment="值班日期")
+    role_field = Column(String(64), nullable=False, comment="角色对应的 duty_schedules 字段名")
+
+
+def _swap_log_time() -> datetime.datetime:
+    """换班日志的记录时间：排班时区的当地时间 (不带时区信息)。"""
+    return schedule_now().replace(tzinfo=None)
+
+
 class SwapLog(Base):
     """用于记录换班操作的审计日志表。"""
     __tablename__ = "swap_logs"
+    __table_args__ = (
+        # 日志按 (log_time, id) 倒序做键集分页，每一页都是该索引上的一次有界范围扫描
+        Index("ix_swap_logs_log_time_id", "log_time", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    log_time = Column(DateTime(timezone=True), server_default=func.now(), comment="日志记录时间")
+    # 统一由应用写入排班时区 (SCHEDULE_TIMEZONE) 的当地时间，不带时区信息，精确到微秒，
+    # 与"今天"使用同一个时钟，也与分页游标中的时间格式一致。
+    # MySQL 的 DATETIME 默认不保存小数秒，需要 DATETIME(6)；同一秒内的顺序最终由 id 保证。
+    # 旧版本由数据库时钟写入的日志在升级表结构时换算到排班时区 (见 database._MYSQL_COLUMN_TYPE_UPGRADES)
+    log_time = Column(DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql"), default=_swap_log_time, comment="日志记录时间")
     
     date1 = Column(Date, nullable=False, comment="第一个对调日期")
     role1 = Column(String(255), nullable=False, comment="第一个对调的专业")
@@ -40,3 +79,20 @@ class SwapLog(Base):
     role2 = Column(String(255), nullable=False, comment="第二个对调的专业")
     original_employee2 = Column(String(255), nullable=True, comment="第二个日期的原值班员")
     new_employee2 = Column(String(255), nullable=True, comment="第二个日期的新值班员 (即原date1的值班员)")
+
+
+class ImportMetadata(Base):
+    """
+    记录最近一次成功导入的文件指纹，用于识别重复导入。
+    表中最多只有一行 (id=1)。
+    """
+    __tablename__ = "import_metadata"
+
+    id = Column(Integer, primary_key=True)
+    content_hash = Column(String(64), nullable=False, comment="导入文件内容的SHA-256")
+    source_path = Column(String(1024), nullable=True, comment="通过路径导入时的文件路径")
+    file_size = Column(BigInteger, nullable=True, comment="文件大小(字节)")
+    file_mtime_ns = Column(BigInteger, nullable=True, comment="通过路径导入时文件的修改时间(纳秒)")
+    mode = Column(String(32), nullable=True, comment="导入模式")
+    imported_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), comment="导入时间")
+
@@ -0,0 +1,207 @@
+"""
+排班数据的存储接口 (repository)。
+
+services.py 中的查询和全量导入通过 ScheduleRepository 读写排班数据，不直接依赖具体的存储：
+- 默认 (STORAGE_BACKEND=database)：基于SQLAlchemy会话的实现 (services.SqlAlchemyScheduleRepository)，
+  数据存放在MySQL (或后备的SQLite) 中，支持全部功能。
+- STORAGE_BACKEND=memory：纯内存实现 InMemoryScheduleRepository，
+  以有序日期数组加字典保存排班，查询耗时为微秒级，并可把快照持久化到磁盘。
+  适合以查询为主的小型部署，也便于在没有数据库的环境中测试。
+  内存后端只支持查询和全量(replace)导入，换班、换班日志等需要数据库的功能会返回错误提示。
+
+具体存储之间的差异由存储类自己声明，服务层不判断存储的类型：
+- cache：该存储对应的进程内缓存，保存 'today' 快照等
+- session：换班、换班日志、增量导入等需要数据库事务的操作使用的会话，不支持这些操作的存储为 None
+
+storage_scope / storage_session_scope 按 STORAGE_BACKEND 提供存储，memory 时完全不连接数据库。
+
+排班行统一表示为 {角色字段名: 值班人员} 的字典。
+"""
+
+import bisect
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager, contextmanager
+from datetime import date
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .cache import DutyScheduleCache
+from .config import MEMORY_SNAPSHOT_PATH, STORAGE_BACKEND, STORAGE_BACKENDS
+from .database import async_session_scope, session_scope
+
+# 快照文件格式的版本号，格式变化时递增
+SNAPSHOT_FORMAT = 1
+
+
+class ScheduleRepository(ABC):
+    """排班数据的存储接口。"""
+
+    # 该存储对应的进程内缓存 (单日查询、'today' 快照)
+    cache: DutyScheduleCache
+    # 需要数据库事务的操作 (换班、换班日志、增量导入) 使用的会话，不支持这些操作时为 None
+    session: Optional[Session] = None
+
+    @abstractmethod
+    def get_row(self, duty_date: date) -> Optional[dict]:
+        """返回该日期的排班行，不存在时返回 None。"""
+
+    @abstractmethod
+    def summary(self) -> Tuple[bool, Optional[date]]:
+        """返回 (是否为空, 排班表的最大日期)。"""
+
+    @abstractmethod
+    def range_rows(self, start_date: date, end_date: date) -> List[Tuple[date, dict]]:
+        """按日期升序返回范围内(含首尾)的 (日期, 排班行)。"""
+
+    @abstractmethod
+    def employee_duties(self, employee_name: str, start_date: Optional[date] = None,
+                        end_date: Optional[date] = None) -> List[Tuple[date, str]]:
+        """按 (日期, 角色字段) 升序返回某位员工的全部 (日期, 角色字段)。"""
+
+    @abstractmethod
+    def replace_all(self, rows: List[dict]) -> int:
+        """
+        用新数据替换全部排班 (每行包含 duty_date 和各角色字段)。
+        返回被替换掉的旧记录数。
+        """
+
+
+class InMemoryScheduleRepository(ScheduleRepository):
+    """
+    纯内存的排班存储：有序的日期数组 + {日期: 排班行} 字典。
+    单日查询是一次字典查找，范围查询是两次二分查找加切片。
+    指定 snapshot_path 时，创建时从快照文件加载，每次替换数据后写回快照。
+    """
+
+    def __init__(self, snapshot_path: Optional[str] = None):
+        self._lock = threading.Lock()
+        # (有序日期数组, {日期: 排班行})，作为一个整体替换
+        self._data: Tuple[List[date], Dict[date, dict]] = ([], {})
+        # 数据只会在本对象中变化，替换数据时主动失效，因此不需要按时间过期
+        self.cache = DutyScheduleCache(ttl=0)
+        self.snapshot_path = snapshot_path
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load()
+
+    def get_row(self, duty_date: date) -> Optional[dict]:
+        row = self._data[1].get(duty_date)
+        return dict(row) if row is not None else None
+
+    def summary(self) -> Tuple[bool, Optional[date]]:
+        dates = self._data[0]
+        return (False, dates[-1]) if dates else (True, None)
+
+    def range_rows(self, start_date: date, end_date: date) -> List[Tuple[date, dict]]:
+        dates, rows = self._data
+        low = bisect.bisect_left(dates, start_date)
+        high = bisect.bisect_right(dates, end_date)
+        return [(day, dict(rows[day])) for day in dates[low:high]]
+
+    def employee_duties(self, employee_name: str, start_date: Optional[date] = None,
+                        end_date: Optional[date] = None) -> List[Tuple[date, str]]:
+        dates, rows = self._data
+        low = bisect.bisect_left(dates, start_date) if start_date else 0
+        high = bisect.bisect_right(dates, end_date) if end_date else len(dates)
+        return [
+            (day, field)
+            for day in dates[low:high]
+            for field, employee in sorted(rows[day].items())
+            if employee == employee_name
+        ]
+
+    def replace_all(self, rows: List[dict]) -> int:
+        new_rows = {}
+        for row in rows:
+            values = dict(row)
+            new_rows[values.pop('duty_date')] = values
+        with self._lock:
+            replaced = len(self._data[1])
+            # 整体替换引用，读取方不需要加锁也不会看到一半的数据
+            self._data = (sorted(new_rows), new_rows)
+            if self.snapshot_path:
+                self.save()
+        self.cache.invalidate()
+        return replaced
+
+    # --- 快照持久化 ---
+
+    def save(self) -> None:
+        """把当前数据写入快照文件。先写临时文件再重命名，避免留下不完整的快照。"""
+        dates, rows = self._data
+        payload = {
+            "format": SNAPSHOT_FORMAT,
+            "rows": [dict(rows[day], duty_date=day.isoformat()) for day in dates],
+        }
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.snapshot_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(temp_path, self.snapshot_path)
+
+    def load(self) -> None:
+        """从快照文件加载数据。"""
+        with open(self.snapshot_path, encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"不支持的快照格式: {payload.get('format')!r}")
+        rows = {}
+        for row in payload["rows"]:
+            values = dict(row)
+            rows[date.fromisoformat(values.pop("duty_date"))] = values
+        with self._lock:
+            self._data = (sorted(rows), rows)
+        self.cache.invalidate()
+
+
+_memory_repository: Optional[InMemoryScheduleRepository] = None
+_memory_repository_lock = threading.Lock()
+
+
+def get_memory_repository() -> InMemoryScheduleRepository:
+    """进程内共享的内存仓库，第一次使用时从 MEMORY_SNAPSHOT_PATH 加载快照。"""
+    global _memory_repository
+    with _memory_repository_lock:
+        if _memory_repository is None:
+            _memory_repository = InMemoryScheduleRepository(MEMORY_SNAPSHOT_PATH)
+        return _memory_repository
+
+
+def storage_backend() -> str:
+    """返回配置的存储后端，不支持的值给出明确的错误。"""
+    if STORAGE_BACKEND not in STORAGE_BACKENDS:
+        raise ValueError(f"不支持的存储后端 STORAGE_BACKEND={STORAGE_BACKEND!r}，可选值为: {', '.join(STORAGE_BACKENDS)}")
+    return STORAGE_BACKEND
+
+
+@asynccontextmanager
+async def storage_scope() -> AsyncIterator:
+    """
+    按 STORAGE_BACKEND 提供服务层使用的存储：
+    database 时为异步数据库会话，memory 时为内存仓库 (不连接数据库)。
+    """
+    if storage_backend() == "memory":
+        yield get_memory_repository()
+        return
+    async with async_session_scope() as db:
+        yield db
+
+
+@contextmanager
+def storage_session_scope() -> Iterator:
+    """storage_scope 的同步版本 (供后台快照任务使用)：database 时为数据库会话，memory 时为内存仓库。"""
+    if storage_backend() == "memory":
+        yield get_memory_repository()
+        return
+    with session_scope() as db:
+        yield db
+
+
+# FastAPI 依赖项
+async def get_storage():
+    async with storage_scope() as db:
+        yield db
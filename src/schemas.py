@@ -19,6 +19,18 @@ class GeneralResponse(BaseModel):
 class ImportFromPathRequest(BaseModel):
     """通过路径导入文件的请求体模型。"""
     file_path: str = Field(..., description="服务器上Excel文件的绝对路径。")
+    streaming: bool = Field(False, description="是否使用流式导入。适合包含多年数据的大文件，内存占用不随文件大小增长。")
+    mode: str = Field("replace", description="导入模式: 'replace' 清空后全量导入；'merge' 按日期增量合并，只写入变化的记录并保留换班日志。")
+    force: bool = Field(False, description="即使文件与上次成功导入的内容相同也强制重新导入。")
+
+class ImportScheduleResponse(GeneralResponse):
+    """导入值班表的响应模型，包含各类变更的条数。"""
+    mode: Optional[str] = Field(None, description="本次使用的导入模式 (replace 或 merge)")
+    inserted: int = Field(0, description="新增的排班记录数")
+    updated: int = Field(0, description="内容发生变化而被更新的排班记录数")
+    deleted: int = Field(0, description="被删除的排班记录数")
+    unchanged: int = Field(0, description="内容未变化而跳过的排班记录数")
+    skipped: bool = Field(False, description="文件与上次成功导入的内容完全相同，本次导入被跳过")
 
 # =================================================================
 #             工具: get_duty_employee 的响应模型
@@ -36,6 +48,41 @@ class GetDutyEmployeeResponse(GeneralResponse):
     duty_date: Optional[date] = Field(None, description="查询的值班日期")
     schedule: Optional[DutyEmployee] = Field(None, description="当天的值班安排详情")
 
+# =================================================================
+#             工具: get_duty_range 的响应模型
+# =================================================================
+
+class GetDutyRangeResponse(GeneralResponse):
+    """
+    按日期范围查询值班安排的响应模型。
+    采用列式结构：各列表按下标一一对应，第 i 个元素都属于 dates[i] 这一天。
+    """
+    start_date: Optional[date] = Field(None, description="查询范围的开始日期(含)")
+    end_date: Optional[date] = Field(None, description="查询范围的结束日期(含)")
+    count: int = Field(0, description="范围内找到的排班天数")
+    dates: List[date] = Field([], description="有排班记录的日期，按时间升序")
+    full_professional: List[Optional[str]] = Field([], description="全专业值班")
+    cs_complaint: List[Optional[str]] = Field([], description="CS专业投诉值班")
+    cs_fault: List[Optional[str]] = Field([], description="CS专业故障值班")
+    ps_professional: List[Optional[str]] = Field([], description="PS专业值班")
+
+# =================================================================
+#             工具: get_employee_duties 的响应模型
+# =================================================================
+
+class EmployeeDuty(BaseModel):
+    """某位员工的一次值班。"""
+    duty_date: date = Field(..., description="值班日期")
+    role: str = Field(..., description="值班专业")
+
+class GetEmployeeDutiesResponse(GeneralResponse):
+    """按员工查询值班日期的响应模型。"""
+    employee_name: Optional[str] = Field(None, description="查询的员工姓名")
+    start_date: Optional[date] = Field(None, description="查询范围的开始日期(含)")
+    end_date: Optional[date] = Field(None, description="查询范围的结束日期(含)")
+    count: int = Field(0, description="找到的值班次数")
+    duties: List[EmployeeDuty] = Field([], description="按日期升序排列的值班列表")
+
 # =================================================================
 #             工具: swap_duty_schedule 的响应模型
 # =================================================================
@@ -62,6 +109,20 @@ class SwapDutyScheduleResponse(GeneralResponse):
     swap1: Optional[SwapInfo] = Field(None, description="第一次对调的详情")
     swap2: Optional[SwapInfo] = Field(None, description="第二次对调的详情")
 
+class SwapDutyScheduleBatchRequest(BaseModel):
+    """批量换班的请求体模型。各组换班按顺序执行，后一组基于前一组之后的结果。"""
+    swaps: List[SwapDutyScheduleByEmployeeRequest] = Field(..., description="要执行的换班列表")
+
+class SwapPairInfo(BaseModel):
+    """一组换班中两次对调的详情。"""
+    swap1: SwapInfo = Field(..., description="第一次对调的详情")
+    swap2: SwapInfo = Field(..., description="第二次对调的详情")
+
+class SwapDutyScheduleBatchResponse(GeneralResponse):
+    """批量换班的响应模型。"""
+    swap_count: int = Field(0, description="成功执行的换班组数")
+    swaps: List[SwapPairInfo] = Field([], description="每组换班的详情，顺序与请求一致")
+
 # =================================================================
 #                 根路径欢迎页模型
 # =================================================================
@@ -75,7 +136,26 @@ class WelcomeMessage(BaseModel):
 #                 换班审计日志模型
 # =================================================================
 
+class SwapLogEntry(BaseModel):
+    """结构化的单条换班日志，字段与 swap_logs 表一致。"""
+    id: int = Field(..., description="日志ID")
+    log_time: Optional[datetime] = Field(None, description="日志记录时间")
+    date1: date = Field(..., description="第一个对调日期")
+    role1: str = Field(..., description="第一个对调的专业")
+    original_employee1: Optional[str] = Field(None, description="第一个日期的原值班员")
+    new_employee1: Optional[str] = Field(None, description="第一个日期的新值班员")
+    date2: date = Field(..., description="第二个对调日期")
+    role2: str = Field(..., description="第二个对调的专业")
+    original_employee2: Optional[str] = Field(None, description="第二个日期的原值班员")
+    new_employee2: Optional[str] = Field(None, description="第二个日期的新值班员")
+
 class GetSwapLogsResponse(GeneralResponse):
-    """获取换班日志列表的响应模型。"""
-    log_count: int = Field(0, description="返回的日志条数")
-    logs: List[str] = Field([], description="格式化为人类可读字符串的换班日志列表。") 
\ No newline at end of file
+    """
+    获取换班日志列表的响应模型。日志按时间倒序分页返回。
+    format 为 "text" 时填充 logs，为 "structured" 时填充 entries。
+    """
+    format: str = Field("text", description="日志的返回格式：text 或 structured")
+    log_count: int = Field(0, description="本页返回的日志条数")
+    logs: List[str] = Field([], description="格式化为人类可读字符串的换班日志列表 (text 格式)。")
+    entries: List[SwapLogEntry] = Field([], description="结构化的换班日志列表 (structured 格式)。")
+    next_cursor: Optional[str] = Field(None, description="下一页的游标，没有更多日志时为空")
\ No newline at end of file
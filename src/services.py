@@ -1,13 +1,33 @@
-import pandas as pd
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy import and_, bindparam, delete, func, insert, or_, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import date, datetime, timedelta
 import base64
+import binascii
+import hashlib
+import re
 import os
 import io
-from typing import Optional
+import asyncio
+import itertools
+import random
+import time
+import unicodedata
+from typing import List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+# pandas(连带numpy)和openpyxl只在导入Excel时才用到，在函数内部按需导入，
+# 避免每个只做查询的MCP stdio进程在启动时都加载它们
 
 from . import models, schemas
+from .cache import MISSING, DaySnapshot, DutyScheduleCache, get_cache
+from .dates import is_relative_date, resolve_date, schedule_today
+from .repository import ScheduleRepository
+from .config import (
+    IMPORT_BATCH_SIZE, SWAP_MAX_RETRIES, SWAP_RETRY_BACKOFF, SWAP_LOG_PAGE_SIZE, SWAP_LOG_MAX_PAGE_SIZE,
+)
 
 # --- 内部辅助函数 ---
 
@@ -43,86 +63,830 @@ ROLE_TO_FIELD_MAP = {
 }
 FIELD_TO_ROLE_MAP = {v: k for k, v in ROLE_TO_FIELD_MAP.items()} # 反向映射，方便使用
 
-def _read_and_process_excel(db: Session, excel_source) -> schemas.GeneralResponse:
-    """内部核心函数，读取Excel并处理数据，返回结构化响应。"""
+class ExcelFormatError(ValueError):
+    """Excel文件格式不符合要求(例如列数不足)。异常消息直接作为响应消息返回给用户。"""
+
+
+# Excel日期序列号的起点 (与 openpyxl.utils.datetime.from_excel 一致)
+EXCEL_EPOCH = "1899-12-30"
+# 可以批量转换的日期文本，其他格式逐个交给 _coerce_date，两种导入方式接受的格式才能保持一致
+ISO_DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+# 导入时最多列出的行级警告条数，其余只给出数量
+MAX_IMPORT_WARNINGS = 50
+# 报错时最多列出的问题行数
+MAX_IMPORT_ERROR_ROWS = 10
+
+
+class _ImportWarnings:
+    """收集导入时的行级警告，最多保留 MAX_IMPORT_WARNINGS 条，其余只计数。"""
+
+    def __init__(self):
+        self.messages: List[str] = []
+        self.omitted = 0
+
+    def add(self, message: str) -> None:
+        if len(self.messages) < MAX_IMPORT_WARNINGS:
+            self.messages.append(message)
+        else:
+            self.omitted += 1
+
+    def as_list(self) -> List[str]:
+        if self.omitted:
+            return self.messages + [f"另有 {self.omitted} 条警告未列出。"]
+        return list(self.messages)
+
+
+def _rows_error(title: str, items: List[str]) -> "ExcelFormatError":
+    """列出问题行的格式错误，行数过多时只列出前 MAX_IMPORT_ERROR_ROWS 条。"""
+    listed = "；".join(items[:MAX_IMPORT_ERROR_ROWS])
+    more = f"；等共 {len(items)} 处" if len(items) > MAX_IMPORT_ERROR_ROWS else ""
+    return ExcelFormatError(f"{title}：{listed}{more}。请修正后重新导入。")
+
+
+def _gap_warning(previous: date, current: date) -> str:
+    missing = (current - previous).days - 1
+    return f"日期不连续：{previous} 与 {current} 之间缺少 {missing} 天的排班。"
+
+
+def _missing_roles_warning(row_number: int, duty_date: date, roles: List[str]) -> str:
+    return f"第{row_number}行 ({duty_date})：{'、'.join(roles)}为空。"
+
+
+def _parse_excel(excel_source):
+    """
+    读取Excel，校验并转换为待插入的行数据(字典列表)，返回 (行数据, 警告)。
+    这一步只做解析，不访问数据库，因此可以放到工作线程中执行；导入在这一步通过之后才会改动现有数据。
+    - 姓名统一做NFKC规范化(全角字母、数字和空格转为半角)并去除首尾空白，空字符串和空单元格写入 NULL
+    - 日期为空的行跳过 (有姓名时给出警告)，日期无法识别时报错
+    - 同一日期重复出现时，内容相同只保留第一行并给出警告，内容不同时报错
+    - 有角色为空或日期不连续时给出警告
+    格式不符合要求时抛出 ExcelFormatError。
+    """
+    import pandas as pd
+
+    # 步骤 1: 从源读取Excel (路径或内存中的字节流)
+    df = pd.read_excel(excel_source, engine='openpyxl')
+
+    column_names = df.columns.tolist()
+    if len(column_names) < 5:
+        raise ExcelFormatError(f"错误：Excel文件必须至少包含5列。检测到 {len(column_names)} 列。")
+
+    date_col, *role_cols = column_names[:5]
+    role_names = list(ROLE_TO_FIELD_MAP)
+    df = df[column_names[:5]]
+    # 索引改为Excel中的行号 (第1行是表头)，用于警告和错误信息
+    df.index = df.index + 2
+    issues = _ImportWarnings()
+
+    # 步骤 2: 使用快速、向量化的操作校验和规范化DataFrame
+    # 2.1: 姓名规范化，空字符串视为空单元格
+    for col in role_cols:
+        names = df[col].astype("string").str.normalize("NFKC").str.strip()
+        df[col] = names.mask(names == "")
+
+    # 2.2: 移除日期为空的行，其中填写了姓名的行给出警告
+    blank_date = df[date_col].isna()
+    for row_number in df.index[blank_date & df[role_cols].notna().any(axis=1)]:
+        issues.add(f"第{row_number}行：日期为空，已跳过该行。")
+    df = df[~blank_date]
+
+    # 2.3: 将日期列转换为Python的date对象，接受的格式与流式导入的 _coerce_date 完全相同：
+    #      数字是未设置日期格式的单元格中的Excel序列号，日期单元格和 YYYY-MM-DD 文本批量转换；
+    #      其他文本 (以及批量转换失败的单元格) 逐个交给 _coerce_date 识别
+    raw_dates = df[date_col]
+    if pd.api.types.is_numeric_dtype(raw_dates):
+        numeric = pd.Series(True, index=raw_dates.index)
+    else:
+        numeric = raw_dates.map(lambda value: isinstance(value, (int, float)), na_action="ignore").fillna(False).astype(bool)
+    batch = raw_dates.map(
+        lambda value: isinstance(value, date) or (isinstance(value, str) and ISO_DATE_PATTERN.fullmatch(value) is not None),
+        na_action="ignore",
+    ).fillna(False).astype(bool)
+    dates = pd.to_datetime(raw_dates.where(batch & ~numeric), errors="coerce", format="%Y-%m-%d")
+    if numeric.any():
+        serials = pd.to_datetime(pd.to_numeric(raw_dates[numeric]), unit="D", origin=EXCEL_EPOCH)
+        dates = dates.mask(numeric, serials)
+    dates = dates.dt.date.astype(object)
+    invalid_dates = []
+    for row_number in dates.index[dates.isna()]:
+        try:
+            dates[row_number] = _coerce_date(df.at[row_number, date_col])
+        except ValueError:
+            invalid_dates.append(f"第{row_number}行 ({df.at[row_number, date_col]!r})")
+    if invalid_dates:
+        raise _rows_error("错误：以下行的日期无法识别", invalid_dates)
+    df = df.assign(**{date_col: dates})
+
+    # 2.4: 重复日期：内容相同的只保留第一行，内容不同的无法判断以哪一行为准，直接报错
+    duplicated = df.duplicated(subset=[date_col], keep=False)
+    if duplicated.any():
+        conflicts = []
+        for duty_date, group in df[duplicated].groupby(date_col, sort=True):
+            rows_text = "、".join(f"第{row_number}行" for row_number in group.index)
+            if len(group[role_cols].drop_duplicates()) > 1:
+                conflicts.append(f"{duty_date} ({rows_text})")
+            else:
+                issues.add(f"{duty_date} 重复出现 ({rows_text})，内容相同，只导入第一行。")
+        if conflicts:
+            raise _rows_error("错误：以下日期重复出现且值班人员不一致", conflicts)
+        df = df[~df.duplicated(subset=[date_col], keep="first")]
+
+    # 2.5: 有角色为空的行
+    missing = df[role_cols].isna()
+    for row_number in df.index[missing.any(axis=1)]:
+        roles = [role for role, empty in zip(role_names, missing.loc[row_number]) if empty]
+        issues.add(_missing_roles_warning(row_number, df.at[row_number, date_col], roles))
+
+    # 2.6: 日期连续性 (按日期排序后相邻两天相差超过1天)
+    ordered = pd.Series(pd.to_datetime(df[date_col].to_numpy())).sort_values(ignore_index=True)
+    gaps = ordered.diff().dt.days
+    for index in gaps.index[gaps > 1]:
+        issues.add(_gap_warning(ordered[index - 1].date(), ordered[index].date()))
+
+    # 2.7: 空单元格(NaN)统一转换为 None，写入数据库时为 NULL，也便于合并导入时与现有数据比较
+    df = df.astype(object).where(df.notna(), None)
+
+    # 2.8: 使用快速的列表推导式配合 to_dict('records') 替代慢速的 iterrows()
+    rows = [
+        {
+            'duty_date': row[date_col],
+            'employee_full_professional': row[role_cols[0]],
+            'employee_cs_complaint': row[role_cols[1]],
+            'employee_cs_fault': row[role_cols[2]],
+            'employee_ps_professional': row[role_cols[3]],
+        } for row in df.to_dict('records')
+    ]
+    return rows, issues
+
+def _coerce_date(value):
+    """将单元格的值转换为 date 对象；空值返回 None，无法识别时抛出 ValueError。"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, (int, float)):
+        # 未设置日期格式的单元格会以Excel序列号的形式出现
+        from openpyxl.utils.datetime import from_excel
+        return from_excel(value).date()
+    text = str(value).strip()
+    if not text:
+        return None
     try:
-        # 步骤 1: 从源读取Excel (路径或内存中的字节流)
-        df = pd.read_excel(excel_source, engine='openpyxl')
-        
-        column_names = df.columns.tolist()
-        if len(column_names) < 5:
-            return schemas.GeneralResponse(status="error", message=f"错误：Excel文件必须至少包含5列。检测到 {len(column_names)} 列。")
-
-        date_col, full_prof_col, cs_complaint_col, cs_fault_col, ps_prof_col = column_names[:5]
-
-        # 步骤 2: 高效地清空旧数据
-        # 使用 synchronize_session=False 来优化批量删除性能
-        num_deleted_schedules = db.query(models.DutySchedule).delete(synchronize_session=False)
-        num_deleted_logs = db.query(models.SwapLog).delete(synchronize_session=False)
-
-        # 步骤 3: 使用快速、向量化的操作处理DataFrame
-        # 3.1: 移除日期为空的行
-        df.dropna(subset=[date_col], inplace=True)
-        
-        # 3.2: 将日期列转换为Python的date对象
-        df[date_col] = pd.to_datetime(df[date_col]).dt.date
-
-        # 3.3: 使用快速的列表推导式配合 to_dict('records') 替代慢速的 iterrows()
-        records_to_insert = [
-            models.DutySchedule(
-                duty_date=row[date_col],
-                employee_full_professional=row.get(full_prof_col),
-                employee_cs_complaint=row.get(cs_complaint_col),
-                employee_cs_fault=row.get(cs_fault_col),
-                employee_ps_professional=row.get(ps_prof_col)
-            ) for row in df.to_dict('records')
-        ]
-        
-        # 步骤 4: 批量插入并提交
-        db.add_all(records_to_insert)
+        return datetime.fromisoformat(text).date()
+    except ValueError:
+        pass
+    for fmt in ("%Y/%m/%d", "%Y.%m.%d", "%Y年%m月%d日"):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"无法识别的日期: {value!r}")
+
+def _normalize_name(value) -> Optional[str]:
+    """姓名单元格：NFKC规范化并去除首尾空白，空单元格和空字符串返回 None。"""
+    if value is None:
+        return None
+    return unicodedata.normalize("NFKC", str(value)).strip() or None
+
+
+class _RowValidator:
+    """
+    流式导入的逐行校验，规则与 _parse_excel 的向量化校验相同。
+    流式导入边读边写，校验失败时整个导入事务回滚。
+    """
+
+    def __init__(self):
+        self.warnings = _ImportWarnings()
+        self._seen = {}  # 日期 -> (行号, 规范化后的姓名)
+
+    def check(self, row_number: int, values: tuple) -> Optional[dict]:
+        """校验一行，返回待插入的行数据；需要跳过时返回 None，格式错误时抛出 ExcelFormatError。"""
+        names = tuple(_normalize_name(value) for value in values[1:5])
+        try:
+            duty_date = _coerce_date(values[0])
+        except ValueError:
+            raise _rows_error("错误：以下行的日期无法识别", [f"第{row_number}行 ({values[0]!r})"])
+        if duty_date is None:
+            if any(names):
+                self.warnings.add(f"第{row_number}行：日期为空，已跳过该行。")
+            return None
+
+        previous = self._seen.get(duty_date)
+        if previous is not None:
+            rows_text = f"第{previous[0]}行、第{row_number}行"
+            if previous[1] != names:
+                raise _rows_error("错误：以下日期重复出现且值班人员不一致", [f"{duty_date} ({rows_text})"])
+            self.warnings.add(f"{duty_date} 重复出现 ({rows_text})，内容相同，只导入第一行。")
+            return None
+        self._seen[duty_date] = (row_number, names)
+
+        missing = [role for role, name in zip(ROLE_TO_FIELD_MAP, names) if name is None]
+        if missing:
+            self.warnings.add(_missing_roles_warning(row_number, duty_date, missing))
+        return dict(zip(['duty_date', *FIELD_TO_ROLE_MAP], (duty_date, *names)))
+
+    def finish(self) -> None:
+        """全部行读取完后检查日期连续性。"""
+        ordered = sorted(self._seen)
+        for previous, current in zip(ordered, ordered[1:]):
+            if (current - previous).days > 1:
+                self.warnings.add(_gap_warning(previous, current))
+
+
+def _iter_excel_batches(excel_source, batch_size: int, validator: Optional[_RowValidator] = None):
+    """
+    以 openpyxl 只读模式(read_only + iter_rows)流式读取Excel的第一个工作表，
+    逐行校验和转换 (见 _RowValidator)，并按固定大小分批产出行数据(字典列表)。
+    内存占用只与批大小有关，与文件大小无关。第一次迭代时会校验表头，格式不符时抛出 ExcelFormatError。
+    警告收集在 validator.warnings 中，全部读取完成后才完整。
+    """
+    from openpyxl import load_workbook
+
+    validator = validator or _RowValidator()
+    workbook = load_workbook(excel_source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = list(next(rows, None) or [])
+        while header and header[-1] is None:
+            header.pop()
+        if len(header) < 5:
+            raise ExcelFormatError(f"错误：Excel文件必须至少包含5列。检测到 {len(header)} 列。")
+
+        batch = []
+        # 第1行是表头，数据从第2行开始
+        for row_number, values in enumerate(rows, start=2):
+            values = tuple(values) + (None,) * (5 - len(values))
+            row = validator.check(row_number, values)
+            if row is None:
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        validator.finish()
+        if batch:
+            yield batch
+    finally:
+        workbook.close()
+
+# 导入模式: replace 清空后全量导入；merge 按日期增量合并
+IMPORT_MODES = ("replace", "merge")
+# 换班日志的返回格式: text 为人类可读的句子；structured 为按列返回的结构化数据
+SWAP_LOG_FORMATS = ("structured", "text")
+# 计算文件哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 1024 * 1024
+# 分块解码Base64时每块的字符数，必须是4的倍数
+BASE64_CHUNK_SIZE = 4 * 256 * 1024
+_BASE64_WHITESPACE = re.compile(r"\s+")
+
+def _clear_schedule(db: Session):
+    """删除所有排班记录、值班分配索引和换班日志，返回 (删除的排班数, 删除的日志数)。"""
+    # 使用 synchronize_session=False 来优化批量删除性能
+    num_deleted_schedules = db.query(models.DutySchedule).delete(synchronize_session=False)
+    db.query(models.DutyAssignment).delete(synchronize_session=False)
+    num_deleted_logs = db.query(models.SwapLog).delete(synchronize_session=False)
+    # 会话中残留的旧对象对应的行已被删除，将它们移出会话以免与新插入的行冲突
+    db.expunge_all()
+    return num_deleted_schedules, num_deleted_logs
+
+def _insert_schedule_rows(db: Session, rows: List[dict], batch_size: int = IMPORT_BATCH_SIZE) -> None:
+    """
+    按批写入排班记录。
+    直接使用Core层的 insert(表) 配合参数列表执行 executemany，不构造ORM对象，也不经过工作单元(unit-of-work)。
+    MySQL驱动(mysql-connector / aiomysql)会把 executemany 改写为多行 VALUES 语句；
+    SQLite(包括内存后备库)则使用原生的 executemany，不受单条语句参数个数的限制。
+    """
+    statement = insert(models.DutySchedule.__table__)
+    for offset in range(0, len(rows), batch_size):
+        db.execute(statement, rows[offset:offset + batch_size])
+
+def _assignment_rows(rows: List[dict]) -> List[dict]:
+    """把排班行展开为值班分配索引行 (每个非空角色一行)。"""
+    return [
+        {'employee': str(row[field]), 'duty_date': row['duty_date'], 'role_field': field}
+        for row in rows
+        for field in FIELD_TO_ROLE_MAP
+        if row[field] is not None
+    ]
+
+def _insert_assignments(db: Session, rows: List[dict], batch_size: int = IMPORT_BATCH_SIZE) -> None:
+    """为排班行写入值班分配索引。"""
+    assignments = _assignment_rows(rows)
+    statement = insert(models.DutyAssignment.__table__)
+    for offset in range(0, len(assignments), batch_size):
+        db.execute(statement, assignments[offset:offset + batch_size])
+
+def _delete_assignments(db: Session, dates: List[date], batch_size: int = IMPORT_BATCH_SIZE) -> None:
+    """删除指定日期的值班分配索引。"""
+    table = models.DutyAssignment.__table__
+    for offset in range(0, len(dates), batch_size):
+        db.execute(delete(table).where(table.c.duty_date.in_(dates[offset:offset + batch_size])))
+
+def rebuild_assignment_index(db: Session) -> int:
+    """根据 duty_schedules 全量重建值班分配索引并提交，返回写入的索引行数。"""
+    db.query(models.DutyAssignment).delete(synchronize_session=False)
+    table = models.DutySchedule.__table__
+    result = db.execute(select(table.c.duty_date, *[table.c[field] for field in FIELD_TO_ROLE_MAP]))
+    count = 0
+    while True:
+        chunk = result.fetchmany(IMPORT_BATCH_SIZE)
+        if not chunk:
+            break
+        rows = [dict(row._mapping) for row in chunk]
+        _insert_assignments(db, rows)
+        count += len(_assignment_rows(rows))
+    db.commit()
+    return count
+
+def ensure_assignment_index(db: Session) -> None:
+    """
+    启动时调用：已有排班数据但值班分配索引为空时(例如从旧版本升级)，重建索引。
+    """
+    has_schedule = db.query(models.DutySchedule.id).first() is not None
+    has_index = db.query(models.DutyAssignment.id).first() is not None
+    if has_schedule and not has_index:
+        rebuild_assignment_index(db)
+
+def _upsert_statement(dialect: str):
+    """
+    为指定的数据库方言 (dialect.name) 构造按 duty_date 冲突时更新的 upsert 语句：
+    MySQL 使用 INSERT ... ON DUPLICATE KEY UPDATE，SQLite 使用 INSERT ... ON CONFLICT DO UPDATE。
+    其他数据库返回 None，由调用者分别执行 INSERT 和 UPDATE。
+    """
+    table = models.DutySchedule.__table__
+    if dialect == "mysql":
+        statement = mysql_insert(table)
+        # 字典和关键字参数不能同时传入，version 也放在同一个字典中
+        return statement.on_duplicate_key_update(
+            dict({field: statement.inserted[field] for field in FIELD_TO_ROLE_MAP}, version=table.c.version + 1)
+        )
+    if dialect == "sqlite":
+        statement = sqlite_insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=[table.c.duty_date],
+            set_=dict({field: statement.excluded[field] for field in FIELD_TO_ROLE_MAP}, version=table.c.version + 1)
+        )
+    return None
+
+def _upsert_schedule_rows(db: Session, inserts: List[dict], updates: List[dict], batch_size: int = IMPORT_BATCH_SIZE) -> None:
+    """写入合并导入中新增和变化的记录。"""
+    statement = _upsert_statement(db.get_bind().dialect.name)
+    if statement is not None:
+        rows = inserts + updates
+        for offset in range(0, len(rows), batch_size):
+            db.execute(statement, rows[offset:offset + batch_size])
+        return
+
+    _insert_schedule_rows(db, inserts, batch_size)
+    table = models.DutySchedule.__table__
+    update_statement = (
+        update(table)
+        .where(table.c.duty_date == bindparam('b_duty_date'))
+        .values(dict({field: bindparam(field) for field in FIELD_TO_ROLE_MAP}, version=table.c.version + 1))
+    )
+    params = [dict(row, b_duty_date=row['duty_date']) for row in updates]
+    for offset in range(0, len(params), batch_size):
+        db.execute(update_statement, params[offset:offset + batch_size])
+
+def _import_error(e: Exception) -> schemas.ImportScheduleResponse:
+    """将导入过程中的异常转换为错误响应。"""
+    if isinstance(e, ExcelFormatError):
+        return schemas.ImportScheduleResponse(status="error", message=str(e))
+    return schemas.ImportScheduleResponse(status="error", message=f"处理Excel并存入数据库时发生错误: {e}")
+
+
+class _ReplaceWriter:
+    """全量导入：清空旧的排班记录和换班日志，然后写入全部新记录。"""
+    mode = "replace"
+
+    def __init__(self, batch_size: int = IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.inserted = 0
+
+    def begin(self, db: Session) -> None:
+        self.deleted, self.deleted_logs = _clear_schedule(db)
+
+    def write(self, db: Session, batch: List[dict]) -> None:
+        _insert_schedule_rows(db, batch, self.batch_size)
+        _insert_assignments(db, batch, self.batch_size)
+        self.inserted += len(batch)
+
+    def finish(self, db: Session) -> schemas.ImportScheduleResponse:
         db.commit()
-        return schemas.GeneralResponse(
+        # 整表数据已被替换，清空查询缓存
+        get_cache(db).invalidate()
+        return schemas.ImportScheduleResponse(
             status="success",
-            message=f"成功！清除了 {num_deleted_schedules} 条旧排班记录和 {num_deleted_logs} 条旧换班日志，并成功导入了 {len(records_to_insert)} 条新值班记录。"
+            message=f"成功！清除了 {self.deleted} 条旧排班记录和 {self.deleted_logs} 条旧换班日志，并成功导入了 {self.inserted} 条新值班记录。",
+            mode=self.mode,
+            inserted=self.inserted,
+            deleted=self.deleted
         )
+
+
+class _MergeWriter:
+    """
+    增量合并导入：按 duty_date 与现有数据比较，只写入新增、变化和需要删除的记录。
+    换班日志不受影响。
+    """
+    mode = "merge"
+
+    def __init__(self, batch_size: int = IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.inserted = self.updated = self.unchanged = self.deleted = 0
+
+    def begin(self, db: Session) -> None:
+        # 只读取比较所需的列，不构造ORM对象
+        table = models.DutySchedule.__table__
+        columns = [table.c[field] for field in FIELD_TO_ROLE_MAP]
+        self.existing = {
+            row[0]: tuple(row[1:])
+            for row in db.execute(select(table.c.duty_date, *columns))
+        }
+        self.stale_dates = set(self.existing)
+
+    def write(self, db: Session, batch: List[dict]) -> None:
+        inserts, updates = [], []
+        for row in batch:
+            duty_date = row['duty_date']
+            values = tuple(row[field] for field in FIELD_TO_ROLE_MAP)
+            self.stale_dates.discard(duty_date)
+            if duty_date not in self.existing:
+                inserts.append(row)
+            elif self.existing[duty_date] != values:
+                updates.append(row)
+            else:
+                self.unchanged += 1
+                continue
+            self.existing[duty_date] = values
+        _upsert_schedule_rows(db, inserts, updates, self.batch_size)
+        # 变化的日期重新生成值班分配索引
+        _delete_assignments(db, [row['duty_date'] for row in updates], self.batch_size)
+        _insert_assignments(db, inserts + updates, self.batch_size)
+        self.inserted += len(inserts)
+        self.updated += len(updates)
+
+    def finish(self, db: Session) -> schemas.ImportScheduleResponse:
+        # 新文件中不再出现的日期需要删除
+        table = models.DutySchedule.__table__
+        stale_dates = sorted(self.stale_dates)
+        for offset in range(0, len(stale_dates), self.batch_size):
+            chunk = stale_dates[offset:offset + self.batch_size]
+            db.execute(delete(table).where(table.c.duty_date.in_(chunk)))
+        _delete_assignments(db, stale_dates, self.batch_size)
+        self.deleted = len(stale_dates)
+
+        db.commit()
+        if self.inserted or self.updated or self.deleted:
+            get_cache(db).invalidate()
+        return schemas.ImportScheduleResponse(
+            status="success",
+            message=f"合并导入完成：新增 {self.inserted} 条，更新 {self.updated} 条，删除 {self.deleted} 条，{self.unchanged} 条未变化。换班日志已保留。",
+            mode=self.mode,
+            inserted=self.inserted,
+            updated=self.updated,
+            deleted=self.deleted,
+            unchanged=self.unchanged
+        )
+
+
+def _invalid_mode_response(mode: str) -> schemas.ImportScheduleResponse:
+    return schemas.ImportScheduleResponse(status="error", message=f"错误：不支持的导入模式 '{mode}'，可选值为 {', '.join(IMPORT_MODES)}。")
+
+def _make_writer(mode: str, batch_size: int = IMPORT_BATCH_SIZE):
+    return _MergeWriter(batch_size) if mode == "merge" else _ReplaceWriter(batch_size)
+
+def _with_warnings(response: schemas.ImportScheduleResponse, issues: Optional[_ImportWarnings]) -> schemas.ImportScheduleResponse:
+    """把解析和校验阶段的行级警告附加到导入响应上。"""
+    if issues is not None:
+        response.warnings.extend(issues.as_list())
+    return response
+
+def _run_import(db: Session, writer, batches, fingerprint: Optional[dict] = None,
+                issues: Optional[_ImportWarnings] = None) -> schemas.ImportScheduleResponse:
+    """
+    依次把各批数据交给写入器，整个导入在同一个事务中完成。
+    先读取第一批数据再开始写入，确保格式校验通过之前不会改动现有数据。
+    fingerprint 会与导入数据在同一个事务中保存，供下次识别重复导入。
+    issues 为校验阶段收集的警告，附加到成功的响应上。
+    """
+    try:
+        first_batch = next(batches, [])
+        writer.begin(db)
+        for batch in itertools.chain([first_batch], batches):
+            writer.write(db, batch)
+        if fingerprint is not None:
+            _record_import(db, fingerprint, writer.mode)
+        return _with_warnings(writer.finish(db), issues)
     except Exception as e:
         db.rollback()
-        return schemas.GeneralResponse(status="error", message=f"处理Excel并存入数据库时发生错误: {e}")
+        return _import_error(e)
+    finally:
+        # 流式读取时确保只读工作簿被关闭，释放文件句柄
+        if hasattr(batches, "close"):
+            batches.close()
+
+def _stream_excel_into_db(db: Session, excel_source, batch_size: int = IMPORT_BATCH_SIZE,
+                          mode: str = "replace", fingerprint: Optional[dict] = None) -> schemas.ImportScheduleResponse:
+    """流式导入：边读取Excel边分批写入数据库。"""
+    validator = _RowValidator()
+    return _run_import(db, _make_writer(mode, batch_size), _iter_excel_batches(excel_source, batch_size, validator),
+                       fingerprint, validator.warnings)
+
+def _read_and_process_excel(db: Session, excel_source, mode: str = "replace",
+                            fingerprint: Optional[dict] = None) -> schemas.ImportScheduleResponse:
+    """内部核心函数，读取Excel并处理数据，返回结构化响应。"""
+    try:
+        rows, issues = _parse_excel(excel_source)
+    except Exception as e:
+        return _import_error(e)
+    return _run_import(db, _make_writer(mode), iter([rows]), fingerprint, issues)
+
+# --- 重复导入识别 ---
+
+def _hash_source(excel_source) -> str:
+    """分块计算Excel来源(路径或字节流)内容的SHA-256。字节流会被重置到开头。"""
+    digest = hashlib.sha256()
+    if isinstance(excel_source, str):
+        with open(excel_source, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    else:
+        excel_source.seek(0)
+        for chunk in iter(lambda: excel_source.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        excel_source.seek(0)
+    return digest.hexdigest()
 
-def import_schedule(db: Session, file_path: str = None, file_content_b64: str = None) -> schemas.GeneralResponse:
-    """统一的智能导入函数，返回结构化响应。"""
-    if file_content_b64:
+def _load_import_metadata(db: Session) -> Optional[dict]:
+    """读取最近一次成功导入的文件指纹。"""
+    table = models.ImportMetadata.__table__
+    row = db.execute(
+        select(table.c.content_hash, table.c.source_path, table.c.file_size, table.c.file_mtime_ns, table.c.mode)
+        .where(table.c.id == 1)
+    ).first()
+    return dict(row._mapping) if row else None
+
+def _fingerprint_source(excel_source, last_import: Optional[dict], mode: str = "replace"):
+    """
+    计算本次导入来源的指纹，并判断是否与上次成功导入的内容和导入模式都相同。
+    导入模式不同时不算重复：例如 merge 之后以 replace 导入同一文件，仍需要清空换班日志。
+    通过路径导入时，若路径、大小和修改时间都未变化，直接认为内容相同，无需重新计算哈希。
+    返回 (指纹, 是否重复)。
+    """
+    same_mode = bool(last_import) and last_import["mode"] == mode
+    fingerprint = {"source_path": None, "file_size": None, "file_mtime_ns": None}
+    if isinstance(excel_source, str):
+        stat = os.stat(excel_source)
+        fingerprint.update(source_path=excel_source, file_size=stat.st_size, file_mtime_ns=stat.st_mtime_ns)
+        if last_import and all(last_import[key] == fingerprint[key] for key in ("source_path", "file_size", "file_mtime_ns")):
+            fingerprint["content_hash"] = last_import["content_hash"]
+            return fingerprint, same_mode
+    else:
+        fingerprint["file_size"] = excel_source.seek(0, io.SEEK_END)
+        excel_source.seek(0)
+    fingerprint["content_hash"] = _hash_source(excel_source)
+    return fingerprint, same_mode and last_import["content_hash"] == fingerprint["content_hash"]
+
+def _record_import(db: Session, fingerprint: dict, mode: str) -> None:
+    """保存本次导入的文件指纹 (覆盖旧记录)。"""
+    db.merge(models.ImportMetadata(id=1, mode=mode, **fingerprint))
+
+def _forget_last_import(db: Session) -> None:
+    """数据被导入以外的操作(如换班)修改后，清除导入指纹，使下次导入同一文件时正常执行。"""
+    db.query(models.ImportMetadata).delete(synchronize_session=False)
+
+def _duplicate_import_response(mode: str) -> schemas.ImportScheduleResponse:
+    return schemas.ImportScheduleResponse(
+        status="success",
+        message="文件内容和导入模式与上次成功导入的完全相同，数据没有任何变化，已跳过本次导入。如需强制重新导入，请设置 force=True。",
+        mode=mode,
+        skipped=True
+    )
+
+class _MemoryViewReader(io.RawIOBase):
+    """在 memoryview 之上提供只读、可寻址的文件接口，每次只复制被读取的那一段，不复制整个缓冲区。"""
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        size = max(0, min(len(b), len(self._view) - self._pos))
+        b[:size] = self._view[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+def _decode_base64(content_b64: str) -> io.BytesIO:
+    """
+    分块将Base64文本直接解码到内存缓冲区。
+    与 base64.b64decode 相比，省去了先把整个字符串编码为ASCII字节串的那一次完整复制。
+    """
+    if _BASE64_WHITESPACE.search(content_b64):
+        content_b64 = _BASE64_WHITESPACE.sub("", content_b64)
+    buffer = io.BytesIO()
+    for offset in range(0, len(content_b64), BASE64_CHUNK_SIZE):
+        buffer.write(binascii.a2b_base64(content_b64[offset:offset + BASE64_CHUNK_SIZE]))
+    buffer.seek(0)
+    return buffer
+
+def _resolve_import_source(file_path: str = None, file_content_b64: str = None, file_obj=None):
+    """
+    根据导入参数确定Excel来源(可寻址的字节流或规范化后的路径)。
+    参数无效时返回错误响应。
+    """
+    if file_obj is not None:
+        if isinstance(file_obj, bytes):
+            # BytesIO 直接共享 bytes 对象的缓冲区，不会复制
+            return io.BytesIO(file_obj)
+        if isinstance(file_obj, (bytearray, memoryview)):
+            return _MemoryViewReader(file_obj)
+        # 文件对象(例如上传时的临时文件)直接交给解析器
+        file_obj.seek(0)
+        return file_obj
+    elif file_content_b64:
         try:
-            # 解码 base64 内容
-            decoded_content = base64.b64decode(file_content_b64)
-            # 使用内存中的 BytesIO 对象，避免磁盘I/O
-            excel_source = io.BytesIO(decoded_content)
-            return _read_and_process_excel(db, excel_source)
+            return _decode_base64(file_content_b64)
         except Exception as e:
-            return schemas.GeneralResponse(status="error", message=f"处理上传的文件内容时出错: {e}")
+            return schemas.ImportScheduleResponse(status="error", message=f"处理上传的文件内容时出错: {e}")
     elif file_path:
         cleaned_path = _normalize_path(file_path)
         if not os.path.exists(cleaned_path):
-            return schemas.GeneralResponse(status="error", message=f"错误：文件路径不存在。解析后的路径为 '{cleaned_path}' (原始输入: '{file_path}')。")
-        return _read_and_process_excel(db, cleaned_path)
+            return schemas.ImportScheduleResponse(status="error", message=f"错误：文件路径不存在。解析后的路径为 '{cleaned_path}' (原始输入: '{file_path}')。")
+        return cleaned_path
     else:
-        return schemas.GeneralResponse(status="error", message="错误：必须提供文件路径(file_path)或文件内容(file_content_b64)之一。")
-
-def get_duty_employee(db: Session, duty_date_str: str) -> schemas.GetDutyEmployeeResponse:
-    """查询指定日期的值班人员，返回结构化响应并集成智能提醒。"""
-    if db.query(models.DutySchedule).first() is None:
-        return schemas.GetDutyEmployeeResponse(status="error", message="数据库为空，请先使用`import_schedule`工具导入值班表。")
+        return schemas.ImportScheduleResponse(status="error", message="错误：必须提供文件路径(file_path)或文件内容(file_content_b64)之一。")
 
+def _import_into_repository(repository: ScheduleRepository, excel_source, streaming: bool = False,
+                            mode: str = "replace") -> schemas.ImportScheduleResponse:
+    """导入到非数据库的排班存储 (例如内存存储)。只支持全量替换。"""
+    if mode != "replace":
+        return schemas.ImportScheduleResponse(status="error", message="错误：当前存储后端只支持 replace 导入模式。")
     try:
-        is_today_query = duty_date_str.lower() == "today"
-        if is_today_query:
-            target_date = datetime.now().date()
+        if streaming:
+            validator = _RowValidator()
+            rows = [row for batch in _iter_excel_batches(excel_source, IMPORT_BATCH_SIZE, validator) for row in batch]
+            issues = validator.warnings
         else:
-            target_date = datetime.strptime(duty_date_str, "%Y-%m-%d").date()
-    except ValueError:
-        return schemas.GetDutyEmployeeResponse(status="error", message=f"日期格式错误。请输入 'YYYY-MM-DD' 格式或 'today'。")
+            rows, issues = _parse_excel(excel_source)
+        deleted = repository.replace_all(rows)
+    except Exception as e:
+        return _import_error(e)
+    return _with_warnings(schemas.ImportScheduleResponse(
+        status="success",
+        message=f"成功！替换了 {deleted} 条旧排班记录，并成功导入了 {len(rows)} 条新值班记录。",
+        mode=mode,
+        inserted=len(rows),
+        deleted=deleted
+    ), issues)
+
+def import_schedule(db: ScheduleRepository, file_path: str = None, file_content_b64: str = None,
+                    streaming: bool = False, mode: str = "replace", force: bool = False,
+                    file_obj=None) -> schemas.ImportScheduleResponse:
+    """
+    统一的智能导入函数，返回结构化响应。
+    Excel来源可以是服务器路径(file_path)、Base64文本(file_content_b64)，
+    或二进制内容(file_obj: bytes / bytearray / memoryview / 可寻址的二进制文件对象)。
+    streaming=True 时使用流式导入，适合包含多年数据的大文件。
+    mode="merge" 时按日期增量合并，只写入变化的记录并保留换班日志。
+    文件内容与上次成功导入的相同时直接跳过，force=True 可强制重新导入。
+    """
+    if mode not in IMPORT_MODES:
+        return _invalid_mode_response(mode)
+    excel_source = _resolve_import_source(file_path, file_content_b64, file_obj)
+    if isinstance(excel_source, schemas.GeneralResponse):
+        return excel_source
+    repository = as_repository(db)
+    db = repository.session
+    if db is None:
+        return _import_into_repository(repository, excel_source, streaming, mode)
+
+    try:
+        fingerprint, is_duplicate = _fingerprint_source(excel_source, _load_import_metadata(db), mode)
+    except Exception as e:
+        return _import_error(e)
+    if is_duplicate and not force:
+        return _duplicate_import_response(mode)
+
+    if streaming:
+        return _stream_excel_into_db(db, excel_source, mode=mode, fingerprint=fingerprint)
+    return _read_and_process_excel(db, excel_source, mode, fingerprint)
+
+def _schedule_to_dict(schedule: models.DutySchedule) -> dict:
+    """将排班ORM对象转换为只包含角色字段的字典，便于缓存。"""
+    return {field: getattr(schedule, field) for field in FIELD_TO_ROLE_MAP}
+
+class SqlAlchemyScheduleRepository(ScheduleRepository):
+    """
+    基于SQLAlchemy会话的排班存储 (MySQL，或后备的SQLite)。
+    单日查询和最大日期优先使用进程内缓存；按员工查询使用值班分配索引表。
+    """
+
+    def __init__(self, db: Session):
+        self.session = db
+
+    @property
+    def cache(self) -> DutyScheduleCache:
+        """会话所绑定的数据库引擎对应的缓存。"""
+        return get_cache(self.session)
+
+    def summary(self):
+        """返回 (数据库是否为空, 排班表最大日期)，优先使用缓存。"""
+        cache = self.cache
+        summary = cache.get_summary()
+        if summary is not None:
+            return summary
+
+        version = cache.version
+        # 一次 MAX 查询即可同时判断是否为空 (空表时结果为 None)
+        latest_date = self.session.query(func.max(models.DutySchedule.duty_date)).scalar()
+        is_empty = latest_date is None
+        cache.store_summary(is_empty, latest_date, version)
+        return is_empty, latest_date
 
-    schedule = db.query(models.DutySchedule).filter(models.DutySchedule.duty_date == target_date).first()
+    def get_row(self, duty_date: date) -> Optional[dict]:
+        """读取指定日期的排班数据(字典)，不存在时返回 None，优先使用缓存。"""
+        cache = self.cache
+        row = cache.get_row(duty_date)
+        if row is not MISSING:
+            return row
+
+        version = cache.version
+        schedule = self.session.query(models.DutySchedule).filter(models.DutySchedule.duty_date == duty_date).first()
+        row = _schedule_to_dict(schedule) if schedule else None
+        cache.store_row(duty_date, row, version)
+        return row
+
+    def range_rows(self, start_date: date, end_date: date):
+        """基于 duty_date 索引的一次范围扫描；顺便预热单日查询的缓存。"""
+        table = models.DutySchedule.__table__
+        cache = self.cache
+        version = cache.version
+        result = []
+        for row in self.session.execute(
+            select(table.c.duty_date, *[table.c[field] for field in FIELD_TO_ROLE_MAP])
+            .where(table.c.duty_date.between(start_date, end_date))
+            .order_by(table.c.duty_date)
+        ):
+            values = dict(zip(FIELD_TO_ROLE_MAP, row[1:]))
+            cache.store_row(row[0], values, version)
+            result.append((row[0], values))
+        return result
+
+    def employee_duties(self, employee_name: str, start_date: Optional[date] = None,
+                        end_date: Optional[date] = None):
+        """通过值班分配索引表上的 (employee, duty_date) 索引查询，耗时只与结果数量有关。"""
+        table = models.DutyAssignment.__table__
+        query = select(table.c.duty_date, table.c.role_field).where(table.c.employee == employee_name)
+        if start_date:
+            query = query.where(table.c.duty_date >= start_date)
+        if end_date:
+            query = query.where(table.c.duty_date <= end_date)
+        return [tuple(row) for row in self.session.execute(query.order_by(table.c.duty_date, table.c.role_field))]
+
+    def replace_all(self, rows: List[dict]) -> int:
+        """使用全量导入的写入器替换全部排班 (同时清空换班日志)。"""
+        writer = _ReplaceWriter()
+        try:
+            writer.begin(self.session)
+            writer.write(self.session, rows)
+            writer.finish(self.session)
+        except Exception:
+            self.session.rollback()
+            raise
+        return writer.deleted
+
+def as_repository(db: "ScheduleRepository | Session") -> ScheduleRepository:
+    """
+    服务函数的 db 参数可以直接是一个排班存储，也可以是数据库会话
+    (例如 AsyncSession.run_sync 传入的同步会话)，会话包装为 SqlAlchemyScheduleRepository。
+    """
+    return db if isinstance(db, ScheduleRepository) else SqlAlchemyScheduleRepository(db)
+
+def _repository_unsupported(response_class):
+    """内存等非数据库存储不支持的操作返回的错误响应。"""
+    return response_class(status="error", message="当前存储后端不支持该操作，请使用数据库存储 (STORAGE_BACKEND=database)。")
+
+def _duty_employee_response(db: ScheduleRepository, target_date: date, latest_date: Optional[date],
+                            is_relative_query: bool) -> schemas.GetDutyEmployeeResponse:
+    """构造单日值班查询的响应。"""
+    schedule = as_repository(db).get_row(target_date)
     
     if not schedule:
         return schemas.GetDutyEmployeeResponse(
@@ -132,15 +896,14 @@ def get_duty_employee(db: Session, duty_date_str: str) -> schemas.GetDutyEmploye
         )
 
     schedule_data = schemas.DutyEmployee(
-        full_professional=schedule.employee_full_professional,
-        cs_complaint=schedule.employee_cs_complaint,
-        cs_fault=schedule.employee_cs_fault,
-        ps_professional=schedule.employee_ps_professional
+        full_professional=schedule['employee_full_professional'],
+        cs_complaint=schedule['employee_cs_complaint'],
+        cs_fault=schedule['employee_cs_fault'],
+        ps_professional=schedule['employee_ps_professional']
     )
     
     warnings = []
-    if is_today_query:
-        latest_date = db.query(func.max(models.DutySchedule.duty_date)).scalar()
+    if is_relative_query:
         if latest_date and latest_date == target_date:
             warnings.append("提醒：这已经是排班表的最后一天，请记得及时导入新的排班表。")
 
@@ -152,6 +915,124 @@ def get_duty_employee(db: Session, duty_date_str: str) -> schemas.GetDutyEmploye
         warnings=warnings
     )
 
+def _empty_database_response() -> schemas.GetDutyEmployeeResponse:
+    return schemas.GetDutyEmployeeResponse(status="error", message="数据库为空，请先使用`import_schedule`工具导入值班表。")
+
+def build_day_snapshot(db: ScheduleRepository) -> DaySnapshot:
+    """
+    预先计算今天和明天的 'today' 查询响应，连同排班表的最大日期一起保存到缓存中。
+    明天的响应用于跨过午夜、后台任务还未刷新时直接使用。
+    快照在导入或换班使缓存版本变化时自动作废。
+    """
+    repository = as_repository(db)
+    cache = repository.cache
+    version = cache.version
+    today = schedule_today()
+    is_empty, latest_date = repository.summary()
+    responses = {}
+    for day in (today, today + timedelta(days=1)):
+        responses[day] = _empty_database_response() if is_empty else _duty_employee_response(repository, day, latest_date, True)
+    snapshot = DaySnapshot(responses, latest_date)
+    cache.store_snapshot(snapshot, version)
+    return snapshot
+
+def get_duty_employee(db: ScheduleRepository, duty_date_str: str) -> schemas.GetDutyEmployeeResponse:
+    """
+    查询指定日期的值班人员，返回结构化响应并集成智能提醒。
+    日期可以是 'YYYY-MM-DD'，也可以是 today、tomorrow、星期名称等相对日期 (按排班时区计算)。
+    """
+    repository = as_repository(db)
+    is_relative_query = is_relative_date(duty_date_str)
+    if is_relative_query:
+        # 今天和明天优先使用后台任务预先计算好的响应，无需访问数据库
+        snapshot = repository.cache.get_snapshot()
+        response = snapshot.get(resolve_date(duty_date_str)) if snapshot else None
+        if response is not None:
+            return response.model_copy(deep=True)
+
+    is_empty, latest_date = repository.summary()
+    if is_empty:
+        return _empty_database_response()
+
+    try:
+        target_date = resolve_date(duty_date_str)
+    except ValueError:
+        return schemas.GetDutyEmployeeResponse(status="error", message=f"日期格式错误。请输入 'YYYY-MM-DD' 格式，或 'today'、'tomorrow' 等相对日期。")
+
+    return _duty_employee_response(repository, target_date, latest_date, is_relative_query)
+
+def get_duty_range(db: ScheduleRepository, start_date_str: str, end_date_str: str) -> schemas.GetDutyRangeResponse:
+    """
+    查询一个日期范围(含首尾)内的值班安排，返回列式结构的响应。
+    只执行一次基于 duty_date 索引的范围扫描，适合按周或按月展示排班表。
+    """
+    repository = as_repository(db)
+    is_empty, _ = repository.summary()
+    if is_empty:
+        return schemas.GetDutyRangeResponse(status="error", message="数据库为空，请先使用`import_schedule`工具导入值班表。")
+
+    try:
+        start_date = resolve_date(start_date_str)
+        end_date = resolve_date(end_date_str)
+    except ValueError:
+        return schemas.GetDutyRangeResponse(status="error", message="日期格式错误。请输入 'YYYY-MM-DD' 格式。")
+    if start_date > end_date:
+        return schemas.GetDutyRangeResponse(status="error", message="错误：开始日期不能晚于结束日期。")
+
+    # 转置为列式结构
+    columns = {field: [] for field in FIELD_TO_ROLE_MAP}
+    dates = []
+    for duty_date, row in repository.range_rows(start_date, end_date):
+        dates.append(duty_date)
+        for field in FIELD_TO_ROLE_MAP:
+            columns[field].append(row.get(field))
+
+    return schemas.GetDutyRangeResponse(
+        status="success" if dates else "not_found",
+        message=f"{start_date.strftime('%Y年%m月%d日')} 至 {end_date.strftime('%Y年%m月%d日')} 共找到 {len(dates)} 天的值班安排。",
+        start_date=start_date,
+        end_date=end_date,
+        count=len(dates),
+        dates=dates,
+        full_professional=columns['employee_full_professional'],
+        cs_complaint=columns['employee_cs_complaint'],
+        cs_fault=columns['employee_cs_fault'],
+        ps_professional=columns['employee_ps_professional']
+    )
+
+def get_employee_duties(db: ScheduleRepository, employee_name: str, start_date_str: Optional[str] = None,
+                        end_date_str: Optional[str] = None) -> schemas.GetEmployeeDutiesResponse:
+    """
+    查询某位员工在指定日期范围内(含首尾，可省略)的全部值班。
+    数据库存储通过值班分配索引表上的 (employee, duty_date) 索引查询，耗时只与结果数量有关。
+    """
+    # 与导入时写入的姓名使用相同的规范化 (NFKC + 去除首尾空白)，全角字符等写法也能匹配
+    employee_name = _normalize_name(employee_name)
+    if not employee_name:
+        return schemas.GetEmployeeDutiesResponse(status="error", message="错误：必须提供员工姓名。")
+    try:
+        start_date = resolve_date(start_date_str) if start_date_str else None
+        end_date = resolve_date(end_date_str) if end_date_str else None
+    except ValueError:
+        return schemas.GetEmployeeDutiesResponse(status="error", message="日期格式错误。请输入 'YYYY-MM-DD' 格式。")
+    if start_date and end_date and start_date > end_date:
+        return schemas.GetEmployeeDutiesResponse(status="error", message="错误：开始日期不能晚于结束日期。")
+
+    duties = [
+        schemas.EmployeeDuty(duty_date=duty_date, role=FIELD_TO_ROLE_MAP[role_field])
+        for duty_date, role_field in as_repository(db).employee_duties(employee_name, start_date, end_date)
+    ]
+
+    return schemas.GetEmployeeDutiesResponse(
+        status="success" if duties else "not_found",
+        message=f"找到 '{employee_name}' 的 {len(duties)} 次值班。" if duties else f"未找到 '{employee_name}' 的值班记录。",
+        employee_name=employee_name,
+        start_date=start_date,
+        end_date=end_date,
+        count=len(duties),
+        duties=duties
+    )
+
 def _find_employee_role(schedule: models.DutySchedule, employee_name: str) -> Optional[str]:
     """在一个排班记录中查找指定员工，并返回其角色字段名。"""
     found_roles = []
@@ -165,106 +1046,467 @@ def _find_employee_role(schedule: models.DutySchedule, employee_name: str) -> Op
     return found_roles if found_roles else None
 
 
-def swap_duty_schedule(db: Session, request: schemas.SwapDutyScheduleByEmployeeRequest) -> schemas.SwapDutyScheduleResponse:
+def _locate_role(schedule: models.DutySchedule, swap_info: schemas.SwapByEmployeeInfo):
     """
-    通过员工姓名，精准对调两个日期的值班人员。
-    这是一个事务性操作，包含查找、对调和记录日志。
+    确定换班人员在该日排班中的角色字段。
+    返回 (角色字段名, None)；找不到或有多个角色时返回 (None, 错误消息)。
+    """
+    role_field = _find_employee_role(schedule, swap_info.employee_name)
+    if isinstance(role_field, str):
+        return role_field, None
+    if not role_field:
+        return None, f"错误：在 {schedule.duty_date:%Y-%m-%d} 的排班中未找到员工 '{swap_info.employee_name}'。"
+    return None, f"错误：员工 '{swap_info.employee_name}' 在 {schedule.duty_date:%Y-%m-%d} 有多个排班，无法明确指定换班对象。"
+
+
+def _update_assignment(db: Session, duty_date: date, role_field: str, employee_name: str) -> None:
+    """换班后同步更新值班分配索引中对应的一行。"""
+    table = models.DutyAssignment.__table__
+    db.execute(
+        update(table)
+        .where(table.c.duty_date == duty_date, table.c.role_field == role_field)
+        .values(employee=employee_name)
+    )
+
+
+def _swap_retry_delay(attempt: int) -> float:
+    """第 attempt 次冲突后的等待秒数：指数退避并加入随机抖动，避免多个客户端同时重试。"""
+    return SWAP_RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.0)
+
+def _swap_conflict_response(response_class=schemas.SwapDutyScheduleResponse):
+    return response_class(
+        status="error",
+        message=f"换班冲突：相关排班在重试 {SWAP_MAX_RETRIES} 次后仍被其他操作修改，请稍后再试。"
+    )
+
+def _try_swap_duty_schedule(db: Session, request: schemas.SwapDutyScheduleByEmployeeRequest) -> Optional[schemas.SwapDutyScheduleResponse]:
+    """
+    执行一次换班尝试。
+    DutySchedule 带有版本号列，ORM 提交时以 "UPDATE ... WHERE id = ? AND version = ?" 的方式比较并交换；
+    如果读取之后这两天的排班已被其他操作修改，更新不到任何行，此时回滚并返回 None，由调用者重试。
     """
     swap_info_1 = request.swap_info_1
     swap_info_2 = request.swap_info_2
 
     try:
-        d1 = datetime.strptime(swap_info_1.duty_date, "%Y-%m-%d").date()
-        d2 = datetime.strptime(swap_info_2.duty_date, "%Y-%m-%d").date()
+        d1 = resolve_date(swap_info_1.duty_date)
+        d2 = resolve_date(swap_info_2.duty_date)
     except ValueError:
         return schemas.SwapDutyScheduleResponse(status="error", message="日期格式错误，请输入 'YYYY-MM-DD' 格式。")
 
-    schedule1 = db.query(models.DutySchedule).filter(models.DutySchedule.duty_date == d1).first()
-    schedule2 = db.query(models.DutySchedule).filter(models.DutySchedule.duty_date == d2).first()
+    # populate_existing 保证读取到的是数据库中的最新值和版本号，而不是会话中残留的旧对象
+    schedule1 = db.query(models.DutySchedule).filter(models.DutySchedule.duty_date == d1).populate_existing().first()
+    schedule2 = db.query(models.DutySchedule).filter(models.DutySchedule.duty_date == d2).populate_existing().first()
 
     if not schedule1 or not schedule2:
         missing_dates = []
-        if not schedule1: missing_dates.append(swap_info_1.duty_date)
-        if not schedule2: missing_dates.append(swap_info_2.duty_date)
+        if not schedule1: missing_dates.append(f"{d1:%Y-%m-%d}")
+        if not schedule2: missing_dates.append(f"{d2:%Y-%m-%d}")
         return schemas.SwapDutyScheduleResponse(status="error", message=f"错误：未找到以下一个或多个日期的排班记录: {', '.join(missing_dates)}")
 
     # 查找员工1的角色
-    role_field1 = _find_employee_role(schedule1, swap_info_1.employee_name)
-    if not isinstance(role_field1, str):
-        if not role_field1:
-            return schemas.SwapDutyScheduleResponse(status="error", message=f"错误：在 {swap_info_1.duty_date} 的排班中未找到员工 '{swap_info_1.employee_name}'。")
-        else:
-            return schemas.SwapDutyScheduleResponse(status="error", message=f"错误：员工 '{swap_info_1.employee_name}' 在 {swap_info_1.duty_date} 有多个排班，无法明确指定换班对象。")
+    role_field1, error = _locate_role(schedule1, swap_info_1)
+    if error:
+        return schemas.SwapDutyScheduleResponse(status="error", message=error)
 
     # 查找员工2的角色
-    role_field2 = _find_employee_role(schedule2, swap_info_2.employee_name)
-    if not isinstance(role_field2, str):
-        if not role_field2:
-            return schemas.SwapDutyScheduleResponse(status="error", message=f"错误：在 {swap_info_2.duty_date} 的排班中未找到员工 '{swap_info_2.employee_name}'。")
-        else:
-            return schemas.SwapDutyScheduleResponse(status="error", message=f"错误：员工 '{swap_info_2.employee_name}' 在 {swap_info_2.duty_date} 有多个排班，无法明确指定换班对象。")
+    role_field2, error = _locate_role(schedule2, swap_info_2)
+    if error:
+        return schemas.SwapDutyScheduleResponse(status="error", message=error)
 
-    # 执行交换
-    setattr(schedule1, role_field1, swap_info_2.employee_name)
-    setattr(schedule2, role_field2, swap_info_1.employee_name)
-
-    # 创建审计日志
     role1 = FIELD_TO_ROLE_MAP[role_field1]
     role2 = FIELD_TO_ROLE_MAP[role_field2]
-    new_log = models.SwapLog(
-        date1=d1, role1=role1, original_employee1=swap_info_1.employee_name, new_employee1=swap_info_2.employee_name,
-        date2=d2, role2=role2, original_employee2=swap_info_2.employee_name, new_employee2=swap_info_1.employee_name
-    )
-    db.add(new_log)
 
     try:
-        db.commit()
-        
-        swap1_details = schemas.SwapInfo(
-            duty_date=d1, role=role1, original_employee=swap_info_1.employee_name, new_employee=swap_info_2.employee_name
+        # 执行交换
+        setattr(schedule1, role_field1, swap_info_2.employee_name)
+        setattr(schedule2, role_field2, swap_info_1.employee_name)
+        _update_assignment(db, d1, role_field1, swap_info_2.employee_name)
+        _update_assignment(db, d2, role_field2, swap_info_1.employee_name)
+
+        # 创建审计日志
+        new_log = models.SwapLog(
+            date1=d1, role1=role1, original_employee1=swap_info_1.employee_name, new_employee1=swap_info_2.employee_name,
+            date2=d2, role2=role2, original_employee2=swap_info_2.employee_name, new_employee2=swap_info_1.employee_name
         )
-        swap2_details = schemas.SwapInfo(
-            duty_date=d2, role=role2, original_employee=swap_info_2.employee_name, new_employee=swap_info_1.employee_name
+        db.add(new_log)
+        # 数据已不再与上次导入的文件一致
+        _forget_last_import(db)
+
+        db.commit()
+    except StaleDataError:
+        # 版本号不匹配：读取之后被并发修改
+        db.rollback()
+        return None
+    except Exception as e:
+        db.rollback()
+        return schemas.SwapDutyScheduleResponse(status="error", message=f"数据库提交时发生错误: {e}")
+
+    # 原地更新缓存中这两天的数据，无需整体失效
+    changes = {d1: {role_field1: swap_info_2.employee_name}}
+    changes.setdefault(d2, {})[role_field2] = swap_info_1.employee_name
+    get_cache(db).update_rows(changes)
+
+    swap1_details = schemas.SwapInfo(
+        duty_date=d1, role=role1, original_employee=swap_info_1.employee_name, new_employee=swap_info_2.employee_name
+    )
+    swap2_details = schemas.SwapInfo(
+        duty_date=d2, role=role2, original_employee=swap_info_2.employee_name, new_employee=swap_info_1.employee_name
+    )
+
+    return schemas.SwapDutyScheduleResponse(
+        status="success",
+        message=f"成功将 {d1:%Y-%m-%d} 的 '{swap_info_1.employee_name}' ({role1}) 与 {d2:%Y-%m-%d} 的 '{swap_info_2.employee_name}' ({role2}) 进行了对调。",
+        swap1=swap1_details,
+        swap2=swap2_details
+    )
+
+
+def swap_duty_schedule(db: ScheduleRepository, request: schemas.SwapDutyScheduleByEmployeeRequest) -> schemas.SwapDutyScheduleResponse:
+    """
+    通过员工姓名，精准对调两个日期的值班人员。
+    这是一个事务性操作，包含查找、对调和记录日志。
+    使用乐观并发控制：与其他换班冲突时重新读取并重试，最多重试 SWAP_MAX_RETRIES 次。
+    """
+    db = as_repository(db).session
+    if db is None:
+        return _repository_unsupported(schemas.SwapDutyScheduleResponse)
+    for attempt in range(SWAP_MAX_RETRIES + 1):
+        result = _try_swap_duty_schedule(db, request)
+        if result is not None:
+            return result
+        if attempt < SWAP_MAX_RETRIES:
+            time.sleep(_swap_retry_delay(attempt))
+    return _swap_conflict_response()
+
+
+def _try_swap_duty_schedule_batch(db: Session, request: schemas.SwapDutyScheduleBatchRequest) -> Optional[schemas.SwapDutyScheduleBatchResponse]:
+    """
+    执行一次批量换班尝试。
+    FOR UPDATE 在MySQL上锁定所有涉及的行；SQLite等不支持行锁的数据库仍依靠版本号检测并发修改，
+    与 _try_swap_duty_schedule 一样，版本号冲突时回滚并返回 None，由调用者重试。
+    """
+    if not request.swaps:
+        return schemas.SwapDutyScheduleBatchResponse(status="error", message="错误：换班列表为空。")
+
+    try:
+        parsed = [
+            (swap, resolve_date(swap.swap_info_1.duty_date),
+             resolve_date(swap.swap_info_2.duty_date))
+            for swap in request.swaps
+        ]
+    except ValueError:
+        return schemas.SwapDutyScheduleBatchResponse(status="error", message="日期格式错误，请输入 'YYYY-MM-DD' 格式。")
+
+    # 一次查询锁定所有涉及的日期，防止与并发的换班互相覆盖；
+    # populate_existing 保证读取到的是数据库中的最新值和版本号，而不是会话中残留的旧对象
+    dates = {d for _, d1, d2 in parsed for d in (d1, d2)}
+    schedules = {
+        schedule.duty_date: schedule
+        for schedule in db.query(models.DutySchedule)
+        .filter(models.DutySchedule.duty_date.in_(dates))
+        .with_for_update()
+        .populate_existing()
+    }
+    missing_dates = sorted(d for d in dates if d not in schedules)
+    if missing_dates:
+        db.rollback()
+        return schemas.SwapDutyScheduleBatchResponse(
+            status="error",
+            message=f"错误：未找到以下一个或多个日期的排班记录: {', '.join(d.strftime('%Y-%m-%d') for d in missing_dates)}"
         )
-        
-        return schemas.SwapDutyScheduleResponse(
-            status="success",
-            message=f"成功将 {swap_info_1.duty_date} 的 '{swap_info_1.employee_name}' ({role1}) 与 {swap_info_2.duty_date} 的 '{swap_info_2.employee_name}' ({role2}) 进行了对调。",
-            swap1=swap1_details,
-            swap2=swap2_details
+
+    # 按顺序校验并对调，后面的换班基于前面换班之后的结果
+    pairs, log_rows = [], []
+    for index, (swap, d1, d2) in enumerate(parsed, start=1):
+        info1, info2 = swap.swap_info_1, swap.swap_info_2
+        role_field1, error = _locate_role(schedules[d1], info1)
+        if not error:
+            role_field2, error = _locate_role(schedules[d2], info2)
+        if error:
+            db.rollback()
+            return schemas.SwapDutyScheduleBatchResponse(status="error", message=f"第 {index} 组换班失败，整批换班未生效。{error}")
+
+        setattr(schedules[d1], role_field1, info2.employee_name)
+        setattr(schedules[d2], role_field2, info1.employee_name)
+
+        role1, role2 = FIELD_TO_ROLE_MAP[role_field1], FIELD_TO_ROLE_MAP[role_field2]
+        pairs.append(schemas.SwapPairInfo(
+            swap1=schemas.SwapInfo(duty_date=d1, role=role1, original_employee=info1.employee_name, new_employee=info2.employee_name),
+            swap2=schemas.SwapInfo(duty_date=d2, role=role2, original_employee=info2.employee_name, new_employee=info1.employee_name),
+        ))
+        log_rows.append({
+            'date1': d1, 'role1': role1, 'original_employee1': info1.employee_name, 'new_employee1': info2.employee_name,
+            'date2': d2, 'role2': role2, 'original_employee2': info2.employee_name, 'new_employee2': info1.employee_name,
+        })
+
+    # 汇总每个 (日期, 角色) 的最终值班人员
+    changes = {}
+    for pair in pairs:
+        for info in (pair.swap1, pair.swap2):
+            field = ROLE_TO_FIELD_MAP[info.role]
+            changes.setdefault(info.duty_date, {})[field] = getattr(schedules[info.duty_date], field)
+
+    assignment_table = models.DutyAssignment.__table__
+    try:
+        db.execute(
+            update(assignment_table)
+            .where(assignment_table.c.duty_date == bindparam('b_duty_date'),
+                   assignment_table.c.role_field == bindparam('b_role_field'))
+            .values(employee=bindparam('b_employee')),
+            [
+                {'b_duty_date': duty_date, 'b_role_field': field, 'b_employee': employee}
+                for duty_date, fields in changes.items()
+                for field, employee in fields.items()
+            ]
         )
+        db.execute(insert(models.SwapLog.__table__), log_rows)
+        _forget_last_import(db)
+        db.commit()
+    except StaleDataError:
+        # 版本号不匹配：读取之后被并发修改
+        db.rollback()
+        return None
     except Exception as e:
         db.rollback()
-        return schemas.SwapDutyScheduleResponse(status="error", message=f"数据库提交时发生错误: {e}")
+        return schemas.SwapDutyScheduleBatchResponse(status="error", message=f"数据库提交时发生错误: {e}")
+
+    get_cache(db).update_rows(changes)
+    return schemas.SwapDutyScheduleBatchResponse(
+        status="success",
+        message=f"成功在一个事务中完成了 {len(pairs)} 组换班。",
+        swap_count=len(pairs),
+        swaps=pairs
+    )
+
+
+def swap_duty_schedule_batch(db: ScheduleRepository, request: schemas.SwapDutyScheduleBatchRequest) -> schemas.SwapDutyScheduleBatchResponse:
+    """
+    在一个事务中按顺序执行多组换班。
+    一次查询锁定(SELECT ... FOR UPDATE)所有涉及的日期，逐组校验并在内存中对调，
+    然后批量更新值班分配索引、批量写入换班日志，最后只提交一次。
+    任意一组校验失败时，整批换班都不会生效。
+    与并发的修改冲突时重新读取并重试，最多重试 SWAP_MAX_RETRIES 次。
+    """
+    db = as_repository(db).session
+    if db is None:
+        return _repository_unsupported(schemas.SwapDutyScheduleBatchResponse)
+    for attempt in range(SWAP_MAX_RETRIES + 1):
+        result = _try_swap_duty_schedule_batch(db, request)
+        if result is not None:
+            return result
+        if attempt < SWAP_MAX_RETRIES:
+            time.sleep(_swap_retry_delay(attempt))
+    return _swap_conflict_response(schemas.SwapDutyScheduleBatchResponse)
+
 
+def _encode_log_cursor(log_time: datetime, log_id: int) -> str:
+    """把一页最后一条日志的 (log_time, id) 编码为不透明的游标字符串。"""
+    return base64.urlsafe_b64encode(f"{log_time.isoformat()}|{log_id}".encode()).decode()
 
-def get_swap_logs(db: Session) -> schemas.GetSwapLogsResponse:
-    """获取当前数据版本下所有的换班审计日志。"""
+def _decode_log_cursor(cursor: str):
+    """解析游标，返回 (log_time, id)。游标无效时抛出 ValueError。"""
     try:
-        logs_orm = db.query(models.SwapLog).order_by(models.SwapLog.log_time.desc()).all()
-        log_count = len(logs_orm)
-        
-        # 将ORM对象格式化为人类可读的字符串
-        formatted_logs = []
-        for log in logs_orm:
-            log_time_str = log.log_time.strftime("%Y-%m-%d %H:%M:%S")
-            log_sentence = (
-                f"[{log_time_str}] 换班申请: "
-                f"{log.date1.strftime('%Y年%m月%d日')}的 '{log.original_employee1}' (原{log.role1}) "
-                f"与 {log.date2.strftime('%Y年%m月%d日')}的 '{log.original_employee2}' (原{log.role2}) "
-                f"进行了对调。"
-            )
-            formatted_logs.append(log_sentence)
+        log_time_str, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(log_time_str), int(log_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("无效的分页游标") from e
 
+def _format_swap_log(log) -> str:
+    """把一条换班日志格式化为人类可读的句子 (仅 text 格式使用)。"""
+    log_time_str = log.log_time.strftime("%Y-%m-%d %H:%M:%S")
+    return (
+        f"[{log_time_str}] 换班申请: "
+        f"{log.date1.strftime('%Y年%m月%d日')}的 '{log.original_employee1}' (原{log.role1}) "
+        f"与 {log.date2.strftime('%Y年%m月%d日')}的 '{log.original_employee2}' (原{log.role2}) "
+        f"进行了对调。"
+    )
+
+def get_swap_logs(db: ScheduleRepository, limit: int = SWAP_LOG_PAGE_SIZE, cursor: Optional[str] = None,
+                  start_date_str: Optional[str] = None, end_date_str: Optional[str] = None,
+                  employee_name: Optional[str] = None, format: str = "text") -> schemas.GetSwapLogsResponse:
+    """
+    按时间倒序分页查询换班审计日志。
+    使用 (log_time, id) 键集分页：下一页从上一页最后一条日志之后开始，
+    借助 swap_logs 上的 (log_time, id) 复合索引，每页只做一次有界的范围扫描，与总日志数无关。
+    可按日期范围(任一对调日期落在范围内)和员工姓名过滤。
+    日志通过 Core select 按列读取，不构造ORM对象；只有 text 格式才把每条日志格式化为句子。
+    """
+    db = as_repository(db).session
+    if db is None:
+        return _repository_unsupported(schemas.GetSwapLogsResponse)
+    if format not in SWAP_LOG_FORMATS:
         return schemas.GetSwapLogsResponse(
-            status="success",
-            message=f"成功查询到 {log_count} 条换班日志。",
-            log_count=log_count,
-            logs=formatted_logs
+            status="error",
+            message=f"错误：不支持的日志格式 '{format}'，可选值为: {', '.join(SWAP_LOG_FORMATS)}。"
         )
+    limit = max(1, min(limit or SWAP_LOG_PAGE_SIZE, SWAP_LOG_MAX_PAGE_SIZE))
+    try:
+        start_date = resolve_date(start_date_str) if start_date_str else None
+        end_date = resolve_date(end_date_str) if end_date_str else None
+    except ValueError:
+        return schemas.GetSwapLogsResponse(status="error", message="日期格式错误。请输入 'YYYY-MM-DD' 格式。")
+    if start_date and end_date and start_date > end_date:
+        return schemas.GetSwapLogsResponse(status="error", message="错误：开始日期不能晚于结束日期。")
+
+    log = models.SwapLog.__table__.c
+    query = select(models.SwapLog.__table__)
+    if cursor:
+        try:
+            cursor_time, cursor_id = _decode_log_cursor(cursor)
+        except ValueError as e:
+            return schemas.GetSwapLogsResponse(status="error", message=f"错误：{e}。")
+        query = query.where(or_(log.log_time < cursor_time, and_(log.log_time == cursor_time, log.id < cursor_id)))
+    if start_date or end_date:
+        def in_range(column):
+            conditions = []
+            if start_date:
+                conditions.append(column >= start_date)
+            if end_date:
+                conditions.append(column <= end_date)
+            return and_(*conditions)
+        query = query.where(or_(in_range(log.date1), in_range(log.date2)))
+    employee_name = (employee_name or "").strip()
+    if employee_name:
+        # 对调双方的原值班员即为全部相关人员
+        query = query.where(or_(log.original_employee1 == employee_name, log.original_employee2 == employee_name))
+
+    try:
+        # 多取一条，用于判断是否还有下一页
+        rows = db.execute(query.order_by(log.log_time.desc(), log.id.desc()).limit(limit + 1)).all()
     except Exception as e:
         return schemas.GetSwapLogsResponse(
             status="error",
             message=f"查询换班日志时发生错误: {e}",
             logs=[]
         )
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    log_count = len(rows)
+    next_cursor = _encode_log_cursor(rows[-1].log_time, rows[-1].id) if has_more else None
+
+    message = f"成功查询到 {log_count} 条换班日志。"
+    if has_more:
+        message += "还有更多日志，请使用 next_cursor 获取下一页。"
+    response = schemas.GetSwapLogsResponse(
+        status="success",
+        message=message,
+        format=format,
+        log_count=log_count,
+        next_cursor=next_cursor
+    )
+    if format == "text":
+        response.logs = [_format_swap_log(row) for row in rows]
+    else:
+        response.entries = [schemas.SwapLogEntry(**row._mapping) for row in rows]
+    return response
+
+
+# =================================================================
+#       异步服务层 (供异步的MCP工具和FastAPI端点使用)
+# =================================================================
+# 数据库访问通过 AsyncSession.run_sync 复用上面的同步业务逻辑，
+# (db 为内存存储时直接调用同步函数，它们本身不涉及I/O)
+# 由异步驱动(aiomysql / aiosqlite)完成I/O，不会阻塞事件循环。
+# Excel解析是CPU密集操作，放到工作线程中执行，导入期间仍可并发处理查询。
+
+async def _run_sync(db, fn, *args):
+    """在异步会话上执行同步服务函数；db 为排班存储时直接调用。"""
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return fn(db, *args)
+
+async def _run_import_async(db: AsyncSession, writer, batches, fingerprint: Optional[dict] = None,
+                            issues: Optional[_ImportWarnings] = None) -> schemas.ImportScheduleResponse:
+    """_run_import 的异步版本：在工作线程中读取每一批数据，在事件循环中写入。"""
+    try:
+        batch = await asyncio.to_thread(next, batches, [])
+        await db.run_sync(writer.begin)
+        while batch is not None:
+            await db.run_sync(writer.write, batch)
+            batch = await asyncio.to_thread(next, batches, None)
+        if fingerprint is not None:
+            await db.run_sync(_record_import, fingerprint, writer.mode)
+        return _with_warnings(await db.run_sync(writer.finish), issues)
+    except Exception as e:
+        await db.rollback()
+        return _import_error(e)
+    finally:
+        if hasattr(batches, "close"):
+            batches.close()
+
+async def import_schedule_async(db: "AsyncSession | ScheduleRepository", file_path: str = None, file_content_b64: str = None,
+                                streaming: bool = False, mode: str = "replace", force: bool = False,
+                                file_obj=None) -> schemas.ImportScheduleResponse:
+    """import_schedule 的异步版本。"""
+    if not isinstance(db, AsyncSession):
+        # 内存存储的导入全部是CPU操作，整体放到工作线程中执行
+        return await asyncio.to_thread(import_schedule, db, file_path, file_content_b64, streaming, mode, force, file_obj)
+    if mode not in IMPORT_MODES:
+        return _invalid_mode_response(mode)
+    excel_source = await asyncio.to_thread(_resolve_import_source, file_path, file_content_b64, file_obj)
+    if isinstance(excel_source, schemas.GeneralResponse):
+        return excel_source
+
+    try:
+        last_import = await db.run_sync(_load_import_metadata)
+        fingerprint, is_duplicate = await asyncio.to_thread(_fingerprint_source, excel_source, last_import, mode)
+    except Exception as e:
+        return _import_error(e)
+    if is_duplicate and not force:
+        return _duplicate_import_response(mode)
+    if streaming:
+        validator = _RowValidator()
+        batches = _iter_excel_batches(excel_source, IMPORT_BATCH_SIZE, validator)
+        issues = validator.warnings
+    else:
+        try:
+            rows, issues = await asyncio.to_thread(_parse_excel, excel_source)
+        except Exception as e:
+            return _import_error(e)
+        batches = iter([rows])
+    return await _run_import_async(db, _make_writer(mode), batches, fingerprint, issues)
+
+async def get_duty_employee_async(db: "AsyncSession | ScheduleRepository", duty_date_str: str) -> schemas.GetDutyEmployeeResponse:
+    """get_duty_employee 的异步版本。"""
+    return await _run_sync(db, get_duty_employee, duty_date_str)
+
+async def get_duty_range_async(db: "AsyncSession | ScheduleRepository", start_date_str: str, end_date_str: str) -> schemas.GetDutyRangeResponse:
+    """get_duty_range 的异步版本。"""
+    return await _run_sync(db, get_duty_range, start_date_str, end_date_str)
+
+async def get_employee_duties_async(db: "AsyncSession | ScheduleRepository", employee_name: str, start_date_str: Optional[str] = None,
+                                    end_date_str: Optional[str] = None) -> schemas.GetEmployeeDutiesResponse:
+    """get_employee_duties 的异步版本。"""
+    return await _run_sync(db, get_employee_duties, employee_name, start_date_str, end_date_str)
+
+async def swap_duty_schedule_async(db: "AsyncSession | ScheduleRepository", request: schemas.SwapDutyScheduleByEmployeeRequest) -> schemas.SwapDutyScheduleResponse:
+    """swap_duty_schedule 的异步版本。冲突重试时使用 asyncio.sleep 退避，不阻塞事件循环。"""
+    if not isinstance(db, AsyncSession):
+        return swap_duty_schedule(db, request)
+    for attempt in range(SWAP_MAX_RETRIES + 1):
+        result = await db.run_sync(_try_swap_duty_schedule, request)
+        if result is not None:
+            return result
+        if attempt < SWAP_MAX_RETRIES:
+            await asyncio.sleep(_swap_retry_delay(attempt))
+    return _swap_conflict_response()
+
+async def swap_duty_schedule_batch_async(db: "AsyncSession | ScheduleRepository", request: schemas.SwapDutyScheduleBatchRequest) -> schemas.SwapDutyScheduleBatchResponse:
+    """swap_duty_schedule_batch 的异步版本。冲突重试时使用 asyncio.sleep 退避，不阻塞事件循环。"""
+    if not isinstance(db, AsyncSession):
+        return swap_duty_schedule_batch(db, request)
+    for attempt in range(SWAP_MAX_RETRIES + 1):
+        result = await db.run_sync(_try_swap_duty_schedule_batch, request)
+        if result is not None:
+            return result
+        if attempt < SWAP_MAX_RETRIES:
+            await asyncio.sleep(_swap_retry_delay(attempt))
+    return _swap_conflict_response(schemas.SwapDutyScheduleBatchResponse)
+
+async def get_swap_logs_async(db: "AsyncSession | ScheduleRepository", limit: int = SWAP_LOG_PAGE_SIZE, cursor: Optional[str] = None,
+                              start_date_str: Optional[str] = None, end_date_str: Optional[str] = None,
+                              employee_name: Optional[str] = None, format: str = "text") -> schemas.GetSwapLogsResponse:
+    """get_swap_logs 的异步版本。"""
+    return await _run_sync(db, get_swap_logs, limit, cursor, start_date_str, end_date_str, employee_name, format)
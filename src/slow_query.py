@@ -0,0 +1,164 @@
+"""
+慢查询日志：记录耗时超过 SLOW_QUERY_THRESHOLD_MS 的SQL语句。
+
+- 每条慢查询输出到标准错误 (stdio 模式下标准输出是协议通道)，并保存到有界的环形缓冲区，
+  通过 get_slow_queries 工具读取
+- 记录语句、参数、耗时、发起查询的函数 (调用栈中最近的本项目函数，例如 services.get_duty_employee)
+  以及所属的调用 (metrics 中正在记录的MCP工具或路由)
+- 开启 SLOW_QUERY_EXPLAIN 时，为 duty_schedules / swap_logs 表上的慢 SELECT 记录执行计划
+  (MySQL 为 EXPLAIN，SQLite 为 EXPLAIN QUERY PLAN)
+
+代替 create_engine(echo=True)：只记录真正慢的语句，不必为了排查问题打开全量SQL日志。
+"""
+
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import event
+
+from . import metrics
+from .config import SLOW_QUERY_EXPLAIN, SLOW_QUERY_LOG_SIZE, SLOW_QUERY_THRESHOLD_MS
+
+# 只为这些表上的 SELECT 记录执行计划
+EXPLAIN_TABLES = ("duty_schedules", "swap_logs")
+# 记录和输出时参数的最大长度，批量写入的参数可能非常长
+MAX_PARAMETERS_LENGTH = 500
+# 查找发起查询的函数时跳过这些模块 (引擎事件、会话管理)
+_INFRASTRUCTURE_MODULES = {__name__, metrics.__name__, f"{__package__}.database"}
+
+
+def _caller() -> Optional[str]:
+    """调用栈中最近的本项目函数，格式为 模块名.函数名 (不含包名)。"""
+    frame = sys._getframe(2)
+    prefix = f"{__package__}."
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith(prefix) and module not in _INFRASTRUCTURE_MODULES:
+            code = frame.f_code
+            # co_qualname 从 Python 3.11 开始才有
+            return f"{module[len(prefix):]}.{getattr(code, 'co_qualname', code.co_name)}"
+        frame = frame.f_back
+    return None
+
+
+def _format_parameters(parameters, executemany: bool) -> str:
+    if executemany and parameters:
+        text = f"{len(parameters)} 组，第一组: {parameters[0]!r}"
+    else:
+        text = repr(parameters)
+    if len(text) > MAX_PARAMETERS_LENGTH:
+        text = text[:MAX_PARAMETERS_LENGTH] + "..."
+    return text
+
+
+def _explain(conn, statement: str, parameters) -> List[dict]:
+    """在同一个连接上获取语句的执行计划。"""
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    # 直接使用DB-API游标，不经过引擎事件，避免执行计划本身被统计或再次记录
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        columns = [column[0] for column in cursor.description or ()]
+        return [
+            {column: (value if isinstance(value, (int, float)) or value is None else str(value))
+             for column, value in zip(columns, row)}
+            for row in cursor.fetchall()
+        ]
+    finally:
+        cursor.close()
+
+
+class SlowQueryLog:
+    """慢查询的阈值、是否记录执行计划，以及最近慢查询的环形缓冲区。"""
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_THRESHOLD_MS, explain: bool = SLOW_QUERY_EXPLAIN,
+                 size: int = SLOW_QUERY_LOG_SIZE, echo: bool = True):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self.echo = echo
+        self._entries = deque(maxlen=max(size, 1))
+        self._lock = threading.Lock()
+        self.total = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def _wants_plan(self, statement: str, executemany: bool) -> bool:
+        if not self.explain or executemany or statement.lstrip()[:6].upper() != "SELECT":
+            return False
+        lowered = statement.lower()
+        return any(table in lowered for table in EXPLAIN_TABLES)
+
+    def record(self, conn, statement: str, parameters, executemany: bool, elapsed_ms: float) -> dict:
+        """记录一条慢查询，返回记录的内容。"""
+        call = metrics.current_call()
+        entry = {
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "duration_ms": round(elapsed_ms, 3),
+            "statement": statement,
+            "parameters": _format_parameters(parameters, executemany),
+            "caller": _caller(),
+            "call": call,
+            "plan": None,
+        }
+        if self._wants_plan(statement, executemany):
+            try:
+                entry["plan"] = _explain(conn, statement, parameters)
+            except Exception as e:
+                entry["plan_error"] = str(e)
+
+        with self._lock:
+            self._entries.append(entry)
+            self.total += 1
+        if self.echo:
+            print(f"慢查询 {elapsed_ms:.1f} ms [{entry['caller'] or call or '未知'}] "
+                  f"{' '.join(statement.split())} 参数: {entry['parameters']}", file=sys.stderr)
+        return entry
+
+    def entries(self, limit: Optional[int] = None) -> List[dict]:
+        """最近的慢查询，最新的在前。"""
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        return entries if limit is None else entries[:max(limit, 0)]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self, limit: Optional[int] = None) -> dict:
+        """供 get_slow_queries 工具返回。"""
+        return {
+            "threshold_ms": self.threshold_ms,
+            "explain": self.explain,
+            "total": self.total,
+            "buffer_size": self._entries.maxlen,
+            "queries": self.entries(limit),
+        }
+
+    # --- SQLAlchemy 引擎事件 ---
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slow_query_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info["slow_query_start"].pop()) * 1000
+        if self.enabled and elapsed_ms >= self.threshold_ms:
+            try:
+                self.record(conn, statement, parameters, executemany, elapsed_ms)
+            except Exception as e:
+                # 记录失败不能影响查询本身
+                print(f"记录慢查询失败: {e}", file=sys.stderr)
+
+    def instrument_engine(self, engine) -> None:
+        """为同步引擎 (或异步引擎的 sync_engine) 注册慢查询事件。"""
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+
+slow_queries = SlowQueryLog()
@@ -0,0 +1,84 @@
+"""
+"今天值班"快照的后台刷新任务。
+
+'today' 查询的结果只会在跨过午夜或数据写入(导入、换班)之后发生变化，
+因此由后台任务预先计算今天和明天的响应 (services.build_day_snapshot)，
+查询时直接从内存返回。任务在以下时机刷新快照：
+- 启动时
+- 每天排班时区 (SCHEDULE_TIMEZONE) 的午夜
+- 缓存收到写入通知时 (导入或换班之后)
+
+MCP服务器的 lifespan 和 FastAPI 的启动流程都通过 `day_snapshot_refresher()` 启动该任务。
+存储按 STORAGE_BACKEND 选择 (repository.storage_session_scope)，memory 时不会连接数据库。
+多个调用者共用同一个后台任务，最后一个退出时才会停止。
+"""
+
+import asyncio
+import sys
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from . import dates, services
+from .repository import storage_session_scope
+
+# 跨过午夜后稍等片刻再刷新，避免因时钟误差仍算作前一天
+MIDNIGHT_MARGIN_SECONDS = 1.0
+
+_task: Optional[asyncio.Task] = None
+_users = 0
+
+
+def refresh_day_snapshot(storage_factory=storage_session_scope):
+    """在新的存储上下文中重新计算快照，返回该存储对应的缓存。"""
+    with storage_factory() as db:
+        services.build_day_snapshot(db)
+        return services.as_repository(db).cache
+
+
+async def run_day_snapshot_refresher(storage_factory=storage_session_scope) -> None:
+    """后台循环：刷新快照，然后等待午夜或下一次写入。"""
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+
+    def on_change():
+        # 写入可能发生在其他线程 (例如 asyncio.to_thread 中的导入)
+        loop.call_soon_threadsafe(changed.set)
+
+    cache = None
+    try:
+        while True:
+            changed.clear()
+            try:
+                refreshed = await asyncio.to_thread(refresh_day_snapshot, storage_factory)
+                if cache is None:
+                    cache = refreshed
+                    cache.add_listener(on_change)
+            except Exception as e:
+                print(f"刷新今日值班快照失败: {e}", file=sys.stderr)
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=dates.seconds_until_midnight() + MIDNIGHT_MARGIN_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if cache is not None:
+            cache.remove_listener(on_change)
+
+
+@asynccontextmanager
+async def day_snapshot_refresher(storage_factory=storage_session_scope) -> AsyncIterator[None]:
+    """在上下文期间保持快照刷新任务运行。"""
+    global _task, _users
+    if _task is None or _task.done():
+        _task = asyncio.create_task(run_day_snapshot_refresher(storage_factory))
+    _users += 1
+    try:
+        yield
+    finally:
+        _users -= 1
+        if _users == 0 and _task is not None:
+            _task.cancel()
+            try:
+                await _task
+            except asyncio.CancelledError:
+                pass
+            _task = None
@@ -2,10 +2,11 @@
 """
 值班表管理MCP服务器启动脚本
 
-这个脚本用于启动MCP服务器，支持stdio传输。
+这个脚本用于启动MCP服务器，支持stdio和streamable-http两种传输方式。
 
 使用方法：
 python start_mcp_server.py
+python start_mcp_server.py --transport streamable-http --host 0.0.0.0 --port 8000 --workers 4 --with-api
 """
 
 import sys
@@ -0,0 +1,86 @@
+import unittest
+import asyncio
+import os
+from datetime import datetime
+from unittest import mock
+from zoneinfo import ZoneInfo
+
+# 将src目录添加到Python路径，以便导入我们的模块
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import text
+
+from src import database
+
+
+class TestSessionScope(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # 数据库在第一次取会话时才初始化，先完成初始化，避免建表时的连接计入统计
+        database.init_db()
+
+    def test_session_scope_records_pool_stats(self):
+        """测试会话管理器会记录连接取出和等待时间"""
+        before = database.get_pool_stats()
+        with database.session_scope() as db:
+            self.assertEqual(db.execute(text("SELECT 1")).scalar(), 1)
+        after = database.get_pool_stats()
+
+        self.assertEqual(after["checkouts"], before["checkouts"] + 1)
+        self.assertEqual(after["checkins"], before["checkins"] + 1)
+        self.assertIn("avg_wait_ms", after)
+        self.assertIn("pool_class", after)
+
+    def test_session_scope_rolls_back_on_error(self):
+        """测试会话管理器在异常时回滚并继续抛出异常"""
+        with self.assertRaises(ValueError):
+            with database.session_scope() as db:
+                db.execute(text("SELECT 1"))
+                raise ValueError("boom")
+        # 异常之后仍然可以正常获取新的会话
+        with database.session_scope() as db:
+            self.assertEqual(db.execute(text("SELECT 1")).scalar(), 1)
+
+    def test_init_db_is_idempotent(self):
+        """测试重复初始化不会重复执行建表"""
+        engine = database.get_engine()
+        database.init_db()
+        self.assertIs(database.get_engine(), engine)
+        self.assertIs(database.engine, engine)
+        self.assertTrue(database.get_pool_stats()["initialized"])
+
+    def test_schedule_utc_offset(self):
+        """测试换算旧换班日志时间使用的排班时区偏移格式"""
+        for zone, moment, expected in (
+            ("Asia/Shanghai", datetime(2024, 10, 1), "+08:00"),
+            ("Asia/Kolkata", datetime(2024, 10, 1), "+05:30"),
+            ("America/New_York", datetime(2024, 1, 1), "-05:00"),
+        ):
+            with mock.patch.object(database, "schedule_now", return_value=moment.replace(tzinfo=ZoneInfo(zone))):
+                self.assertEqual(database._schedule_utc_offset(), expected)
+
+    def test_fallback_async_sessions_do_not_overlap(self):
+        """测试SQLite后备库上的并发异步会话逐个执行，不会在共享连接上交错"""
+        if database.db_available:
+            self.skipTest("只有SQLite后备库需要串行化异步会话")
+        active = []
+        overlaps = []
+
+        async def use_session():
+            async with database.async_session_scope() as db:
+                overlaps.append(len(active))
+                active.append(db)
+                await db.execute(text("SELECT 1"))
+                await asyncio.sleep(0.01)
+                active.remove(db)
+
+        async def main():
+            await asyncio.gather(*(use_session() for _ in range(5)))
+
+        asyncio.run(main())
+        self.assertEqual(overlaps, [0] * 5)
+
+if __name__ == '__main__':
+    unittest.main()
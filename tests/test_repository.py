@@ -0,0 +1,106 @@
+import unittest
+import os
+import shutil
+import tempfile
+import pandas as pd
+from datetime import date
+from unittest import mock
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import repository as storage, schemas, services, snapshot
+from src.dates import schedule_today
+from src.repository import InMemoryScheduleRepository
+
+
+class TestInMemoryRepository(unittest.TestCase):
+    """内存存储不需要任何数据库，服务函数直接以它作为 db 参数。"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.snapshot_path = os.path.join(self.temp_dir, "snapshot", "schedule.json")
+        self.repository = InMemoryScheduleRepository(self.snapshot_path)
+
+        self.test_excel_path = os.path.join(self.temp_dir, "schedule.xlsx")
+        date_col = '日期            平常：9:00-17:30\n周末：9:00-17:30'
+        pd.DataFrame({
+            date_col: [date(2024, 10, 3), date(2024, 10, 1), date(2024, 10, 2)],
+            '全专业值班': ['钱一', '张三', '李四'],
+            'CS专业投诉值班': ['张三', '王五', '赵六'],
+            'CS专业故障值班': ['孙七', '周八', None],
+            'PS专业值班': ['吴九', '郑十', '张三'],
+        }).to_excel(self.test_excel_path, index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_import_and_query(self):
+        """测试导入到内存存储后的单日、范围和按员工查询"""
+        result = services.import_schedule(self.repository, file_path=self.test_excel_path)
+        self.assertEqual(result.status, "success", result.message)
+        self.assertEqual(result.inserted, 3)
+
+        duty = services.get_duty_employee(self.repository, "2024-10-02")
+        self.assertEqual(duty.schedule.full_professional, '李四')
+        self.assertIsNone(duty.schedule.cs_fault)
+        self.assertEqual(services.get_duty_employee(self.repository, "2024-10-09").status, "not_found")
+
+        # 乱序导入的日期按顺序返回
+        week = services.get_duty_range(self.repository, "2024-10-02", "2024-10-07")
+        self.assertEqual(week.dates, [date(2024, 10, 2), date(2024, 10, 3)])
+        self.assertEqual(week.full_professional, ['李四', '钱一'])
+
+        duties = services.get_employee_duties(self.repository, "张三", end_date_str="2024-10-02")
+        self.assertEqual([(d.duty_date, d.role) for d in duties.duties],
+                         [(date(2024, 10, 1), '全专业值班'), (date(2024, 10, 2), 'PS专业值班')])
+
+    def test_snapshot_persistence(self):
+        """测试导入后写入快照，新建的存储从快照恢复数据"""
+        services.import_schedule(self.repository, file_path=self.test_excel_path, streaming=True)
+        self.assertTrue(os.path.exists(self.snapshot_path))
+
+        restored = InMemoryScheduleRepository(self.snapshot_path)
+        self.assertEqual(restored.summary(), (False, date(2024, 10, 3)))
+        self.assertEqual(restored.get_row(date(2024, 10, 1)), self.repository.get_row(date(2024, 10, 1)))
+
+    def test_unsupported_operations(self):
+        """测试内存存储不支持的操作返回错误而不是抛出异常"""
+        services.import_schedule(self.repository, file_path=self.test_excel_path)
+        self.assertEqual(services.import_schedule(self.repository, file_path=self.test_excel_path, mode="merge").status, "error")
+        swap = services.swap_duty_schedule(self.repository, schemas.SwapDutyScheduleByEmployeeRequest(
+            swap_info_1=schemas.SwapByEmployeeInfo(duty_date="2024-10-01", employee_name="张三"),
+            swap_info_2=schemas.SwapByEmployeeInfo(duty_date="2024-10-02", employee_name="李四"),
+        ))
+        self.assertEqual(swap.status, "error")
+        self.assertEqual(services.get_swap_logs(self.repository).status, "error")
+        self.assertEqual(services.get_duty_employee(self.repository, "2024-10-01").status, "success")
+
+    def test_memory_backend_snapshot_without_database(self):
+        """测试 memory 后端的快照任务只使用内存仓库，不连接数据库"""
+        self.repository.replace_all([{
+            'duty_date': schedule_today(), 'employee_full_professional': '今日值班',
+            'employee_cs_complaint': None, 'employee_cs_fault': None, 'employee_ps_professional': None,
+        }])
+        no_database = mock.Mock(side_effect=AssertionError("memory 后端不应连接数据库"))
+        with mock.patch.object(storage, "STORAGE_BACKEND", "memory"), \
+                mock.patch.object(storage, "_memory_repository", self.repository), \
+                mock.patch.object(storage, "session_scope", no_database):
+            cache = snapshot.refresh_day_snapshot()
+        self.assertIs(cache, self.repository.cache)
+        self.assertEqual(cache.get_snapshot().get(schedule_today()).schedule.full_professional, '今日值班')
+        self.assertEqual(services.get_duty_employee(self.repository, "today").status, "success")
+
+        # 替换数据后快照作废
+        self.repository.replace_all([])
+        self.assertIsNone(cache.get_snapshot())
+
+    def test_invalid_storage_backend(self):
+        """测试不支持的 STORAGE_BACKEND 在使用存储时给出明确的错误"""
+        with mock.patch.object(storage, "STORAGE_BACKEND", "redis"):
+            with self.assertRaisesRegex(ValueError, "STORAGE_BACKEND='redis'"):
+                storage.storage_backend()
+
+
+if __name__ == '__main__':
+    unittest.main()
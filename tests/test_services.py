@@ -1,15 +1,19 @@
 import unittest
 import os
+import time
+import base64
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, update
 from sqlalchemy.orm import sessionmaker
-from datetime import date
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from datetime import date, datetime
 
 # 将src目录添加到Python路径，以便导入我们的模块
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src import models, services
+from src import dates, metrics, models, schemas, services
+from src.slow_query import SlowQueryLog
 from src.database import Base
 
 class TestServices(unittest.TestCase):
@@ -48,11 +52,13 @@ class TestServices(unittest.TestCase):
 
     def test_import_schedule_from_excel(self):
         """测试从Excel成功导入数据的功能"""
-        result = services.import_schedule_from_excel(self.db, self.test_excel_path)
-        self.assertIn("成功导入了 2 条新值班记录", result)
+        result = services.import_schedule(self.db, file_path=self.test_excel_path)
+        self.assertEqual(result.status, "success")
+        self.assertEqual(result.inserted, 2)
+        self.assertIn("成功导入了 2 条新值班记录", result.message)
 
         # 验证数据库中的数据
-        schedules = self.db.query(models.DutySchedule).all()
+        schedules = self.db.query(models.DutySchedule).order_by(models.DutySchedule.duty_date).all()
         self.assertEqual(len(schedules), 2)
 
         schedule1 = schedules[0]
@@ -77,23 +83,33 @@ class TestServices(unittest.TestCase):
 
         # 测试查询存在的日期
         result = services.get_duty_employee(self.db, "2024-11-11")
-        self.assertIn("2024年11月11日 的值班安排如下:", result)
-        self.assertIn("全专业值班: 测试员A", result)
-        self.assertIn("CS专业投诉值班: 测试员B", result)
-        self.assertIn("CS专业故障值班: 无安排", result) # 验证None被正确处理
-        self.assertIn("PS专业值班: 测试员C", result)
+        self.assertEqual(result.status, "success")
+        self.assertIn("2024年11月11日 的值班安排已找到", result.message)
+        self.assertEqual(result.schedule.full_professional, "测试员A")
+        self.assertEqual(result.schedule.cs_complaint, "测试员B")
+        self.assertIsNone(result.schedule.cs_fault) # 验证None被正确处理
+        self.assertEqual(result.schedule.ps_professional, "测试员C")
 
         # 测试查询不存在的日期
         result_not_found = services.get_duty_employee(self.db, "2025-01-01")
-        self.assertIn("未找到 2025年01月01日 的值班记录", result_not_found)
+        self.assertEqual(result_not_found.status, "not_found")
+        self.assertIn("未找到 2025年01月01日 的值班记录", result_not_found.message)
+
+    def swap_request(self, date1, employee1, date2, employee2):
+        """辅助函数，构造按员工姓名换班的请求"""
+        return schemas.SwapDutyScheduleByEmployeeRequest(
+            swap_info_1=schemas.SwapByEmployeeInfo(duty_date=date1, employee_name=employee1),
+            swap_info_2=schemas.SwapByEmployeeInfo(duty_date=date2, employee_name=employee2),
+        )
 
     def test_swap_duty_schedule(self):
         """测试精准换班功能"""
         # 同样，先导入初始数据
-        services.import_schedule_from_excel(self.db, self.test_excel_path)
+        services.import_schedule(self.db, file_path=self.test_excel_path)
         
         # 场景1: 同专业对调 (全专业值班: 张三 <-> 李四)
-        services.swap_duty_schedule(self.db, "2024-10-01", "全专业值班", "2024-10-02", "全专业值班")
+        result = services.swap_duty_schedule(self.db, self.swap_request("2024-10-01", "张三", "2024-10-02", "李四"))
+        self.assertEqual(result.status, "success", result.message)
         
         schedule1_after_swap1 = self.db.query(models.DutySchedule).filter_by(duty_date=date(2024, 10, 1)).one()
         schedule2_after_swap1 = self.db.query(models.DutySchedule).filter_by(duty_date=date(2024, 10, 2)).one()
@@ -102,7 +118,10 @@ class TestServices(unittest.TestCase):
         self.assertEqual(schedule2_after_swap1.employee_full_professional, '张三')
 
         # 场景2: 跨专业对调 (1号的CS投诉'王五' <-> 2号的PS专业'郑十')
-        services.swap_duty_schedule(self.db, "2024-10-01", "CS专业投诉值班", "2024-10-02", "PS专业值班")
+        result = services.swap_duty_schedule(self.db, self.swap_request("2024-10-01", "王五", "2024-10-02", "郑十"))
+        self.assertEqual(result.status, "success", result.message)
+        self.assertEqual(result.swap1.role, 'CS专业投诉值班')
+        self.assertEqual(result.swap2.role, 'PS专业值班')
 
         schedule1_after_swap2 = self.db.query(models.DutySchedule).filter_by(duty_date=date(2024, 10, 1)).one()
         schedule2_after_swap2 = self.db.query(models.DutySchedule).filter_by(duty_date=date(2024, 10, 2)).one()
@@ -110,11 +129,774 @@ class TestServices(unittest.TestCase):
         self.assertEqual(schedule1_after_swap2.employee_cs_complaint, '郑十')
         self.assertEqual(schedule2_after_swap2.employee_ps_professional, '王五')
 
-        # 场景3: 无效的角色名
-        result = services.swap_duty_schedule(self.db, "2024-10-01", "不存在的专业", "2024-10-02", "全专业值班")
-        self.assertIn("错误：无效的专业名称", result)
+        # 场景3: 该日期没有这位员工
+        result = services.swap_duty_schedule(self.db, self.swap_request("2024-10-01", "不存在的员工", "2024-10-02", "张三"))
+        self.assertEqual(result.status, "error")
+        self.assertIn("未找到员工 '不存在的员工'", result.message)
+
+    def count_statements(self):
+        """辅助函数，返回一个列表，记录之后在测试引擎上执行的所有SQL语句"""
+        statements = []
+        event.listen(self.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        return statements
+
+    def test_get_duty_employee_cache(self):
+        """测试重复查询命中缓存，不再产生SQL"""
+        services.import_schedule(self.db, file_path=self.test_excel_path)
+
+        first = services.get_duty_employee(self.db, "2024-10-01")
+        self.assertEqual(first.status, "success")
+
+        statements = self.count_statements()
+        second = services.get_duty_employee(self.db, "2024-10-01")
+        missing = services.get_duty_employee(self.db, "2025-01-01")
+        missing_again = services.get_duty_employee(self.db, "2025-01-01")
+        self.assertEqual(second, first)
+        self.assertEqual(missing.status, "not_found")
+        self.assertEqual(missing_again.status, "not_found")
+        # 只有第一次查询 2025-01-01 时需要访问数据库
+        self.assertEqual(len(statements), 1)
+
+    def test_cache_invalidated_by_import_and_swap(self):
+        """测试导入和换班提交后缓存被失效或原地更新"""
+        empty = services.get_duty_employee(self.db, "2024-10-01")
+        self.assertEqual(empty.status, "error")
+
+        services.import_schedule(self.db, file_path=self.test_excel_path)
+        result = services.get_duty_employee(self.db, "2024-10-01")
+        self.assertEqual(result.schedule.full_professional, '张三')
+
+        request = schemas.SwapDutyScheduleByEmployeeRequest(
+            swap_info_1=schemas.SwapByEmployeeInfo(duty_date="2024-10-01", employee_name="张三"),
+            swap_info_2=schemas.SwapByEmployeeInfo(duty_date="2024-10-02", employee_name="李四"),
+        )
+        services.swap_duty_schedule(self.db, request)
+
+        statements = self.count_statements()
+        result = services.get_duty_employee(self.db, "2024-10-01")
+        self.assertEqual(result.schedule.full_professional, '李四')
+        self.assertEqual(len(statements), 0)
+
+    def test_cache_ttl_picks_up_external_writes(self):
+        """测试设置 ttl 后，缓存过期即可读到绕过本进程缓存的写入 (例如其他工作进程的换班)"""
+        services.import_schedule(self.db, file_path=self.test_excel_path)
+        cache = services.get_cache(self.db)
+        cache.ttl = 0.05
+        self.assertEqual(services.get_duty_employee(self.db, "2024-10-01").schedule.full_professional, '张三')
+
+        other = self.Session()
+        other.execute(update(models.DutySchedule)
+                      .where(models.DutySchedule.duty_date == date(2024, 10, 1))
+                      .values(employee_full_professional='外部写入'))
+        other.commit()
+        other.close()
+        # 有效期内仍然返回缓存的数据
+        self.assertEqual(services.get_duty_employee(self.db, "2024-10-01").schedule.full_professional, '张三')
+
+        time.sleep(0.06)
+        self.assertEqual(services.get_duty_employee(self.db, "2024-10-01").schedule.full_professional, '外部写入')
+
+    def test_cache_rows_are_bounded(self):
+        """测试缓存的日期行数有上限，查询大量不存在的日期时按LRU淘汰"""
+        services.import_schedule(self.db, file_path=self.test_excel_path)
+        cache = services.get_cache(self.db)
+        cache.max_rows = 3
+        services.get_duty_employee(self.db, "2024-10-01")
+        for day in range(1, 10):
+            services.get_duty_employee(self.db, f"2030-01-{day:02d}")
+            services.get_duty_employee(self.db, "2024-10-01")
+        self.assertEqual(len(cache._rows), 3)
+        # 一直被访问的行不会被淘汰
+        self.assertIsNot(cache.get_row(date(2024, 10, 1)), services.MISSING)
+        self.assertIs(cache.get_row(date(2030, 1, 1)), services.MISSING)
+
+    def test_get_duty_range(self):
+        """测试按日期范围查询，只执行一次范围扫描"""
+        services.import_schedule(self.db, file_path=self.test_excel_path)
+        services.get_duty_employee(self.db, "2024-10-01")
+
+        statements = self.count_statements()
+        result = services.get_duty_range(self.db, "2024-09-30", "2024-10-31")
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(result.count, 2)
+        self.assertEqual(result.dates, [date(2024, 10, 1), date(2024, 10, 2)])
+        self.assertEqual(result.full_professional, ['张三', '李四'])
+        self.assertEqual(result.ps_professional, ['吴九', '郑十'])
+
+        # 范围查询会预热单日查询的缓存
+        services.get_duty_employee(self.db, "2024-10-02")
+        self.assertEqual(len(statements), 1)
+
+        self.assertEqual(services.get_duty_range(self.db, "2025-01-01", "2025-01-31").status, "not_found")
+        self.assertEqual(services.get_duty_range(self.db, "2024-10-02", "2024-10-01").status, "error")
+
+    def test_get_employee_duties(self):
+        """测试按员工查询值班，索引随导入和换班同步更新"""
+        services.import_schedule(self.db, file_path=self.test_excel_path)
+        result = services.get_employee_duties(self.db, " 张三 ")
+        self.assertEqual(result.count, 1)
+        self.assertEqual(result.duties[0].duty_date, date(2024, 10, 1))
+        self.assertEqual(result.duties[0].role, '全专业值班')
+
+        request = schemas.SwapDutyScheduleByEmployeeRequest(
+            swap_info_1=schemas.SwapByEmployeeInfo(duty_date="2024-10-01", employee_name="张三"),
+            swap_info_2=schemas.SwapByEmployeeInfo(duty_date="2024-10-02", employee_name="郑十"),
+        )
+        services.swap_duty_schedule(self.db, request)
+        duties = services.get_employee_duties(self.db, "张三").duties
+        self.assertEqual([(d.duty_date, d.role) for d in duties], [(date(2024, 10, 2), 'PS专业值班')])
+        self.assertEqual(services.get_employee_duties(self.db, "郑十").duties[0].role, '全专业值班')
+
+        # 日期范围过滤
+        self.assertEqual(services.get_employee_duties(self.db, "张三", "2024-10-03").status, "not_found")
+        self.assertEqual(services.get_employee_duties(self.db, "张三", None, "2024-10-02").count, 1)
+
+        # 旧数据升级：索引被清空后可以重建
+        self.db.query(models.DutyAssignment).delete()
+        self.db.commit()
+        services.ensure_assignment_index(self.db)
+        self.assertEqual(self.db.query(models.DutyAssignment).count(), 8)
+
+    def test_streaming_import(self):
+        """测试流式导入，数据跨越多个批次"""
+        result = services._stream_excel_into_db(self.db, self.test_excel_path, batch_size=1)
+        self.assertEqual(result.status, "success")
+        self.assertIn("成功导入了 2 条新值班记录", result.message)
+
+        schedule = self.db.query(models.DutySchedule).filter_by(duty_date=date(2024, 10, 2)).one()
+        self.assertEqual(schedule.employee_full_professional, '李四')
+        self.assertEqual(schedule.employee_ps_professional, '郑十')
+
+        # 通过公开接口以流式模式重新导入
+        result = services.import_schedule(self.db, file_path=self.test_excel_path, streaming=True, force=True)
+        self.assertIn("清除了 2 条旧排班记录", result.message)
+
+    def test_streaming_import_rejects_narrow_sheet(self):
+        """测试流式导入在列数不足时直接报错，且不删除旧数据"""
+        services.import_schedule(self.db, file_path=self.test_excel_path)
+        pd.DataFrame({'日期': [date(2024, 10, 1)], '全专业值班': ['张三']}).to_excel(self.test_excel_path, index=False)
+
+        result = services.import_schedule(self.db, file_path=self.test_excel_path, streaming=True)
+        self.assertEqual(result.status, "error")
+        self.assertIn("检测到 2 列", result.message)
+        self.assertEqual(self.db.query(models.DutySchedule).count(), 2)
+
+    def test_merge_import(self):
+        """测试增量合并导入只写入变化的日期，并保留换班日志"""
+        services.import_schedule(self.db, file_path=self.test_excel_path)
+        request = schemas.SwapDutyScheduleByEmployeeRequest(
+            swap_info_1=schemas.SwapByEmployeeInfo(duty_date="2024-10-01", employee_name="王五"),
+            swap_info_2=schemas.SwapByEmployeeInfo(duty_date="2024-10-01", employee_name="孙七"),
+        )
+        services.swap_duty_schedule(self.db, request)
+
+        # 新文件: 10-01 恢复原样(相对换班后的数据是更新)，10-02 删除，新增 10-03
+        pd.DataFrame({
+            '日期': [date(2024, 10, 1), date(2024, 10, 3)],
+            '全专业值班': ['张三', '钱一'],
+            'CS专业投诉值班': ['王五', '钱二'],
+            'CS专业故障值班': ['孙七', '钱三'],
+            'PS专业值班': ['吴九', '钱四'],
+        }).to_excel(self.test_excel_path, index=False)
+
+        for streaming in (False, True):
+            result = services.import_schedule(self.db, file_path=self.test_excel_path, mode="merge", streaming=streaming, force=True)
+            self.assertEqual(result.status, "success")
+            if not streaming:
+                self.assertEqual((result.inserted, result.updated, result.deleted, result.unchanged), (1, 1, 1, 0))
+            else:
+                # 再次合并同样的文件，没有任何变化
+                self.assertEqual((result.inserted, result.updated, result.deleted, result.unchanged), (0, 0, 0, 2))
+
+        dates = [s.duty_date for s in self.db.query(models.DutySchedule).order_by(models.DutySchedule.duty_date)]
+        self.assertEqual(dates, [date(2024, 10, 1), date(2024, 10, 3)])
+        self.assertEqual(services.get_employee_duties(self.db, "钱三").duties[0].duty_date, date(2024, 10, 3))
+        self.assertEqual(services.get_employee_duties(self.db, "李四").status, "not_found")
+        self.assertEqual(self.db.query(models.DutyAssignment).count(), 8)
+        self.assertEqual(services.get_duty_employee(self.db, "2024-10-01").schedule.cs_complaint, '王五')
+        self.assertEqual(self.db.query(models.SwapLog).count(), 1)
+
+    def test_reimport_identical_file_is_skipped(self):
+        """测试重复导入内容相同的文件时直接跳过"""
+        first = services.import_schedule(self.db, file_path=self.test_excel_path)
+        self.assertFalse(first.skipped)
+
+        # 路径、大小和修改时间都未变化
+        statements = self.count_statements()
+        again = services.import_schedule(self.db, file_path=self.test_excel_path)
+        self.assertTrue(again.skipped)
+        self.assertEqual(again.status, "success")
+        self.assertEqual(len(statements), 1)
+
+        # 通过上传内容导入同一个文件，按内容哈希识别
+        with open(self.test_excel_path, "rb") as f:
+            content_b64 = base64.b64encode(f.read()).decode()
+        self.assertTrue(services.import_schedule(self.db, file_content_b64=content_b64).skipped)
+        self.assertFalse(services.import_schedule(self.db, file_content_b64=content_b64, force=True).skipped)
+
+        # 导入模式不同时不算重复：merge 之后以 replace 导入同一文件仍会执行
+        self.assertFalse(services.import_schedule(self.db, file_path=self.test_excel_path, mode="merge").skipped)
+        self.assertTrue(services.import_schedule(self.db, file_path=self.test_excel_path, mode="merge").skipped)
+        replaced = services.import_schedule(self.db, file_path=self.test_excel_path, mode="replace")
+        self.assertFalse(replaced.skipped)
+        self.assertEqual(replaced.inserted, 2)
+
+    def test_swap_resets_import_fingerprint(self):
+        """测试换班后重新导入同一文件会正常执行，恢复原始排班"""
+        services.import_schedule(self.db, file_path=self.test_excel_path)
+        request = schemas.SwapDutyScheduleByEmployeeRequest(
+            swap_info_1=schemas.SwapByEmployeeInfo(duty_date="2024-10-01", employee_name="张三"),
+            swap_info_2=schemas.SwapByEmployeeInfo(duty_date="2024-10-02", employee_name="李四"),
+        )
+        services.swap_duty_schedule(self.db, request)
+
+        result = services.import_schedule(self.db, file_path=self.test_excel_path)
+        self.assertFalse(result.skipped)
+        self.assertEqual(services.get_duty_employee(self.db, "2024-10-01").schedule.full_professional, '张三')
+
+    def test_upsert_statement_compiles_for_each_dialect(self):
+        """测试合并导入的 upsert 语句在 MySQL 和 SQLite 方言下都能构造和编译，并递增版本号"""
+        from sqlalchemy.dialects import mysql, sqlite
+        for name, dialect, clause in (("mysql", mysql.dialect(), "ON DUPLICATE KEY UPDATE"),
+                                      ("sqlite", sqlite.dialect(), "ON CONFLICT")):
+            sql = str(services._upsert_statement(name).compile(dialect=dialect))
+            self.assertIn(clause, sql)
+            self.assertIn("version = (duty_schedules.version + ", sql)
+            self.assertIn("employee_ps_professional", sql.split(clause)[1])
+        self.assertIsNone(services._upsert_statement("postgresql"))
+
+    def test_swap_duty_schedule_batch(self):
+        """测试批量换班按顺序执行，且任一组失败时整批回滚"""
+        services.import_schedule(self.db, file_path=self.test_excel_path)
+
+        def swap(date1, name1, date2, name2):
+            return schemas.SwapDutyScheduleByEmployeeRequest(
+                swap_info_1=schemas.SwapByEmployeeInfo(duty_date=date1, employee_name=name1),
+                swap_info_2=schemas.SwapByEmployeeInfo(duty_date=date2, employee_name=name2),
+            )
+
+        # 第二组换班依赖第一组之后的结果
+        result = services.swap_duty_schedule_batch(self.db, schemas.SwapDutyScheduleBatchRequest(swaps=[
+            swap("2024-10-01", "张三", "2024-10-02", "李四"),
+            swap("2024-10-01", "李四", "2024-10-02", "赵六"),
+        ]))
+        self.assertEqual(result.status, "success", result.message)
+        self.assertEqual(result.swap_count, 2)
+        self.assertEqual(services.get_duty_employee(self.db, "2024-10-01").schedule.full_professional, '赵六')
+        self.assertEqual(services.get_duty_employee(self.db, "2024-10-02").schedule.cs_complaint, '李四')
+        self.assertEqual(self.db.query(models.SwapLog).count(), 2)
+        self.assertEqual([d.role for d in services.get_employee_duties(self.db, "李四").duties], ["CS专业投诉值班"])
+        # 日志时间取排班时区的时钟，带微秒
+        log_time = self.db.query(models.SwapLog).first().log_time
+        self.assertLess(abs((dates.schedule_now().replace(tzinfo=None) - log_time).total_seconds()), 60)
+
+        # 第二组找不到员工，第一组也不应生效
+        result = services.swap_duty_schedule_batch(self.db, schemas.SwapDutyScheduleBatchRequest(swaps=[
+            swap("2024-10-01", "王五", "2024-10-02", "周八"),
+            swap("2024-10-01", "不存在", "2024-10-02", "吴九"),
+        ]))
+        self.assertEqual(result.status, "error")
+        self.assertIn("第 2 组", result.message)
+        self.assertEqual(services.get_duty_employee(self.db, "2024-10-01").schedule.cs_complaint, '王五')
+        self.assertEqual(self.db.query(models.SwapLog).count(), 2)
+
+    def test_swap_duty_schedule_batch_write_failure(self):
+        """测试批量换班写入日志失败时返回结构化的错误响应并回滚"""
+        services.import_schedule(self.db, file_path=self.test_excel_path)
+        models.SwapLog.__table__.drop(self.engine)
+        result = services.swap_duty_schedule_batch(self.db, schemas.SwapDutyScheduleBatchRequest(swaps=[
+            schemas.SwapDutyScheduleByEmployeeRequest(
+                swap_info_1=schemas.SwapByEmployeeInfo(duty_date="2024-10-01", employee_name="张三"),
+                swap_info_2=schemas.SwapByEmployeeInfo(duty_date="2024-10-02", employee_name="李四"),
+            ),
+        ]))
+        self.assertEqual(result.status, "error")
+        self.assertIn("数据库提交时发生错误", result.message)
+        self.db.expire_all()
+        self.assertEqual(self.db.get(models.DutySchedule, 1).employee_full_professional, '张三')
+
+    def test_swap_retries_on_concurrent_update(self):
+        """测试单组和批量换班遇到并发修改(版本号冲突)时重新读取并重试"""
+        request = schemas.SwapDutyScheduleByEmployeeRequest(
+            swap_info_1=schemas.SwapByEmployeeInfo(duty_date="2024-10-01", employee_name="张三"),
+            swap_info_2=schemas.SwapByEmployeeInfo(duty_date="2024-10-02", employee_name="李四"),
+        )
+        for name, swap in (("single", lambda db: services.swap_duty_schedule(db, request)),
+                           ("batch", lambda db: services.swap_duty_schedule_batch(
+                               db, schemas.SwapDutyScheduleBatchRequest(swaps=[request])))):
+            with self.subTest(name):
+                self._assert_swap_retries(swap)
+
+    def _assert_swap_retries(self, swap):
+        import tempfile
+        from sqlalchemy import update
+
+        fd, db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        engine = create_engine(f"sqlite:///{db_path}")
+        try:
+            Base.metadata.create_all(engine)
+            db = sessionmaker(bind=engine)()
+            services.import_schedule(db, file_path=self.test_excel_path)
+            original_version = db.query(models.DutySchedule).filter_by(duty_date=date(2024, 10, 1)).one().version
+
+            # 在第一次提交前，另一个连接修改了同一行 (并递增版本号)
+            concurrent_updates = []
+
+            @event.listens_for(db, "before_flush")
+            def concurrent_writer(session, flush_context, instances):
+                if concurrent_updates:
+                    return
+                table = models.DutySchedule.__table__
+                with engine.begin() as conn:
+                    conn.execute(
+                        update(table).where(table.c.duty_date == date(2024, 10, 1))
+                        .values(employee_cs_fault='新人', version=table.c.version + 1)
+                    )
+                concurrent_updates.append(True)
+
+            result = swap(db)
+            self.assertEqual(result.status, "success", result.message)
+
+            # 两次修改都保留，版本号递增了两次
+            db.expire_all()
+            schedule = db.query(models.DutySchedule).filter_by(duty_date=date(2024, 10, 1)).one()
+            self.assertEqual(schedule.employee_full_professional, '李四')
+            self.assertEqual(schedule.employee_cs_fault, '新人')
+            self.assertEqual(schedule.version, original_version + 2)
+            self.assertEqual(db.query(models.SwapLog).count(), 1)
+            db.close()
+        finally:
+            engine.dispose()
+            os.remove(db_path)
+
+    def test_get_swap_logs_paginated(self):
+        """测试换班日志的键集分页和过滤"""
+        services.import_schedule(self.db, file_path=self.test_excel_path)
+        swap = schemas.SwapDutyScheduleByEmployeeRequest(
+            swap_info_1=schemas.SwapByEmployeeInfo(duty_date="2024-10-01", employee_name="王五"),
+            swap_info_2=schemas.SwapByEmployeeInfo(duty_date="2024-10-02", employee_name="赵六"),
+        )
+        # 批量换班在同一事务中写入多条日志，来回对调 5 次
+        swaps = [swap if i % 2 == 0 else schemas.SwapDutyScheduleByEmployeeRequest(
+            swap_info_1=schemas.SwapByEmployeeInfo(duty_date="2024-10-01", employee_name="赵六"),
+            swap_info_2=schemas.SwapByEmployeeInfo(duty_date="2024-10-02", employee_name="王五"),
+        ) for i in range(5)]
+        services.swap_duty_schedule_batch(self.db, schemas.SwapDutyScheduleBatchRequest(swaps=swaps))
+        services.swap_duty_schedule(self.db, schemas.SwapDutyScheduleByEmployeeRequest(
+            swap_info_1=schemas.SwapByEmployeeInfo(duty_date="2024-10-01", employee_name="张三"),
+            swap_info_2=schemas.SwapByEmployeeInfo(duty_date="2024-10-02", employee_name="李四"),
+        ))
+
+        pages, cursor = [], None
+        while True:
+            page = services.get_swap_logs(self.db, limit=2, cursor=cursor)
+            self.assertEqual(page.status, "success", page.message)
+            pages.append(page.logs)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual([len(p) for p in pages], [2, 2, 2])
+        # 逐页拼接的结果与一次查询全部日志完全一致
+        all_logs = [log for p in pages for log in p]
+        self.assertEqual(all_logs, services.get_swap_logs(self.db, limit=100).logs)
+        self.assertIn("'张三'", all_logs[0])  # 最新的日志在最前面
+
+        # 所有日志时间相同时，按 id 继续翻页，既不重复也不遗漏
+        self.db.query(models.SwapLog).update({models.SwapLog.log_time: datetime(2024, 10, 3, 9, 0, 0)})
+        self.db.commit()
+        cursor_ids, cursor = [], None
+        for _ in range(3):
+            page = services.get_swap_logs(self.db, limit=2, cursor=cursor)
+            cursor = page.next_cursor
+            if cursor:
+                cursor_ids.append(services._decode_log_cursor(cursor)[1])
+        self.assertIsNone(cursor)
+        self.assertEqual(len(cursor_ids), 2)
+        self.assertGreater(cursor_ids[0], cursor_ids[1])
+
+        self.assertEqual(services.get_swap_logs(self.db, employee_name="张三").log_count, 1)
+        self.assertEqual(services.get_swap_logs(self.db, start_date_str="2024-10-02").log_count, 6)
+        self.assertEqual(services.get_swap_logs(self.db, end_date_str="2024-09-30").log_count, 0)
+        self.assertEqual(services.get_swap_logs(self.db, cursor="not-a-cursor").status, "error")
+
+    def test_get_swap_logs_structured(self):
+        """测试结构化格式的换班日志"""
+        services.import_schedule(self.db, file_path=self.test_excel_path)
+        services.swap_duty_schedule(self.db, schemas.SwapDutyScheduleByEmployeeRequest(
+            swap_info_1=schemas.SwapByEmployeeInfo(duty_date="2024-10-01", employee_name="张三"),
+            swap_info_2=schemas.SwapByEmployeeInfo(duty_date="2024-10-02", employee_name="李四"),
+        ))
+        result = services.get_swap_logs(self.db, format="structured")
+        self.assertEqual(result.status, "success")
+        self.assertEqual(result.logs, [])
+        self.assertEqual(len(result.entries), 1)
+        entry = result.entries[0]
+        self.assertEqual((entry.date1, entry.role1, entry.original_employee1, entry.new_employee1),
+                         (date(2024, 10, 1), "全专业值班", "张三", "李四"))
+        self.assertEqual(services.get_swap_logs(self.db).entries, [])
+        self.assertEqual(services.get_swap_logs(self.db, format="csv").status, "error")
+
+    def add_today_schedule(self):
+        """辅助函数，插入一条今天的排班记录 (也是排班表的最后一天)"""
+        self.db.add(models.DutySchedule(duty_date=dates.schedule_today(), employee_full_professional='今日值班'))
+        self.db.commit()
+        services.get_cache(self.db).invalidate()
+
+    def test_today_served_from_snapshot(self):
+        """测试 'today' 查询直接使用预先计算的快照，写入后快照作废"""
+        services.import_schedule(self.db, file_path=self.test_excel_path)
+        self.add_today_schedule()
+        services.build_day_snapshot(self.db)
+
+        statements = self.count_statements()
+        result = services.get_duty_employee(self.db, "today")
+        self.assertEqual(statements, [])
+        self.assertEqual(result.schedule.full_professional, '今日值班')
+        self.assertIn("最后一天", result.warnings[0])
+
+        # 返回的是副本，修改它不会影响快照
+        result.warnings.clear()
+        self.assertEqual(len(services.get_duty_employee(self.db, "today").warnings), 1)
+
+        services.get_cache(self.db).update_rows({dates.schedule_today(): {'employee_full_professional': '换班后'}})
+        self.assertIsNone(services.get_cache(self.db).get_snapshot())
+        self.assertEqual(services.get_duty_employee(self.db, "today").schedule.full_professional, '换班后')
+
+    def test_snapshot_refresher_rebuilds_on_write(self):
+        """测试后台任务在启动和写入后刷新快照"""
+        import asyncio
+        from contextlib import contextmanager
+        from sqlalchemy.pool import StaticPool
+        from src import snapshot
+
+        # 刷新在工作线程中执行，需要一个跨线程共享的内存数据库
+        self.db.close()
+        self.engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.db = self.Session()
+        self.add_today_schedule()
+
+        @contextmanager
+        def session_factory():
+            db = self.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        cache = services.get_cache(self.db)
+
+        async def wait_for_snapshot():
+            for _ in range(200):
+                if cache.get_snapshot() is not None:
+                    return cache.get_snapshot()
+                await asyncio.sleep(0.01)
+            self.fail("快照未被刷新")
+
+        async def scenario():
+            async with snapshot.day_snapshot_refresher(session_factory):
+                first = await wait_for_snapshot()
+                self.assertEqual(first.get(dates.schedule_today()).schedule.full_professional, '今日值班')
+
+                self.db.query(models.DutySchedule).update({models.DutySchedule.employee_full_professional: '新值班'})
+                self.db.commit()
+                cache.invalidate()
+                second = await wait_for_snapshot()
+                self.assertEqual(second.get(dates.schedule_today()).schedule.full_professional, '新值班')
+
+        asyncio.run(scenario())
+        self.assertIsNone(snapshot._task)
+
+    def test_resolve_relative_dates(self):
+        """测试按排班时区解析相对日期关键字"""
+        from datetime import timedelta
+        today = dates.schedule_today()
+        self.assertEqual(dates.resolve_date("today"), today)
+        self.assertEqual(dates.resolve_date(" Tomorrow "), today + timedelta(days=1))
+        self.assertEqual(dates.resolve_date("昨天"), today - timedelta(days=1))
+        for name in ("monday", "周三", "星期日"):
+            resolved = dates.resolve_date(name)
+            self.assertLess((resolved - today).days, 7)
+            self.assertGreaterEqual(resolved, today)
+        self.assertEqual(dates.resolve_date("周三").weekday(), 2)
+        self.assertEqual(dates.resolve_date("2024-10-01"), date(2024, 10, 1))
+        with self.assertRaises(ValueError):
+            dates.resolve_date("next week")
+
+    def test_get_duty_employee_relative_date(self):
+        """测试查询接口接受相对日期"""
+        services.import_schedule(self.db, file_path=self.test_excel_path)
+        self.add_today_schedule()
+        self.assertEqual(services.get_duty_employee(self.db, "今天").schedule.full_professional, '今日值班')
+        self.assertEqual(services.get_duty_employee(self.db, "tomorrow").status, "not_found")
+        self.assertEqual(services.get_duty_employee(self.db, "someday").status, "error")
+
+    def test_sqlalchemy_repository(self):
+        """测试数据库存储实现的排班存储接口"""
+        repository = services.SqlAlchemyScheduleRepository(self.db)
+        self.assertEqual(repository.summary(), (True, None))
+        services.import_schedule(self.db, file_path=self.test_excel_path)
+        self.assertEqual(repository.summary(), (False, date(2024, 10, 2)))
+
+        rows = [dict(repository.get_row(date(2024, 10, 1)), duty_date=date(2024, 11, 1))]
+        self.assertEqual(repository.replace_all(rows), 2)
+        self.assertEqual([d for d, _ in repository.range_rows(date(2024, 10, 1), date(2024, 12, 1))], [date(2024, 11, 1)])
+        self.assertEqual(repository.employee_duties("张三"), [(date(2024, 11, 1), 'employee_full_professional')])
+
+    def test_import_from_binary_sources(self):
+        """测试直接传入二进制内容或文件对象导入"""
+        with open(self.test_excel_path, "rb") as f:
+            content = f.read()
+        for source in (content, memoryview(bytearray(content))):
+            result = services.import_schedule(self.db, file_obj=source, force=True)
+            self.assertEqual(result.status, "success", result.message)
+            self.assertEqual(result.inserted, 2)
+        with open(self.test_excel_path, "rb") as f:
+            result = services.import_schedule(self.db, file_obj=f, streaming=True, force=True)
+        self.assertEqual(result.inserted, 2)
+
+    def test_decode_base64_in_chunks(self):
+        """测试分块Base64解码，包括带换行的内容"""
+        content = os.urandom(10000)
+        encoded = base64.encodebytes(content).decode()  # 每76个字符换行
+        self.assertIn("\n", encoded)
+        self.assertEqual(services._decode_base64(encoded).getvalue(), content)
+        self.assertEqual(services._decode_base64(base64.b64encode(content).decode()).getvalue(), content)
+
+    def test_import_rejects_unknown_mode(self):
+        """测试不支持的导入模式"""
+        result = services.import_schedule(self.db, file_path=self.test_excel_path, mode="append")
+        self.assertEqual(result.status, "error")
+        self.assertIn("不支持的导入模式", result.message)
+
+    def test_coerce_date(self):
+        """测试流式导入时的日期转换"""
+        self.assertEqual(services._coerce_date("2024-10-01"), date(2024, 10, 1))
+        self.assertEqual(services._coerce_date("2024/10/01"), date(2024, 10, 1))
+        self.assertEqual(services._coerce_date("2024年10月01日"), date(2024, 10, 1))
+        self.assertEqual(services._coerce_date(45566), date(2024, 10, 1))
+        self.assertIsNone(services._coerce_date("  "))
+        with self.assertRaises(ValueError):
+            services._coerce_date("not a date")
+
+    def test_metrics_attribute_sql_to_call(self):
+        """测试调用指标：SQL语句数、影响行数和耗时归属到正在进行的调用"""
+        metrics.reset()
+        metrics.instrument_engine(self.engine)
+        with metrics.track_call("mcp", "import_schedule_path"):
+            services.import_schedule(self.db, file_path=self.test_excel_path)
+        # not_found 是正常的查询结果，只有 error 计为错误
+        for duty_date in ("2030-01-01", "not a date"):
+            with metrics.track_call("mcp", "get_duty_employee"):
+                metrics.record_status(services.get_duty_employee(self.db, duty_date).status)
+
+        calls = {item["name"]: item for item in metrics.snapshot()["calls"]}
+        self.assertEqual(calls["import_schedule_path"]["calls"], 1)
+        self.assertGreater(calls["import_schedule_path"]["sql_statements"], 0)
+        self.assertGreaterEqual(calls["import_schedule_path"]["rows"], 2)
+        self.assertEqual(calls["get_duty_employee"]["errors"], 1)
+
+        text = metrics.render_prometheus()
+        self.assertIn('duty_calls_total{kind="mcp",name="get_duty_employee"} 2', text)
+        self.assertIn('duty_call_duration_seconds_count{kind="mcp",name="import_schedule_path"} 1', text)
+        metrics.reset()
+
+    def test_metrics_http_status_matches_mcp(self):
+        """测试HTTP接口与MCP工具对响应状态的错误分类一致"""
+        from fastapi.testclient import TestClient
+        from src import main
+        from src.repository import InMemoryScheduleRepository, get_storage
+
+        repository = InMemoryScheduleRepository()
+        repository.replace_all([dict({field: None for field in services.FIELD_TO_ROLE_MAP}, duty_date=date(2024, 10, 1))])
+
+        async def memory_storage():
+            yield repository
+
+        metrics.reset()
+        main.app.dependency_overrides[get_storage] = memory_storage
+        try:
+            client = TestClient(main.app)
+            for duty_date in ("2024-10-01", "2030-01-01", "not a date"):
+                self.assertEqual(client.get("/get_duty_employee/", params={"duty_date": duty_date}).status_code, 200)
+        finally:
+            main.app.dependency_overrides.clear()
+
+        calls = {item["name"]: item for item in metrics.snapshot()["calls"]}
+        self.assertEqual(calls["GET /get_duty_employee/"]["calls"], 3)
+        self.assertEqual(calls["GET /get_duty_employee/"]["errors"], 1)
+        metrics.reset()
+
+    def test_slow_query_log(self):
+        """测试慢查询日志：记录发起查询的服务函数，为排班表上的 SELECT 记录执行计划，缓冲区有界"""
+        slow_log = SlowQueryLog(threshold_ms=1e-6, explain=True, size=5, echo=False)
+        slow_log.instrument_engine(self.engine)
+        services.import_schedule(self.db, file_path=self.test_excel_path)
+        services.get_cache(self.db).invalidate()
+        with metrics.track_call("mcp", "get_duty_employee"):
+            services.get_duty_employee(self.db, "2024-10-01")
+
+        entries = slow_log.entries()
+        self.assertEqual(len(entries), 5)
+        self.assertGreater(slow_log.total, 5)
+        latest = entries[0]
+        self.assertIn("duty_schedules", latest["statement"])
+        self.assertEqual(latest["call"], "get_duty_employee")
+        self.assertTrue(latest["caller"].startswith("services."))
+        self.assertTrue(latest["plan"])
+        self.assertFalse([entry for entry in entries if entry["statement"].startswith("INSERT") and entry["plan"]])
+
+        # 记录过程出错时查询照常执行
+        broken = SlowQueryLog(threshold_ms=1e-6, echo=False)
+        broken.record = None
+        broken.instrument_engine(self.engine)
+        services.get_cache(self.db).invalidate()
+        self.assertEqual(services.get_duty_employee(self.db, "2024-10-02").status, "success")
+
+        disabled = SlowQueryLog(threshold_ms=0, echo=False)
+        disabled.instrument_engine(self.engine)
+        services.get_duty_employee(self.db, "2024-10-02")
+        self.assertEqual(disabled.entries(), [])
+
+    def create_messy_excel(self, extra_rows=()):
+        """辅助函数，创建一个需要校验和规范化的Excel：首尾空白、全角字符、空角色、重复日期、空日期和日期缺口"""
+        date_col = '日期            平常：9:00-17:30\n周末：9:00-17:30'
+        rows = [
+            [date(2024, 10, 1), ' 张三 ', '王五', '孙七', '吴九'],
+            [date(2024, 10, 2), '李四', None, '周八', '郑十'],
+            [date(2024, 10, 2), '李四 ', '', '周八', '郑十'],
+            [None, '某人', None, None, None],
+            ['2024-10-05', 'ＡＢＣ', '王五', '孙七', '吴九'],
+            *extra_rows,
+        ]
+        df = pd.DataFrame(rows, columns=[date_col, '全专业值班', 'CS专业投诉值班', 'CS专业故障值班', 'PS专业值班'])
+        df.to_excel(self.test_excel_path, index=False)
+
+    def test_import_validation_normalizes_and_warns(self):
+        """测试导入校验：两种导入方式得到相同的规范化数据和行级警告"""
+        self.create_messy_excel()
+        results = {}
+        for streaming in (False, True):
+            result = services.import_schedule(self.db, file_path=self.test_excel_path, streaming=streaming, force=True)
+            self.assertEqual(result.status, "success", result.message)
+            self.assertEqual(result.inserted, 3)
+            results[streaming] = result.warnings
+            rows = {s.duty_date: s for s in self.db.query(models.DutySchedule)}
+            self.assertEqual(rows[date(2024, 10, 1)].employee_full_professional, '张三')
+            self.assertIsNone(rows[date(2024, 10, 2)].employee_cs_complaint)
+            self.assertEqual(rows[date(2024, 10, 5)].employee_full_professional, 'ABC')
+            # 查询时的姓名按同样的规则规范化
+            duties = services.get_employee_duties(self.db, " ＡＢＣ ")
+            self.assertEqual([d.duty_date for d in duties.duties], [date(2024, 10, 5)])
+            self.assertEqual(duties.employee_name, 'ABC')
+
+        expected = [
+            "第5行：日期为空，已跳过该行。",
+            "2024-10-02 重复出现 (第3行、第4行)，内容相同，只导入第一行。",
+            "第3行 (2024-10-02)：CS专业投诉值班为空。",
+            "日期不连续：2024-10-02 与 2024-10-05 之间缺少 2 天的排班。",
+        ]
+        # 向量化校验按检查项分组，流式校验按行的顺序，警告的顺序可能不同
+        self.assertCountEqual(results[False], expected)
+        self.assertCountEqual(results[True], expected)
+
+    def test_import_excel_serial_dates(self):
+        """测试以Excel序列号保存的日期：两种导入方式得到相同的日期"""
+        date_col = '日期            平常：9:00-17:30\n周末：9:00-17:30'
+        df = pd.DataFrame([[45292, '张三', '王五', '孙七', '吴九'], [45293, '李四', '赵六', '周八', '郑十']],
+                          columns=[date_col, '全专业值班', 'CS专业投诉值班', 'CS专业故障值班', 'PS专业值班'])
+        df.to_excel(self.test_excel_path, index=False)
+        for streaming in (False, True):
+            result = services.import_schedule(self.db, file_path=self.test_excel_path, streaming=streaming, force=True)
+            self.assertEqual(result.status, "success", result.message)
+            dates = [s.duty_date for s in self.db.query(models.DutySchedule).order_by(models.DutySchedule.duty_date)]
+            self.assertEqual(dates, [date(2024, 1, 1), date(2024, 1, 2)])
+
+    def test_import_parsers_agree_on_date_formats(self):
+        """测试同一个Excel经过两种解析方式得到完全相同的行数据和警告，包括非ISO格式的日期文本"""
+        self.create_messy_excel([
+            ['2024/10/06', '张三', '王五', '孙七', '吴九'],
+            ['2024.10.07', '李四', '赵六', '周八', '郑十'],
+            ['2024年10月08日', '张三', '王五', '孙七', '吴九'],
+            [' 2024-10-09 ', '李四', '赵六', '周八', '郑十'],
+            ['2024-10-10 08:30', '张三', '王五', '孙七', '吴九'],
+            [45576, '李四', '赵六', '周八', '郑十'],
+            ['2024/10/06', '张三', '王五', '孙七', '吴九'],
+        ])
+        rows, issues = services._parse_excel(self.test_excel_path)
+        validator = services._RowValidator()
+        streamed = [row for batch in services._iter_excel_batches(self.test_excel_path, 3, validator) for row in batch]
+
+        def by_date(items):
+            return sorted(items, key=lambda row: row['duty_date'])
+
+        self.assertEqual(by_date(rows), by_date(streamed))
+        self.assertEqual([row['duty_date'] for row in by_date(rows)][-6:],
+                         [date(2024, 10, day) for day in range(6, 12)])
+        self.assertCountEqual(issues.as_list(), validator.warnings.as_list())
+        self.assertTrue(any("2024-10-06 重复出现" in message for message in issues.as_list()))
+
+    def test_import_validation_fails_before_changing_data(self):
+        """测试冲突的重复日期和无法识别的日期在改动现有数据之前报错"""
+        services.import_schedule(self.db, file_path=self.test_excel_path)
+        for extra, expected in (
+            ([date(2024, 10, 1), '其他人', '王五', '孙七', '吴九'], "2024-10-01 (第2行、第7行)"),
+            (['not a date', '张三', '王五', '孙七', '吴九'], "第7行 ('not a date')"),
+            # 月/日顺序有歧义的格式两种导入方式都不接受
+            (['01/02/2024', '张三', '王五', '孙七', '吴九'], "第7行 ('01/02/2024')"),
+        ):
+            self.create_messy_excel([extra])
+            for streaming in (False, True):
+                result = services.import_schedule(self.db, file_path=self.test_excel_path, streaming=streaming, force=True)
+                self.assertEqual(result.status, "error")
+                self.assertIn(expected, result.message)
+                self.assertEqual(self.db.query(models.DutySchedule).count(), 2)
+
+class TestAsyncServices(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        """使用aiosqlite内存数据库测试异步服务层"""
+        self.engine = create_async_engine('sqlite+aiosqlite:///:memory:')
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.db = AsyncSession(self.engine, expire_on_commit=False)
+
+        self.test_excel_path = "test_schedule_async.xlsx"
+        TestServices.create_test_excel(self)
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        await self.engine.dispose()
+        if os.path.exists(self.test_excel_path):
+            os.remove(self.test_excel_path)
+
+    async def test_import_and_query_async(self):
+        """测试异步导入、查询、换班和日志"""
+        result = await services.import_schedule_async(self.db, file_path=self.test_excel_path)
+        self.assertEqual(result.status, "success")
+
+        duty = await services.get_duty_employee_async(self.db, "2024-10-02")
+        self.assertEqual(duty.schedule.full_professional, '李四')
+
+        request = schemas.SwapDutyScheduleByEmployeeRequest(
+            swap_info_1=schemas.SwapByEmployeeInfo(duty_date="2024-10-01", employee_name="王五"),
+            swap_info_2=schemas.SwapByEmployeeInfo(duty_date="2024-10-02", employee_name="郑十"),
+        )
+        swap = await services.swap_duty_schedule_async(self.db, request)
+        self.assertEqual(swap.status, "success")
+
+        logs = await services.get_swap_logs_async(self.db)
+        self.assertEqual(logs.log_count, 1)
 
-    # --- 测试用例将在这里添加 ---
+    async def test_streaming_import_async(self):
+        """测试异步流式导入"""
+        result = await services.import_schedule_async(self.db, file_path=self.test_excel_path, streaming=True)
+        self.assertEqual(result.status, "success")
+        duty = await services.get_duty_employee_async(self.db, "2024-10-01")
+        self.assertEqual(duty.schedule.cs_fault, '孙七')
 
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file